@@ -2,6 +2,7 @@ import celery
 from fastapi import FastAPI, Response
 from app.core.logging import setup_logging
 from app.core.config import settings
+from app.core.http import aclose_async_clients
 from app.api.routers import health, sync, shopify_webhooks, shopify_oauth, debug_webhooks
 from app.api.routers import debug_bc
 from app.metrics import prom
@@ -28,6 +29,11 @@ app.include_router(debug_inventory.router)
 app.include_router(debug_celery.router)
 
 
+@app.on_event("shutdown")
+async def close_http_clients():
+    await aclose_async_clients()
+
+
 
 
 # Metrics (optional)
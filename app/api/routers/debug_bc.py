@@ -1,14 +1,20 @@
-from fastapi import APIRouter
-from app.bc365.client import BC365Client
+from fastapi import APIRouter, Query
+from app.bc365.async_client import AsyncBC365Client
 
 router = APIRouter(prefix="/debug/bc")
 
 @router.get("/companies")
-def companies():
-    bc = BC365Client()
-    return bc.list_companies()
+async def companies():
+    bc = AsyncBC365Client()
+    return await bc.list_companies()
 
 @router.get("/items")
-def items():
-    bc = BC365Client()
-    return {"count": len(bc.fetch_products())}
+async def items():
+    bc = AsyncBC365Client()
+    return {"count": sum([1 async for _ in bc.iter_items(select=["number"])])}
+
+@router.post("/items/cache/invalidate")
+async def invalidate_item_cache(number: list[str] = Query(..., description="BC item number(s)")):
+    bc = AsyncBC365Client()
+    (await bc.item_cache()).invalidate(number)
+    return {"invalidated": number}
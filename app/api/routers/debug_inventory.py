@@ -1,40 +1,41 @@
 # app/api/routers/debug_inventory.py
 from fastapi import APIRouter, HTTPException, Query
 
-from app.shopify.client import ShopifyClient
+from app.shopify.async_client import AsyncShopifyClient
+from app.shopify.sku_index import SkuIndex
 from app.metrics.prom import inventory_update_seconds, shopify_inventory_updates_total
-from app.tasks.inventory import set_inventory_for_sku  # Celery task
+from app.tasks.inventory import set_inventory_for_sku, refresh_sku_index  # Celery tasks
 
 router = APIRouter(prefix="/debug/inventory", tags=["debug: inventory"])
 
 
 @router.get("/variant")
-def variant_lookup(sku: str = Query(..., description="Variant SKU")):
-    s = ShopifyClient()
-    v = s.find_variant_by_sku(sku)
+async def variant_lookup(sku: str = Query(..., description="Variant SKU")):
+    s = AsyncShopifyClient()
+    v = await SkuIndex(s.shop).resolve_async(s, sku)
     if not v:
         raise HTTPException(404, detail=f"Variant with sku '{sku}' not found")
     return {"sku": sku, "variant": v}
 
 
 @router.get("/locations")
-def list_locations():
-    s = ShopifyClient()
-    return {"locations": s.list_locations()}
+async def list_locations():
+    s = AsyncShopifyClient()
+    return {"locations": await s.list_locations()}
 
 
 @router.api_route("/set", methods=["GET", "POST"])
-def set_inventory(
+async def set_inventory(
     sku: str = Query(..., description="Variant SKU"),
     available: int = Query(..., ge=0, description="New available qty"),
     location_id: int | None = Query(None, description="Override location id"),
 ):
-    s = ShopifyClient()
-    v = s.find_variant_by_sku(sku)
+    s = AsyncShopifyClient()
+    v = await SkuIndex(s.shop).resolve_async(s, sku)
     if not v:
         raise HTTPException(404, detail=f"Variant with sku '{sku}' not found")
 
-    loc_id = location_id or s.resolve_location_id()
+    loc_id = location_id or await s.resolve_location_id()
     if not loc_id:
         raise HTTPException(400, detail="No location found. Set SHOPIFY_LOCATION_ID or create a location.")
 
@@ -42,7 +43,7 @@ def set_inventory(
 
     # Metrics timing wrapper
     with inventory_update_seconds.time():
-        resp = s.set_inventory_level(inv_item_id, int(loc_id), int(available))
+        resp = await s.set_inventory_level(inv_item_id, int(loc_id), int(available))
     shopify_inventory_updates_total.inc()
 
     return {
@@ -55,20 +56,20 @@ def set_inventory(
 
 
 @router.get("/level")
-def get_level(
+async def get_level(
     sku: str = Query(..., description="Variant SKU"),
     location_id: int | None = Query(None, description="Override location id"),
 ):
-    s = ShopifyClient()
-    v = s.find_variant_by_sku(sku)
+    s = AsyncShopifyClient()
+    v = await SkuIndex(s.shop).resolve_async(s, sku)
     if not v:
         raise HTTPException(404, detail=f"Variant with sku '{sku}' not found")
 
-    loc_id = location_id or s.resolve_location_id()
+    loc_id = location_id or await s.resolve_location_id()
     if not loc_id:
         raise HTTPException(400, detail="No location found. Set SHOPIFY_LOCATION_ID or create a location.")
 
-    data = s.request(
+    data = await s.request(
         "GET",
         "/inventory_levels.json",
         params={"inventory_item_ids": v["inventory_item_id"], "location_ids": loc_id},
@@ -86,3 +87,9 @@ def queue_inventory_update(
     # Fire-and-forget task; worker logs the result
     set_inventory_for_sku.delay(sku=sku, available=available, location_id=location_id)
     return {"queued": True, "sku": sku, "available": int(available), "location_id": location_id}
+
+
+@router.post("/index/refresh")
+def queue_sku_index_refresh():
+    r = refresh_sku_index.delay()
+    return {"queued": True, "task_id": r.id}
@@ -1,5 +1,7 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Query
 from uuid import uuid4
+from sqlalchemy import select
+from app.core.db import SessionLocal, OrderLedger
 from app.tasks.orders import push_order_to_bc365
 
 router = APIRouter(prefix="/debug")
@@ -13,3 +15,24 @@ def enqueue_test_order(sku: str = "1896-S", qty: int = 1, price: float = 98.00,
     }
     push_order_to_bc365.delay(payload)
     return {"queued": True, "id": ext_no, "sku": sku, "qty": qty}
+
+@router.get("/orders/ledger")
+def order_ledger(status: str | None = None, limit: int = Query(50, le=500)):
+    """Most recent order pushes (Shopify order -> BC sales order)."""
+    q = select(OrderLedger).order_by(OrderLedger.created_at.desc()).limit(limit)
+    if status:
+        q = q.where(OrderLedger.status == status)
+    with SessionLocal() as s:
+        rows = s.scalars(q).all()
+    return [
+        {
+            "ext_no": r.ext_no,
+            "shopify_order_id": r.shopify_order_id,
+            "bc_id": r.bc_id,
+            "bc_number": r.bc_number,
+            "status": r.status,
+            "created_at": r.created_at,
+            "verified_at": r.verified_at,
+        }
+        for r in rows
+    ]
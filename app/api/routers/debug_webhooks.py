@@ -1,19 +1,20 @@
 # app/api/routers/debug_webhooks.py
+import asyncio
 from fastapi import APIRouter, HTTPException, Query
 from app.core.db import get_shop_token
 from app.core.config import settings
-from app.shopify.client import ShopifyClient
+from app.shopify.async_client import AsyncShopifyClient
 from app.shopify.webhooks import register_default_webhooks
 
 router = APIRouter(prefix="/debug")
 
 @router.get("/webhooks")
-def list_webhooks(shop: str = Query(..., description="shop domain, e.g. teststorebase-200.myshopify.com")):
-    token = get_shop_token(shop)
+async def list_webhooks(shop: str = Query(..., description="shop domain, e.g. teststorebase-200.myshopify.com")):
+    token = await asyncio.to_thread(get_shop_token, shop)
     if not token:
         raise HTTPException(404, f"No access token saved for {shop}. Install the app first.")
-    client = ShopifyClient(access_token=token, shop_domain=shop)
-    data = client.request("GET", "/webhooks.json")
+    client = AsyncShopifyClient(access_token=token, shop_domain=shop)
+    data = await client.request("GET", "/webhooks.json")
     return {"shop": shop, "count": len(data.get("webhooks", [])), "webhooks": data.get("webhooks", [])}
 
 @router.post("/webhooks/ensure")
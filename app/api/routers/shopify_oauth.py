@@ -3,6 +3,7 @@ from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import RedirectResponse, HTMLResponse
 from app.core.config import settings
 from app.core.db import save_shop_token
+from app.shopify.registry import get_registry
 from app.shopify.webhooks import register_default_webhooks
 
 router = APIRouter(prefix="/oauth")
@@ -56,6 +57,7 @@ def callback(request: Request):
         raise HTTPException(500, "No access_token in response")
 
     save_shop_token(shop, access_token)
+    get_registry().invalidate(shop)  # every process drops its cached client/location for this shop
     register_default_webhooks(
         shop_domain=shop,
         access_token=access_token,
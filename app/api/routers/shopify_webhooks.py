@@ -1,20 +1,70 @@
+import asyncio
+import time
+from typing import Any, Dict, Optional
+
+import orjson
+import structlog
 from fastapi import APIRouter, Request, Header, HTTPException
+from app.core.config import settings
 from app.shopify.client import ShopifyClient
-from app.tasks.orders import push_order_to_bc365
-from app.metrics.prom import WEBHOOKS_RECEIVED
+from app.shopify.webhook_buffer import WebhookBuffer
+from app.tasks.orders import compact_order, push_order_to_bc365
+from app.metrics.prom import WEBHOOKS_RECEIVED, WEBHOOKS_DUPLICATE, WEBHOOK_HANDLER_SECONDS
+from app.utils import idempotency
+
+log = structlog.get_logger(__name__)
 
 router = APIRouter(prefix="/webhooks")
 
+
+def _dispatch(event: str, shop: str, webhook_id: Optional[str], payload: Dict[str, Any]) -> bool:
+    """Blocking part of the handler (Redis + broker), run off the event loop. False for duplicates."""
+    key = f"webhook:{webhook_id}" if webhook_id else None  # Shopify reuses the id on every retry
+    if key and not idempotency.claim_once(key, note=event):   # Redis only; made durable by a task
+        return False
+    try:
+        if event == "orders/create":
+            push_order_to_bc365.delay(compact_order(payload))
+        elif event == "products/update":
+            WebhookBuffer().add(event, shop, str(payload.get("id")), {
+                "id": payload.get("id"),
+                "variants": [
+                    {k: v.get(k) for k in ("id", "sku", "inventory_item_id")}
+                    for v in payload.get("variants") or []
+                ],
+            })
+        elif event == "inventory_levels/update":
+            buf_key = f"{payload.get('inventory_item_id')}:{payload.get('location_id')}"
+            WebhookBuffer().add(event, shop, buf_key, {
+                k: payload.get(k) for k in ("inventory_item_id", "location_id", "available")
+            })
+    except Exception:
+        # Let Shopify's retry through: we answer 500 and it redelivers with the same id
+        if key:
+            idempotency.release_claim(key, note=event)
+        raise
+    return True
+
+
 @router.post("/shopify")
 async def shopify_webhook(request: Request, x_shopify_hmac_sha256: str = Header(None)):
+    started = time.perf_counter()
     body = await request.body()
     if not ShopifyClient.verify_webhook(x_shopify_hmac_sha256 or "", body):
         raise HTTPException(status_code=401, detail="Invalid HMAC")
 
     event = request.headers.get("X-Shopify-Topic", "unknown")
-    WEBHOOKS_RECEIVED.labels(topic=event).inc()   # <-- here
+    shop = request.headers.get("X-Shopify-Shop-Domain") or settings.SHOPIFY_SHOP
+    WEBHOOKS_RECEIVED.labels(topic=event, shop=shop or "unknown").inc()   # <-- here
+
+    try:
+        payload = orjson.loads(body)  # the body is parsed exactly once
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
 
-    payload = await request.json()
-    if event == "orders/create":
-        push_order_to_bc365.delay(payload)
-    return {"ok": True}
+    webhook_id = request.headers.get("X-Shopify-Webhook-Id")
+    fresh = await asyncio.to_thread(_dispatch, event, shop, webhook_id, payload)
+    if not fresh:
+        WEBHOOKS_DUPLICATE.labels(topic=event).inc()
+    WEBHOOK_HANDLER_SECONDS.labels(topic=event).observe(time.perf_counter() - started)
+    return {"ok": True} if fresh else {"ok": True, "duplicate": True}
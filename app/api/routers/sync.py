@@ -1,22 +1,29 @@
+from typing import Literal, Optional
 from fastapi import APIRouter, Depends
 from app.api.dependencies import require_admin_token
 from app.tasks.products import bulk_upsert_products
-from app.tasks.inventory import sync_inventory_levels
+from app.tasks.inventory import sync_inventory_levels, sync_inventory_sharded
 from app.tasks.orders import push_order_to_bc365
+from app.tasks.reconciliation import run_reconciliation
 
 router = APIRouter(prefix="/sync", dependencies=[Depends(require_admin_token)])
 
 @router.post("/products/bulk")
-def trigger_products_bulk():
-    r = bulk_upsert_products.delay()
-    return {"task_id": r.id}
+def trigger_products_bulk(mode: Literal["rest", "bulk"] = "rest", shop: Optional[str] = None):
+    r = bulk_upsert_products.delay(mode=mode, shop_domain=shop)
+    return {"task_id": r.id, "mode": mode}
 
 @router.post("/inventory/locations")
-def trigger_inventory_sync():
-    r = sync_inventory_levels.delay([])  # supply real updates later
+def trigger_inventory_sync(shop: Optional[str] = None):
+    r = sync_inventory_sharded.delay(shop_domain=shop)
     return {"task_id": r.id}
 
 @router.post("/orders/push")
 def push_order_stub():
     r = push_order_to_bc365.delay({})
     return {"task_id": r.id}
+
+@router.post("/reconcile")
+def trigger_reconciliation(mode: Literal["full", "bucketed"] = "bucketed", shop: Optional[str] = None):
+    r = run_reconciliation.delay(mode=mode, shop_domain=shop)
+    return {"task_id": r.id, "mode": mode}
@@ -0,0 +1,146 @@
+# app/bc365/async_client.py
+from __future__ import annotations
+from typing import List, Dict, Any, Optional, AsyncIterator
+import asyncio
+from app.bc365.client import BC365Client, _get_token, _match_numbers, _odata_str, api_base
+from app.bc365.item_cache import ItemCache, get_item_cache
+from app.core.config import settings
+from app.core.http import get_async_client
+from app.utils.chunk import chunked
+from app.utils.retry import async_retry_policy, RetryableHTTPError
+
+class AsyncBC365Client:
+    """httpx-based twin of BC365Client; same methods as coroutines / async generators."""
+
+    ITEM_FILTER_CHUNK = BC365Client.ITEM_FILTER_CHUNK
+
+    def __init__(self):
+        self.base = api_base()
+        self._company_id_cache: Optional[str] = settings.BC365_COMPANY_ID or None
+
+    async def _headers(self) -> Dict[str, str]:
+        token = await asyncio.to_thread(_get_token)  # shares the sync token cache
+        return {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+
+    @async_retry_policy
+    async def _request(self, method: str, url: str, headers: Optional[Dict[str, str]] = None, **kwargs) -> Dict[str, Any]:
+        hdrs = await self._headers()
+        hdrs.update(headers or {})
+        http, sem = get_async_client("bc365")
+        async with sem:
+            r = await http.request(method, url, headers=hdrs, **kwargs)
+        if r.status_code == 429 or r.status_code >= 500:
+            raise RetryableHTTPError(f"{r.status_code}: {r.text}")
+        r.raise_for_status()
+        return r.json()
+
+    # --- Company helpers ---
+    async def list_companies(self) -> List[Dict[str, Any]]:
+        j = await self._request("GET", f"{self.base}/companies")
+        return j.get("value", [])
+
+    async def resolve_company_id(self) -> str:
+        if self._company_id_cache:
+            return self._company_id_cache
+        name = (settings.BC365_COMPANY_NAME or "").strip()
+        companies = await self.list_companies()
+        if not companies:
+            raise RuntimeError("No companies returned from BC365 API")
+        if name:
+            for c in companies:
+                if c.get("name") == name:
+                    self._company_id_cache = c["id"]
+                    return self._company_id_cache
+            raise RuntimeError(f"Company '{name}' not found; available: {[c.get('name') for c in companies]}")
+        self._company_id_cache = companies[0]["id"]
+        return self._company_id_cache
+
+    # --- Paging helper ---
+    async def _iter_collection(
+        self,
+        url: str,
+        params: Optional[Dict[str, Any]] = None,
+        page_size: Optional[int] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """See BC365Client._iter_collection."""
+        size = int(page_size or settings.BC365_PAGE_SIZE)
+        next_url: Optional[str] = url
+        while next_url:
+            j = await self._request("GET", next_url, headers={"Prefer": f"odata.maxpagesize={size}"}, params=params)
+            for it in j.get("value", []):
+                yield it
+            next_url = j.get("@odata.nextLink")
+            params = None
+
+    # --- Items / products (API v2.0) ---
+    async def iter_items(
+        self,
+        select: Optional[List[str]] = None,
+        filter: Optional[str] = None,
+        top: Optional[int] = None,
+        page_size: Optional[int] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        cid = await self.resolve_company_id()
+        params: Dict[str, Any] = {}
+        if select:
+            params["$select"] = ",".join(select)
+        if filter:
+            params["$filter"] = filter
+        if top:
+            params["$top"] = int(top)
+        async for it in self._iter_collection(f"{self.base}/companies({cid})/items", params or None, page_size):
+            yield it
+
+    async def fetch_products(self) -> List[Dict[str, Any]]:
+        return [it async for it in self.iter_items()]
+
+    async def find_item_by_number(self, number: str) -> dict | None:
+        return (await self.find_items_by_numbers([number])).get(str(number))
+
+    async def find_items_by_numbers(
+        self,
+        numbers: List[str],
+        select: Optional[List[str]] = None,
+        use_cache: bool = True,
+    ) -> Dict[str, Dict[str, Any]]:
+        """See BC365Client.find_items_by_numbers; the filter chunks are fetched concurrently."""
+        wanted = list(dict.fromkeys(str(n) for n in numbers if n))
+        cache = await self.item_cache() if (use_cache and not select and settings.BC365_ITEM_CACHE_ENABLE) else None
+        found: Dict[str, Dict[str, Any]] = await asyncio.to_thread(cache.get_many, wanted) if cache else {}
+
+        async def fetch(chunk: List[str]) -> List[Dict[str, Any]]:
+            filt = " or ".join(f"number eq '{_odata_str(n)}'" for n in chunk)
+            return [it async for it in self.iter_items(select=select, filter=filt)]
+
+        missing = [n for n in wanted if n not in found]
+        pages = await asyncio.gather(*(fetch(c) for c in chunked(missing, self.ITEM_FILTER_CHUNK)))
+        fetched = _match_numbers(missing, [it for page in pages for it in page])
+        if cache:
+            await asyncio.to_thread(cache.put_many, fetched)
+        found.update(fetched)
+        return found
+
+    async def item_cache(self) -> ItemCache:
+        return get_item_cache(await self.resolve_company_id())
+
+    # --- Sales orders ---
+    async def push_order(self, order: Dict[str, Any]) -> Dict[str, Any]:
+        cid = await self.resolve_company_id()
+        http, sem = get_async_client("bc365")
+        async with sem:  # no retry: a POST that timed out may still have created the order
+            r = await http.post(f"{self.base}/companies({cid})/salesOrders", json=order, headers=await self._headers())
+        r.raise_for_status()
+        return r.json()
+
+    async def find_sales_order_by_external_no(self, ext_no: str) -> dict | None:
+        if not ext_no:
+            return None
+        ext_odata = _odata_str(str(ext_no)[:35])
+        cid = await self.resolve_company_id()
+        j = await self._request(
+            "GET",
+            f"{self.base}/companies({cid})/salesOrders",
+            params={"$filter": f"externalDocumentNumber eq '{ext_odata}'"},
+        )
+        items = j.get("value", [])
+        return items[0] if items else None
@@ -1,40 +1,58 @@
 # app/bc365/client.py
 from __future__ import annotations
-from typing import List, Dict, Any, Optional
-import time
-import requests
-from urllib.parse import quote
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Tuple
+from app.bc365.item_cache import ItemCache, get_item_cache
+from app.bc365.token_store import TokenStore, get_token_store
 from app.core.config import settings
+from app.core.http import get_session, timeout as http_timeout
+from app.utils.chunk import chunked
 
-_TOKEN_CACHE: dict[str, tuple[str, float]] = {}  # key: tenant|client_id -> (token, exp)
-
-def _get_token() -> str:
-    key = f"{settings.BC365_TENANT_ID}|{settings.BC365_CLIENT_ID}"
-    tok = _TOKEN_CACHE.get(key)
-    now = time.time()
-    if tok and tok[1] - 60 > now:
-        return tok[0]
-    url = f"https://login.microsoftonline.com/{settings.BC365_TENANT_ID}/oauth2/v2.0/token"
+def _fetch_token() -> Tuple[str, int]:
+    """Client-credentials grant against Azure AD -> (access_token, expires_in)."""
+    url = settings.BC365_TOKEN_URL or f"https://login.microsoftonline.com/{settings.BC365_TENANT_ID}/oauth2/v2.0/token"
     data = {
         "grant_type": "client_credentials",
         "client_id": settings.BC365_CLIENT_ID,
         "client_secret": settings.BC365_CLIENT_SECRET,
         "scope": "https://api.businesscentral.dynamics.com/.default",
     }
-    resp = requests.post(url, data=data, timeout=30)
+    resp = get_session("aad").post(url, data=data, timeout=http_timeout())
     resp.raise_for_status()
     j = resp.json()
-    access_token: str = j["access_token"]
-    expires_in: int = int(j.get("expires_in", 3600))
-    _TOKEN_CACHE[key] = (access_token, now + expires_in)
-    return access_token
+    return j["access_token"], int(j.get("expires_in", 3600))
+
+def token_store() -> TokenStore:
+    return get_token_store(f"{settings.BC365_TENANT_ID}|{settings.BC365_CLIENT_ID}", _fetch_token)
+
+def _get_token() -> str:
+    """Shared (Redis) AAD token; refreshed by one process, ahead of expiry."""
+    return token_store().get()
+
+def api_base() -> str:
+    """API v2.0 root; BC365_API_BASE_URL points it at a local stand-in instead."""
+    origin = (settings.BC365_API_BASE_URL or "https://api.businesscentral.dynamics.com").rstrip("/")
+    env = (settings.BC365_ENVIRONMENT or "production").strip("/")
+    return f"{origin}/v2.0/{env}/api/v2.0"
+
+def _odata_str(value: str) -> str:
+    """Escape a string literal for an OData $filter."""
+    return str(value).replace("'", "''")
+
+def _match_numbers(wanted: List[str], items: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Key BC items by the numbers they were asked for. BC matches `number eq` case-insensitively
+    (Code fields are stored upper-case), so an SKU whose case differs still finds its item.
+    """
+    by_number = {str(it.get("number")).casefold(): it for it in items}
+    return {n: by_number[n.casefold()] for n in wanted if n.casefold() in by_number}
 
 class BC365Client:
+    ITEM_FILTER_CHUNK = 20  # numbers per `or` filter; keeps the query string well under BC's URL limit
+
     def __init__(self):
-        base_uri = "https://api.businesscentral.dynamics.com"
-        env = (settings.BC365_ENVIRONMENT or "production").strip("/")
-        self.base = f"{base_uri}/v2.0/{env}/api/v2.0"
+        self.base = api_base()
         self._company_id_cache: Optional[str] = settings.BC365_COMPANY_ID or None
+        self.http = get_session("bc365")  # shared keep-alive pool for every client in this process
 
     def _headers(self) -> Dict[str, str]:
         return {"Authorization": f"Bearer {_get_token()}", "Content-Type": "application/json"}
@@ -42,7 +60,7 @@ class BC365Client:
     # --- Company helpers ---
     def list_companies(self) -> List[Dict[str, Any]]:
         url = f"{self.base}/companies"
-        r = requests.get(url, headers=self._headers(), timeout=30)
+        r = self.http.get(url, headers=self._headers(), timeout=http_timeout())
         r.raise_for_status()
         return r.json().get("value", [])
 
@@ -63,29 +81,91 @@ class BC365Client:
         self._company_id_cache = companies[0]["id"]
         return self._company_id_cache
 
+    # --- Paging helper ---
+    def _iter_collection(
+        self,
+        url: str,
+        params: Optional[Dict[str, Any]] = None,
+        page_size: Optional[int] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Yield entities from an OData collection page by page, following @odata.nextLink.
+        Page size is requested via `Prefer: odata.maxpagesize` so BC pages server-side
+        instead of truncating large result sets.
+        """
+        size = int(page_size or settings.BC365_PAGE_SIZE)
+        next_url: Optional[str] = url
+        while next_url:
+            headers = self._headers()  # per page: long streams can outlive a token
+            headers["Prefer"] = f"odata.maxpagesize={size}"
+            r = self.http.get(next_url, headers=headers, params=params, timeout=http_timeout())
+            r.raise_for_status()
+            j = r.json()
+            yield from j.get("value", [])
+            next_url = j.get("@odata.nextLink")
+            params = None  # nextLink already carries the full query
+
     # --- Items / products (API v2.0) ---
-    def fetch_products(self) -> List[Dict[str, Any]]:
+    def iter_items(
+        self,
+        select: Optional[List[str]] = None,
+        filter: Optional[str] = None,
+        top: Optional[int] = None,
+        page_size: Optional[int] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """Stream items with optional $select/$filter/$top; never holds more than one page."""
         cid = self.resolve_company_id()
-        url = f"{self.base}/companies({cid})/items"
-        r = requests.get(url, headers=self._headers(), timeout=30)
-        r.raise_for_status()
-        return r.json().get("value", [])
+        params: Dict[str, Any] = {}
+        if select:
+            params["$select"] = ",".join(select)
+        if filter:
+            params["$filter"] = filter
+        if top:
+            params["$top"] = int(top)
+        yield from self._iter_collection(f"{self.base}/companies({cid})/items", params or None, page_size)
+
+    def fetch_products(self) -> List[Dict[str, Any]]:
+        """Materialised variant of iter_items(); prefer iter_items() for large catalogues."""
+        return list(self.iter_items())
 
     def find_item_by_number(self, number: str) -> dict | None:
         """Find item by its 'number' (matches Shopify SKU in our mapping)."""
-        cid = self.resolve_company_id()
-        filt = f"number eq '{number}'"
-        url = f"{self.base}/companies({cid})/items?$filter={quote(filt, safe='= ')}"
-        r = requests.get(url, headers=self._headers(), timeout=30)
-        r.raise_for_status()
-        items = r.json().get("value", [])
-        return items[0] if items else None
+        return self.find_items_by_numbers([number]).get(str(number))
+
+    def find_items_by_numbers(
+        self,
+        numbers: List[str],
+        select: Optional[List[str]] = None,
+        use_cache: bool = True,
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Resolve many item numbers at once: one `number eq 'a' or number eq 'b' ...` query per
+        ITEM_FILTER_CHUNK numbers. Returns {requested number: item}, matched case-insensitively;
+        unknown numbers are absent.
+        Full-item reads (no `select`) go through the two-tier ItemCache first.
+        """
+        wanted = list(dict.fromkeys(str(n) for n in numbers if n))
+        cache = self.item_cache() if (use_cache and not select and settings.BC365_ITEM_CACHE_ENABLE) else None
+        found: Dict[str, Dict[str, Any]] = cache.get_many(wanted) if cache else {}
+        missing = [n for n in wanted if n not in found]
+        returned: List[Dict[str, Any]] = []
+        for chunk in chunked(missing, self.ITEM_FILTER_CHUNK):
+            filt = " or ".join(f"number eq '{_odata_str(n)}'" for n in chunk)
+            returned.extend(self.iter_items(select=select, filter=filt))
+        fetched = _match_numbers(missing, returned)
+        if cache:
+            cache.put_many(fetched)
+        found.update(fetched)
+        return found
+
+    def item_cache(self) -> ItemCache:
+        return get_item_cache(self.resolve_company_id())
 
     # --- Sales orders ---
     def push_order(self, order: Dict[str, Any]) -> Dict[str, Any]:
         cid = self.resolve_company_id()
         url = f"{self.base}/companies({cid})/salesOrders"
-        r = requests.post(url, json=order, headers=self._headers(), timeout=30)
+        r = self.http.post(url, json=order, headers=self._headers(), timeout=http_timeout())
         r.raise_for_status()
         return r.json()
 
@@ -95,15 +175,15 @@ class BC365Client:
         if not ext_no:
             return None
         ext_no = str(ext_no)[:35]                   # BC field limit
-        ext_odata = ext_no.replace("'", "''")       # OData escape single quotes
+        ext_odata = _odata_str(ext_no)              # OData escape single quotes
 
         cid = self.resolve_company_id()             # <-- use resolver, not self.company_id
         url = f"{self.base}/companies({cid})/salesOrders"
-        r = requests.get(
+        r = self.http.get(
             url,
             headers=self._headers(),
             params={"$filter": f"externalDocumentNumber eq '{ext_odata}'"},
-            timeout=30,
+            timeout=http_timeout(),
         )
         r.raise_for_status()
         items = r.json().get("value", [])
@@ -0,0 +1,141 @@
+# app/bc365/item_cache.py
+from __future__ import annotations
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import redis
+import structlog
+
+from app.core.config import settings
+from app.core.redis import get_redis
+from app.metrics.prom import BC_ITEM_CACHE_HITS, BC_ITEM_CACHE_MISSES, BC_ITEM_CACHE_EVICTIONS
+
+log = structlog.get_logger(__name__)
+
+
+class ItemCache:
+    """
+    Two-tier cache for BC item metadata, keyed by item number within one company.
+
+      L1: in-process LRU, at most BC365_ITEM_CACHE_SIZE entries, BC365_ITEM_CACHE_LOCAL_TTL_SECONDS each
+      L2: Redis `bcitem:{company}:{number}` (JSON), BC365_ITEM_CACHE_TTL_SECONDS
+
+    L1 is kept short-lived because other processes can only invalidate L2; Redis errors
+    degrade to a miss.
+    """
+
+    def __init__(
+        self,
+        company_id: str,
+        size: Optional[int] = None,
+        local_ttl: Optional[int] = None,
+        ttl: Optional[int] = None,
+        r: Optional[redis.Redis] = None,
+    ) -> None:
+        self.prefix = f"bcitem:{company_id}"
+        self.size = int(size or settings.BC365_ITEM_CACHE_SIZE)
+        self.local_ttl = float(local_ttl or settings.BC365_ITEM_CACHE_LOCAL_TTL_SECONDS)
+        self.ttl = int(ttl or settings.BC365_ITEM_CACHE_TTL_SECONDS)
+        self.r = r or get_redis()
+        self._lru: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    # ---------- L1 ----------
+
+    def _local_get(self, number: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            hit = self._lru.get(number)
+            if not hit:
+                return None
+            expires, item = hit
+            if expires < time.monotonic():
+                del self._lru[number]
+                return None
+            self._lru.move_to_end(number)
+            return item
+
+    def _local_put(self, number: str, item: Dict[str, Any]) -> None:
+        with self._lock:
+            self._lru[number] = (time.monotonic() + self.local_ttl, item)
+            self._lru.move_to_end(number)
+            while len(self._lru) > self.size:
+                self._lru.popitem(last=False)
+                BC_ITEM_CACHE_EVICTIONS.inc()
+
+    # ---------- public ----------
+
+    def get_many(self, numbers: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        found: Dict[str, Dict[str, Any]] = {}
+        remote = []
+        for n in numbers:
+            item = self._local_get(n)
+            if item is not None:
+                found[n] = item
+            else:
+                remote.append(n)
+        BC_ITEM_CACHE_HITS.labels(tier="local").inc(len(found))
+        if not remote:
+            return found
+
+        try:
+            raw = self.r.mget([f"{self.prefix}:{n}" for n in remote])
+        except redis.RedisError as e:
+            log.warning("bc_item_cache_unavailable", error=str(e))
+            raw = [None] * len(remote)
+        hits = 0
+        for n, val in zip(remote, raw):
+            if val is None:
+                continue
+            item = json.loads(val)
+            found[n] = item
+            self._local_put(n, item)
+            hits += 1
+        BC_ITEM_CACHE_HITS.labels(tier="redis").inc(hits)
+        BC_ITEM_CACHE_MISSES.inc(len(remote) - hits)
+        return found
+
+    def put_many(self, items: Dict[str, Dict[str, Any]]) -> None:
+        if not items:
+            return
+        for n, item in items.items():
+            self._local_put(n, item)
+        try:
+            pipe = self.r.pipeline(transaction=False)
+            for n, item in items.items():
+                pipe.set(f"{self.prefix}:{n}", json.dumps(item), ex=self.ttl)
+            pipe.execute()
+        except redis.RedisError as e:
+            log.warning("bc_item_cache_unavailable", error=str(e))
+
+    def invalidate(self, numbers: Iterable[str]) -> None:
+        numbers = [str(n) for n in numbers]
+        if not numbers:
+            return
+        with self._lock:
+            for n in numbers:
+                self._lru.pop(n, None)
+        try:
+            self.r.delete(*[f"{self.prefix}:{n}" for n in numbers])
+        except redis.RedisError as e:
+            log.warning("bc_item_cache_unavailable", error=str(e))
+
+    def clear_local(self) -> None:
+        with self._lock:
+            self._lru.clear()
+
+
+_CACHES: Dict[str, ItemCache] = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def get_item_cache(company_id: str) -> ItemCache:
+    """One cache per company per process, so L1 survives across BC365Client instances."""
+    with _CACHES_LOCK:
+        cache = _CACHES.get(company_id)
+        if cache is None:
+            cache = _CACHES[company_id] = ItemCache(company_id)
+        return cache
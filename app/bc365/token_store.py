@@ -0,0 +1,174 @@
+# app/bc365/token_store.py
+from __future__ import annotations
+
+import json
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+import redis
+import structlog
+
+from app.core.config import settings
+from app.core.redis import get_redis
+from app.metrics.prom import BC_TOKEN_CACHE, BC_TOKEN_FETCH_SECONDS, BC_TOKEN_REFRESHES
+
+log = structlog.get_logger(__name__)
+
+Fetcher = Callable[[], Tuple[str, int]]  # -> (access_token, expires_in seconds)
+
+
+class TokenStore:
+    """
+    Azure AD token for one (tenant, client id), shared by every process through Redis.
+
+      local : (token, expires_at) in this process
+      Redis : `bctoken:{tenant}|{client}` JSON {"token", "exp"}, expiring with the token
+      lock  : `bctoken:{tenant}|{client}:lock`, held by the one process that refreshes
+
+    Callers get the cached token while it has more than BC365_TOKEN_REFRESH_AHEAD_SECONDS
+    left; inside that window the token is still returned and one background thread renews
+    it, so requests only block on AAD when no valid token exists anywhere. Redis errors
+    degrade to a per-process cache.
+    """
+
+    def __init__(self, key: str, fetch: Fetcher, r: Optional[redis.Redis] = None) -> None:
+        self.key = f"bctoken:{key}"
+        self.fetch = fetch
+        self.r = r or get_redis()
+        self.refresh_ahead = float(settings.BC365_TOKEN_REFRESH_AHEAD_SECONDS)
+        self.lock_seconds = float(settings.BC365_TOKEN_LOCK_SECONDS)
+        self._local: Optional[Tuple[str, float]] = None
+        self._mutex = threading.Lock()      # one refresh per process at a time
+        self._background: Optional[threading.Thread] = None
+
+    # ---------- tiers ----------
+
+    def _remote_get(self) -> Optional[Tuple[str, float]]:
+        try:
+            raw = self.r.get(self.key)
+        except redis.RedisError as e:
+            log.warning("bc_token_store_unavailable", error=str(e))
+            return None
+        if not raw:
+            return None
+        j = json.loads(raw)
+        return j["token"], float(j["exp"])
+
+    def _remote_put(self, token: str, exp: float) -> None:
+        ttl = int(exp - time.time())
+        if ttl <= 0:
+            return
+        try:
+            self.r.set(self.key, json.dumps({"token": token, "exp": exp}), ex=ttl)
+        except redis.RedisError as e:
+            log.warning("bc_token_store_unavailable", error=str(e))
+
+    def _cached(self) -> Optional[Tuple[str, float]]:
+        """Best known token (local, else Redis) that is still valid, with its tier counted."""
+        now = time.time()
+        if self._local and self._local[1] > now:
+            BC_TOKEN_CACHE.labels(result="local").inc()
+            return self._local
+        hit = self._remote_get()
+        if hit and hit[1] > now:
+            BC_TOKEN_CACHE.labels(result="redis").inc()
+            self._local = hit
+            return hit
+        return None
+
+    # ---------- public ----------
+
+    def get(self) -> str:
+        hit = self._cached()
+        if hit:
+            if hit[1] - time.time() < self.refresh_ahead:
+                self._refresh_in_background()
+            return hit[0]
+        BC_TOKEN_CACHE.labels(result="miss").inc()
+        return self.refresh(trigger="expired")
+
+    def refresh(self, trigger: str = "expired", force: bool = False) -> str:
+        """
+        Single-flight refresh: one thread per process, one process per cluster (Redis lock).
+        Whoever waits on the lock re-reads Redis afterwards instead of fetching again.
+        """
+        with self._mutex:
+            hit = None if force else self._fresh()
+            if hit:
+                return hit[0]
+            lock = self.r.lock(f"{self.key}:lock", timeout=self.lock_seconds, blocking_timeout=self.lock_seconds)
+            try:
+                acquired = lock.acquire()
+            except redis.RedisError as e:
+                log.warning("bc_token_store_unavailable", error=str(e))
+                acquired = False
+                lock = None
+            try:
+                hit = None if force else self._fresh()
+                if hit:
+                    return hit[0]
+                # Not acquired = lock holder is slow or Redis is down: fetch anyway rather than fail
+                return self._fetch(trigger)
+            finally:
+                if acquired and lock is not None:
+                    try:
+                        lock.release()
+                    except redis.RedisError:
+                        pass  # expired under us; the token is written either way
+
+    def refresh_if_due(self) -> bool:
+        """Renew when the shared token is missing or inside the refresh window (beat / warm-up)."""
+        hit = self._remote_get()
+        if hit and hit[1] - time.time() >= self.refresh_ahead:
+            return False
+        self.refresh(trigger="proactive")
+        return True
+
+    # ---------- internals ----------
+
+    def _fresh(self) -> Optional[Tuple[str, float]]:
+        """A token outside the refresh window, from Redis (another process may just have renewed it)."""
+        hit = self._remote_get()
+        if hit and hit[1] - time.time() >= self.refresh_ahead:
+            self._local = hit
+            return hit
+        return None
+
+    def _fetch(self, trigger: str) -> str:
+        with BC_TOKEN_FETCH_SECONDS.time():
+            token, expires_in = self.fetch()
+        exp = time.time() + int(expires_in) - 60  # never hand out a token in its last minute
+        self._local = (token, exp)
+        self._remote_put(token, exp)
+        BC_TOKEN_REFRESHES.labels(trigger=trigger).inc()
+        log.info("bc_token_refreshed", trigger=trigger, expires_in=int(expires_in))
+        return token
+
+    def _refresh_in_background(self) -> None:
+        if self._background is not None and self._background.is_alive():
+            return
+        if self._mutex.locked():
+            return
+
+        def run() -> None:
+            try:
+                self.refresh(trigger="proactive")
+            except Exception as e:  # the current token is still valid; the next call retries
+                log.warning("bc_token_refresh_failed", error=str(e))
+
+        self._background = threading.Thread(target=run, name="bc-token-refresh", daemon=True)
+        self._background.start()
+
+
+_STORES: Dict[str, TokenStore] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_token_store(key: str, fetch: Fetcher) -> TokenStore:
+    """One store per credential per process, so the local tier survives across clients."""
+    with _STORES_LOCK:
+        store = _STORES.get(key)
+        if store is None:
+            store = _STORES[key] = TokenStore(key, fetch)
+        return store
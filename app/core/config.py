@@ -29,13 +29,39 @@ class Settings(BaseSettings):
     REDIS_URL: str = "redis://redis:6379/0"
     CELERY_BROKER_URL: Optional[str] = None
     CELERY_RESULT_BACKEND: Optional[str] = None
+    CELERY_PREFETCH_MULTIPLIER: int = 1         # messages reserved per pool slot (--prefetch-multiplier overrides)
+    CELERY_VISIBILITY_TIMEOUT: int = 2 * 60 * 60   # redelivery of unacked tasks; > longest bulk job
 
     # ==== Shopify (classic creds) ====
     SHOPIFY_SHOP: Optional[str] = None
     SHOPIFY_API_VERSION: str = "2024-10"
+    SHOP_REGISTRY_CHECK_SECONDS: int = 30   # how often processes poll for re-installed shops
     SHOPIFY_API_KEY: Optional[str] = None
+    SHOPIFY_API_PASSWORD: Optional[str] = None
     SHOPIFY_WEBHOOK_SECRET: Optional[str] = None
+    WEBHOOK_BUFFER_DEBOUNCE_SECONDS: float = 5.0   # products/inventory_levels updates coalesce per key
+    WEBHOOK_BUFFER_DRAIN_BATCH: int = 1000
+    WEBHOOK_BUFFER_CLAIM_SECONDS: float = 60.0   # a drain that dies leaves its batch for the next one after this
     SHOPIFY_ACCESS_TOKEN: str | None = None
+    SHOPIFY_API_BASE_URL: Optional[str] = None   # e.g. http://localhost:8787 for bench/shopify_standin.py
+    SHOPIFY_BULK_POLL_SECONDS: float = 5.0
+    SHOPIFY_BULK_TIMEOUT_SECONDS: int = 2 * 60 * 60
+    # Shared leaky-bucket limiter (Redis); Shopify's reported limits override these defaults
+    SHOPIFY_RATE_LIMIT_ENABLE: bool = True
+    SHOPIFY_REST_BUCKET_SIZE: int = 40
+    SHOPIFY_REST_LEAK_RATE: float = 2.0          # requests/second
+    SHOPIFY_GRAPHQL_BUCKET_SIZE: int = 1000
+    SHOPIFY_GRAPHQL_RESTORE_RATE: float = 50.0   # cost points/second
+    SKU_INDEX_TTL_SECONDS: int = 24 * 60 * 60   # full catalogue re-read at least daily
+    SKU_INDEX_REBUILD_LOCK_SECONDS: int = 15 * 60   # one rebuild at a time per shop; others wait this long
+    INVENTORY_FULL_RESYNC_SECONDS: int = 6 * 60 * 60   # push every qty regardless of snapshot
+    INVENTORY_SYNC_CONCURRENCY: int = 4   # batches in flight per sync run (1 = sequential)
+    INVENTORY_SHARD_SIZE: int = 5000      # BC items per shard of sync_inventory_sharded
+    RECONCILE_TOP_N: int = 50               # largest drifts kept in the report
+    RECONCILE_AUTO_CORRECT: bool = False    # queue targeted syncs for mismatched items
+    RECONCILE_MAX_CORRECTIONS: int = 5000
+    RECONCILE_BUCKETS: int = 1024           # bucketed mode: SKU partitions with their own digests
+    RECONCILE_BUCKET_FALLBACK_RATIO: float = 0.25   # more suspect buckets than this -> full run
 
 
     # ==== BC365 / Business Central ====
@@ -45,13 +71,40 @@ class Settings(BaseSettings):
     BC365_ENVIRONMENT: str = "production"   # or "sandbox"
     BC365_COMPANY_ID: Optional[str] = None
     BC365_COMPANY_NAME: Optional[str] = None
+    BC365_PAGE_SIZE: int = 1000             # odata.maxpagesize for streamed reads
+    BC365_API_BASE_URL: Optional[str] = None   # e.g. http://localhost:8788 for bench/bc365_standin.py
+    BC365_TOKEN_URL: Optional[str] = None      # full token endpoint; default is Azure AD for BC365_TENANT_ID
+    BC365_TOKEN_REFRESH_AHEAD_SECONDS: int = 10 * 60   # renew the shared AAD token this long before expiry
+    BC365_TOKEN_LOCK_SECONDS: int = 30                 # single-flight refresh lock (and max wait on it)
+    BC365_ITEM_CACHE_ENABLE: bool = True
+    BC365_ITEM_CACHE_SIZE: int = 5000                  # in-process LRU entries
+    BC365_ITEM_CACHE_LOCAL_TTL_SECONDS: int = 60
+    BC365_ITEM_CACHE_TTL_SECONDS: int = 60 * 60        # shared Redis tier
     # add in Settings(...)
     BC365_DEFAULT_CUSTOMER: str = "10000"
-    # in Settings
+    # Order ledger: orders with no ledger row are new unless the BC fallback is on (e.g. while backfilling)
+    ORDER_LEDGER_BC_FALLBACK: bool = False
+    ORDER_LEDGER_VERIFY_DAYS: int = 7       # re-check ledger rows against BC this often
+    ORDER_LEDGER_VERIFY_BATCH: int = 200    # rows per verification run
+    ORDER_PUSH_LEASE_SECONDS: int = 5 * 60  # in-flight claim per order; > a BC push, expires if the worker dies
+    # Legacy/seed mapping; the sku_map table (python -m app.core.sku_map import ...) wins once populated
     SKU_MAP_JSON: str | None = None
+    SKU_MAP_CHECK_SECONDS: int = 30   # how often workers poll the mapping version
 
 
 
+    # ==== Outbound HTTP (pooled keep-alive sessions) ====
+    HTTP_POOL_CONNECTIONS: int = 10     # distinct hosts kept per session
+    HTTP_POOL_MAXSIZE: int = 20         # sockets kept per host
+    HTTP_CONNECT_TIMEOUT: float = 5.0
+    HTTP_READ_TIMEOUT: float = 30.0
+    HTTP_ASYNC_CONCURRENCY: int = 10    # in-flight requests per async client per event loop
+
+    # ==== Idempotency keys ====
+    IDEMPOTENCY_REDIS_TTL_SECONDS: int = 7 * 24 * 60 * 60   # fast-path window in Redis
+    IDEMPOTENCY_RETENTION_DAYS: int = 30                    # rows older than this are pruned from Postgres
+    JOB_RETENTION_DAYS: int = 14                            # sync Job rows (one per sharded run) kept this long
+
     # ==== Security/Observability ====
     ADMIN_API_TOKEN: str = "change-me"
     PROMETHEUS_ENABLE: bool = True
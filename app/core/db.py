@@ -1,4 +1,5 @@
-from sqlalchemy import create_engine, text, String, Integer
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import create_engine, delete, inspect, select, text, String, Integer, BigInteger, DateTime, Float, Text, func
 from sqlalchemy.orm import sessionmaker, DeclarativeBase, Mapped, mapped_column
 from app.core.config import settings
 
@@ -14,17 +15,64 @@ class Job(Base):
     type: Mapped[str] = mapped_column(String(64))
     status: Mapped[str] = mapped_column(String(32), default="pending")
     detail: Mapped[str] = mapped_column(String(2048), default="")
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), index=True)
 
 class IdempotencyKey(Base):
     __tablename__ = "idempotency_keys"
     key: Mapped[str] = mapped_column(String(128), primary_key=True)
     note: Mapped[str] = mapped_column(String(256), default="")
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), index=True)
 
 class Shop(Base):
     __tablename__ = "shops"
     domain: Mapped[str] = mapped_column(String(255), primary_key=True)
     access_token: Mapped[str] = mapped_column(String(255))
 
+class SkuMapping(Base):
+    __tablename__ = "sku_map"
+    shopify_sku: Mapped[str] = mapped_column(String(255), primary_key=True)
+    bc_item_no: Mapped[str] = mapped_column(String(64), index=True)
+
+class ProductSyncState(Base):
+    """Last product payload pushed to Shopify per (shop, BC item), so unchanged items are skipped."""
+    __tablename__ = "product_sync_state"
+    shop: Mapped[str] = mapped_column(String(255), primary_key=True)
+    bc_item_no: Mapped[str] = mapped_column(String(64), primary_key=True)
+    shopify_product_id: Mapped[int] = mapped_column(BigInteger)
+    shopify_variant_id: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    payload_hash: Mapped[str] = mapped_column(String(64))
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class ReconciliationReport(Base):
+    __tablename__ = "reconciliation_reports"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    shop: Mapped[str] = mapped_column(String(255))
+    location_id: Mapped[int] = mapped_column(BigInteger)
+    mode: Mapped[str] = mapped_column(String(16), default="full")
+    started_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    finished_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), index=True)
+    bc_rows: Mapped[int] = mapped_column(Integer, default=0)
+    shopify_rows: Mapped[int] = mapped_column(Integer, default=0)
+    matched: Mapped[int] = mapped_column(Integer, default=0)
+    mismatched: Mapped[int] = mapped_column(Integer, default=0)
+    missing_in_shopify: Mapped[int] = mapped_column(Integer, default=0)
+    missing_in_bc: Mapped[int] = mapped_column(Integer, default=0)
+    accuracy: Mapped[float] = mapped_column(Float, default=1.0)
+    corrections_queued: Mapped[int] = mapped_column(Integer, default=0)
+    top_drift: Mapped[str] = mapped_column(Text, default="[]")   # JSON list of the largest drifts
+
+class OrderLedger(Base):
+    """Shopify order -> BC sales order, written by push_order_to_bc365 and checked before BC."""
+    __tablename__ = "order_ledger"
+    ext_no: Mapped[str] = mapped_column(String(35), primary_key=True)    # BC externalDocumentNumber
+    shopify_order_id: Mapped[str] = mapped_column(String(64), index=True)
+    bc_id: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    bc_number: Mapped[str | None] = mapped_column(String(32), nullable=True)
+    status: Mapped[str] = mapped_column(String(16), default="pending", index=True)  # pending|pushed|existing|missing
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    verified_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True, index=True)
+
 def save_shop_token(domain: str, token: str) -> None:
     with SessionLocal() as s:
         row = s.get(Shop, domain)
@@ -39,9 +87,71 @@ def get_shop_token(domain: str) -> str | None:
         row = s.get(Shop, domain)
         return row.access_token if row else None
 
-Base.metadata.create_all(engine)
+def list_shops() -> list[str]:
+    with SessionLocal() as s:
+        return list(s.scalars(select(Shop.domain).order_by(Shop.domain)))
+
+def get_order_entry(ext_no: str) -> OrderLedger | None:
+    with SessionLocal() as s:
+        return s.get(OrderLedger, ext_no)
+
+def record_order(
+    ext_no: str,
+    *,
+    shopify_order_id: str,
+    status: str,
+    bc_id: str | None = None,
+    bc_number: str | None = None,
+    verified: bool = False,
+) -> None:
+    with SessionLocal() as s:
+        row = s.get(OrderLedger, ext_no)
+        if row is None:
+            row = OrderLedger(ext_no=ext_no, shopify_order_id=str(shopify_order_id))
+            s.add(row)
+        row.status = status
+        row.bc_id = bc_id or row.bc_id
+        row.bc_number = bc_number or row.bc_number
+        if verified:
+            row.verified_at = func.now()
+        s.commit()
+
+def prune_jobs(older_than_days: int) -> int:
+    """Delete finished and abandoned Job rows past the retention window; returns rows removed."""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+    with SessionLocal() as s:
+        n = s.execute(delete(Job).where(Job.created_at < cutoff)).rowcount
+        s.commit()
+    return n
+
+Base.metadata.create_all(engine)   # missing tables only; changes to existing ones: upgrade_schema()
+
+def _add_created_at(table: str) -> None:
+    """create_all() never alters existing tables: add an indexed created_at to older deployments."""
+    cols = {c["name"] for c in inspect(engine).get_columns(table)}
+    if "created_at" in cols:
+        return
+    coltype = "TIMESTAMP WITH TIME ZONE" if engine.dialect.name == "postgresql" else "TIMESTAMP"
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN created_at {coltype}"))
+        # Existing rows start their retention window now
+        conn.execute(text(f"UPDATE {table} SET created_at = CURRENT_TIMESTAMP"))
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_created_at ON {table} (created_at)"))
+
+def upgrade_schema() -> None:
+    """
+    Bring tables created by older releases up to date. Runs once per deploy, before the API
+    and workers start (`python -m app.core.db`, the compose `migrate` service), not on import.
+    """
+    Base.metadata.create_all(engine)
+    _add_created_at("idempotency_keys")
+    _add_created_at("jobs")
 
 def db_healthcheck() -> bool:
     with engine.connect() as conn:
         conn.execute(text("SELECT 1"))
     return True
+
+
+if __name__ == "__main__":
+    upgrade_schema()
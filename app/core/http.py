@@ -0,0 +1,128 @@
+# app/core/http.py
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import weakref
+from typing import Dict, Tuple
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from app.core.config import settings
+from app.metrics.prom import HTTP_CLIENT_REQUESTS, HTTP_CONNECTIONS_OPENED
+
+
+def _counting(pool_cls, client: str):
+    """Pool subclass that counts every new TCP(+TLS) connection it opens."""
+
+    class CountingPool(pool_cls):
+        def _new_conn(self):
+            HTTP_CONNECTIONS_OPENED.labels(client=client).inc()
+            return super()._new_conn()
+
+    return CountingPool
+
+
+class PooledAdapter(HTTPAdapter):
+    """Keep-alive adapter; requests vs. connections opened gives the reuse ratio."""
+
+    def __init__(self, client: str, **kwargs) -> None:
+        self.client = client
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _counting(HTTPConnectionPool, self.client),
+            "https": _counting(HTTPSConnectionPool, self.client),
+        }
+
+    def send(self, request, **kwargs):
+        HTTP_CLIENT_REQUESTS.labels(client=self.client).inc()
+        return super().send(request, **kwargs)
+
+
+_sessions: Dict[str, requests.Session] = {}
+_lock = threading.Lock()
+
+
+def get_session(client: str) -> requests.Session:
+    """
+    Per-process shared session for `client` (e.g. "bc365", "aad").
+    Sessions are dropped in forked children so pooled sockets are never shared across processes.
+    """
+    with _lock:
+        s = _sessions.get(client)
+        if s is None:
+            s = requests.Session()
+            adapter = PooledAdapter(
+                client,
+                pool_connections=settings.HTTP_POOL_CONNECTIONS,
+                pool_maxsize=settings.HTTP_POOL_MAXSIZE,
+                max_retries=0,  # retries belong to the callers' policies
+            )
+            s.mount("https://", adapter)
+            s.mount("http://", adapter)
+            s.headers.update({"Accept-Encoding": "gzip", "Connection": "keep-alive"})
+            _sessions[client] = s
+        return s
+
+
+def timeout() -> Tuple[float, float]:
+    """(connect, read) timeout for outbound API calls."""
+    return (settings.HTTP_CONNECT_TIMEOUT, settings.HTTP_READ_TIMEOUT)
+
+
+# httpx.AsyncClient is bound to the loop it first ran on, so async pools are per event loop
+_async_pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, Tuple[httpx.AsyncClient, asyncio.Semaphore]]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_async_client(client: str) -> Tuple[httpx.AsyncClient, asyncio.Semaphore]:
+    """
+    Shared httpx.AsyncClient plus a semaphore bounding in-flight requests for `client`
+    on the running event loop (HTTP_ASYNC_CONCURRENCY).
+    """
+    loop = asyncio.get_running_loop()
+    pools = _async_pools.setdefault(loop, {})
+    pair = pools.get(client)
+    if pair is None:
+        http = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_POOL_MAXSIZE,
+                max_keepalive_connections=settings.HTTP_POOL_MAXSIZE,
+            ),
+            timeout=httpx.Timeout(settings.HTTP_READ_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT),
+            headers={"Accept-Encoding": "gzip"},
+            event_hooks={"request": [_count_async_request(client)]},
+        )
+        pair = pools[client] = (http, asyncio.Semaphore(settings.HTTP_ASYNC_CONCURRENCY))
+    return pair
+
+
+def _count_async_request(client: str):
+    async def hook(request: httpx.Request) -> None:
+        HTTP_CLIENT_REQUESTS.labels(client=client).inc()
+    return hook
+
+
+async def aclose_async_clients() -> None:
+    """Close the running loop's async pools (FastAPI shutdown, end of asyncio.run in tasks)."""
+    pools = _async_pools.pop(asyncio.get_running_loop(), {})
+    for http, _ in pools.values():
+        await http.aclose()
+
+
+def _reset_after_fork() -> None:
+    global _lock
+    _sessions.clear()
+    _lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,114 @@
+# app/core/reconcile.py
+from __future__ import annotations
+
+from array import array
+from dataclasses import dataclass, field
+from hashlib import blake2b
+from typing import Any, Dict, List
+
+import numpy as np
+
+
+def sku_key(sku: str) -> int:
+    """Stable 64-bit key for a SKU; collisions are negligible below billions of SKUs."""
+    return int.from_bytes(blake2b(sku.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class Columns:
+    """
+    Append-only (key, qty, ref) columns backed by `array` buffers (~24 bytes per row),
+    frozen into NumPy arrays for the join. `ref` is a caller-defined integer that can be
+    turned back into a name later (e.g. a Shopify inventory_item_id).
+    """
+
+    def __init__(self) -> None:
+        self._keys = array("Q")
+        self._qty = array("q")
+        self._ref = array("q")
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def append(self, key: int, qty: int, ref: int = 0) -> None:
+        self._keys.append(key)
+        self._qty.append(qty)
+        self._ref.append(ref)
+
+    def freeze(self) -> "Frozen":
+        keys = np.frombuffer(self._keys, dtype=np.uint64)
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        # Keep the first row per key; duplicates (e.g. two variants sharing a SKU) are counted
+        first = np.ones(len(keys), dtype=bool)
+        first[1:] = keys[1:] != keys[:-1]
+        return Frozen(
+            keys=keys[first],
+            qty=np.frombuffer(self._qty, dtype=np.int64)[order][first],
+            ref=np.frombuffer(self._ref, dtype=np.int64)[order][first],
+            duplicates=int(len(keys) - first.sum()),
+        )
+
+
+@dataclass
+class Frozen:
+    keys: np.ndarray
+    qty: np.ndarray
+    ref: np.ndarray
+    duplicates: int = 0
+
+
+@dataclass
+class Diff:
+    bc_rows: int
+    shopify_rows: int
+    matched: int
+    mismatched: int
+    missing_in_shopify: int
+    missing_in_bc: int
+    duplicates: int
+    accuracy: float
+    # Matched rows whose quantities differ: Shopify ref, BC qty, Shopify qty (largest |drift| first)
+    drift_ref: np.ndarray = field(repr=False)
+    drift_bc: np.ndarray = field(repr=False)
+    drift_shopify: np.ndarray = field(repr=False)
+
+    def top(self, n: int) -> List[Dict[str, int]]:
+        return [
+            {"ref": int(r), "bc": int(b), "shopify": int(s), "drift": int(b - s)}
+            for r, b, s in zip(self.drift_ref[:n], self.drift_bc[:n], self.drift_shopify[:n])
+        ]
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "bc_rows": self.bc_rows,
+            "shopify_rows": self.shopify_rows,
+            "matched": self.matched,
+            "mismatched": self.mismatched,
+            "missing_in_shopify": self.missing_in_shopify,
+            "missing_in_bc": self.missing_in_bc,
+            "duplicates": self.duplicates,
+            "accuracy": round(self.accuracy, 6),
+        }
+
+
+def diff(bc: Frozen, shopify: Frozen) -> Diff:
+    """Sorted merge-join of both sides on the SKU key; everything after freeze() is vectorised."""
+    _, ib, ish = np.intersect1d(bc.keys, shopify.keys, assume_unique=True, return_indices=True)
+    bc_qty, sh_qty, sh_ref = bc.qty[ib], shopify.qty[ish], shopify.ref[ish]
+    delta = bc_qty - sh_qty
+    bad = np.flatnonzero(delta)
+    order = bad[np.argsort(-np.abs(delta[bad]), kind="stable")]
+    matched = len(ib)
+    return Diff(
+        bc_rows=len(bc.keys),
+        shopify_rows=len(shopify.keys),
+        matched=matched,
+        mismatched=len(bad),
+        missing_in_shopify=len(bc.keys) - matched,
+        missing_in_bc=len(shopify.keys) - matched,
+        duplicates=bc.duplicates + shopify.duplicates,
+        accuracy=(matched - len(bad)) / len(bc.keys) if len(bc.keys) else 1.0,
+        drift_ref=sh_ref[order],
+        drift_bc=bc_qty[order],
+        drift_shopify=sh_qty[order],
+    )
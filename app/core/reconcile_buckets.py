@@ -0,0 +1,169 @@
+# app/core/reconcile_buckets.py
+from __future__ import annotations
+
+from collections import defaultdict
+from hashlib import blake2b
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import redis
+
+from app.core.config import settings
+from app.core.reconcile import Columns, sku_key
+from app.core.redis import get_redis
+
+SIDES = ("bc", "shopify")
+
+
+def row_digest(sku: str, qty: int) -> int:
+    return int.from_bytes(blake2b(f"{sku}\0{int(qty)}".encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class BucketMirror:
+    """
+    Last-known inventory of both systems for one (shop, location), partitioned into
+    buckets by sku_key(sku) % buckets, with an order-independent digest per bucket
+    (XOR of row digests) kept up to date as rows change.
+
+    Layout:
+      recon:{shop}:{loc}:{side}:{bucket}  -> hash sku -> "qty:ref"   (side = bc | shopify)
+      recon:{shop}:{loc}:digest:{side}    -> hash bucket -> digest
+      recon:{shop}:{loc}:verified         -> hash bucket -> "bc digest:shopify digest" at the last re-read
+      recon:{shop}:{loc}:meta             -> hash buckets, bc_at, shopify_at (watermarks)
+
+    A bucket needs re-reading only when its two digests disagree and the pair differs
+    from the one recorded when it was last re-read, i.e. something changed since.
+    """
+
+    def __init__(self, shop: str, location_id: int, buckets: Optional[int] = None, r: Optional[redis.Redis] = None) -> None:
+        self.r = r or get_redis()
+        self.buckets = int(buckets or settings.RECONCILE_BUCKETS)
+        self.prefix = f"recon:{shop.rstrip('/')}:{int(location_id)}"
+
+    def _rows_key(self, side: str, bucket: int) -> str:
+        return f"{self.prefix}:{side}:{bucket}"
+
+    def bucket_of(self, sku: str) -> int:
+        return sku_key(sku) % self.buckets
+
+    # ---------- metadata ----------
+
+    def meta(self) -> Dict[str, str]:
+        return self.r.hgetall(f"{self.prefix}:meta")
+
+    def is_seeded(self) -> bool:
+        m = self.meta()
+        return m.get("buckets") == str(self.buckets) and "bc_at" in m and "shopify_at" in m
+
+    def set_watermarks(self, bc_at: str, shopify_at: str) -> None:
+        self.r.hset(f"{self.prefix}:meta", mapping={"buckets": self.buckets, "bc_at": bc_at, "shopify_at": shopify_at})
+
+    def reset(self) -> None:
+        keys = list(self.r.scan_iter(match=f"{self.prefix}:*", count=1000))
+        for i in range(0, len(keys), 500):
+            self.r.delete(*keys[i:i + 500])
+
+    # ---------- rows ----------
+
+    def apply(self, side: str, rows: Dict[str, Tuple[int, int]]) -> Set[int]:
+        """Upsert sku -> (qty, ref) rows; returns the buckets whose digest changed."""
+        by_bucket: Dict[int, Dict[str, Tuple[int, int]]] = defaultdict(dict)
+        for sku, row in rows.items():
+            by_bucket[self.bucket_of(sku)][sku] = row
+        if not by_bucket:
+            return set()
+
+        buckets = list(by_bucket)
+        pipe = self.r.pipeline(transaction=False)
+        for b in buckets:
+            pipe.hmget(self._rows_key(side, b), list(by_bucket[b]))
+        pipe.hmget(f"{self.prefix}:digest:{side}", buckets)
+        *old_rows, old_digests = pipe.execute()
+
+        changed: Set[int] = set()
+        pipe = self.r.pipeline(transaction=True)
+        digests: Dict[int, int] = {}
+        for b, old, d in zip(buckets, old_rows, old_digests):
+            digest = int(d or 0)
+            writes: Dict[str, str] = {}
+            for (sku, (qty, ref)), prev in zip(by_bucket[b].items(), old):
+                value = f"{int(qty)}:{int(ref)}"
+                if prev == value:
+                    continue
+                if prev is not None:
+                    digest ^= row_digest(sku, int(prev.split(":", 1)[0]))
+                digest ^= row_digest(sku, qty)
+                writes[sku] = value
+            if writes:
+                pipe.hset(self._rows_key(side, b), mapping=writes)
+            if digest != int(d or 0):
+                digests[b] = digest
+                changed.add(b)
+        if digests:
+            pipe.hset(f"{self.prefix}:digest:{side}", mapping=digests)
+        pipe.execute()
+        return changed
+
+    def replace(self, side: str, bucket: int, rows: Dict[str, Tuple[int, int]]) -> None:
+        """Overwrite one bucket with freshly read rows (drops SKUs no longer present)."""
+        digest = 0
+        for sku, (qty, _) in rows.items():
+            digest ^= row_digest(sku, qty)
+        pipe = self.r.pipeline(transaction=True)
+        pipe.delete(self._rows_key(side, bucket))
+        if rows:
+            pipe.hset(self._rows_key(side, bucket), mapping={s: f"{int(q)}:{int(ref)}" for s, (q, ref) in rows.items()})
+        pipe.hset(f"{self.prefix}:digest:{side}", bucket, digest)
+        pipe.execute()
+
+    def members(self, side: str, bucket: int) -> Dict[str, Tuple[int, int]]:
+        raw = self.r.hgetall(self._rows_key(side, bucket))
+        return {sku: _parse(v) for sku, v in raw.items()}
+
+    def iter_rows(self, side: str) -> Iterator[Tuple[str, int, int]]:
+        """(sku, qty, ref) for every row on one side, 64 buckets per round trip."""
+        for start in range(0, self.buckets, 64):
+            pipe = self.r.pipeline(transaction=False)
+            for b in range(start, min(start + 64, self.buckets)):
+                pipe.hgetall(self._rows_key(side, b))
+            for raw in pipe.execute():
+                for sku, v in raw.items():
+                    qty, ref = _parse(v)
+                    yield sku, qty, ref
+
+    def columns(self, side: str) -> Columns:
+        cols = Columns()
+        for sku, qty, ref in self.iter_rows(side):
+            cols.append(sku_key(sku), qty, ref)
+        return cols
+
+    # ---------- digests ----------
+
+    def _digests(self) -> Tuple[Dict[str, str], Dict[str, str], Dict[str, str]]:
+        pipe = self.r.pipeline(transaction=False)
+        for side in SIDES:
+            pipe.hgetall(f"{self.prefix}:digest:{side}")
+        pipe.hgetall(f"{self.prefix}:verified")
+        bc, sh, verified = pipe.execute()
+        return bc, sh, verified
+
+    def suspects(self) -> List[int]:
+        """Buckets whose digests disagree and changed since they were last re-read."""
+        bc, sh, verified = self._digests()
+        out = []
+        for b in range(self.buckets):
+            pair = f"{bc.get(str(b), '0')}:{sh.get(str(b), '0')}"
+            if bc.get(str(b), "0") != sh.get(str(b), "0") and verified.get(str(b)) != pair:
+                out.append(b)
+        return out
+
+    def mark_verified(self, buckets: Optional[Iterable[int]] = None) -> None:
+        bc, sh, _ = self._digests()
+        wanted = range(self.buckets) if buckets is None else buckets
+        pairs = {b: f"{bc.get(str(b), '0')}:{sh.get(str(b), '0')}" for b in wanted}
+        if pairs:
+            self.r.hset(f"{self.prefix}:verified", mapping=pairs)
+
+
+def _parse(value: str) -> Tuple[int, int]:
+    qty, _, ref = value.partition(":")
+    return int(qty), int(ref or 0)
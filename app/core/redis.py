@@ -0,0 +1,12 @@
+# app/core/redis.py
+from functools import lru_cache
+
+import redis
+
+from app.core.config import settings
+
+
+@lru_cache(maxsize=1)
+def get_redis() -> redis.Redis:
+    """Process-wide Redis client (connection-pooled, str responses)."""
+    return redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
@@ -0,0 +1,151 @@
+# app/core/sku_map.py
+from __future__ import annotations
+
+import csv
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+import redis
+import structlog
+import typer
+from sqlalchemy import delete, func, insert, select
+
+from app.core.config import settings
+from app.core.db import SessionLocal, SkuMapping
+from app.core.redis import get_redis
+from app.utils.chunk import chunked
+
+log = structlog.get_logger(__name__)
+
+VERSION_KEY = "skumap:version"
+
+
+class SkuMap:
+    """
+    Read-only bidirectional Shopify SKU <-> BC item number map.
+    Strings are interned and shared by both directions, so the reverse side costs
+    only its hash table. Unmapped values pass through unchanged.
+    """
+
+    __slots__ = ("version", "_to_bc", "_to_shopify")
+
+    def __init__(self, pairs: Iterable[Tuple[str, str]], version: str = "0") -> None:
+        self.version = version
+        self._to_bc: Dict[str, str] = {}
+        self._to_shopify: Dict[str, str] = {}
+        for sku, bc_no in pairs:
+            sku, bc_no = sys.intern(str(sku)), sys.intern(str(bc_no))
+            self._to_bc[sku] = bc_no
+            self._to_shopify[bc_no] = sku
+
+    def __len__(self) -> int:
+        return len(self._to_bc)
+
+    def to_bc(self, sku: str) -> str:
+        return self._to_bc.get(sku, sku)
+
+    def to_shopify(self, bc_no: str) -> str:
+        return self._to_shopify.get(bc_no, bc_no)
+
+
+_current: Optional[SkuMap] = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def _remote_version(r: redis.Redis) -> str:
+    try:
+        return r.get(VERSION_KEY) or "0"
+    except redis.RedisError as e:
+        log.warning("sku_map_version_unavailable", error=str(e))
+        return _current.version if _current else "0"
+
+
+def _load(version: str) -> SkuMap:
+    with SessionLocal() as s:
+        rows = s.execute(select(SkuMapping.shopify_sku, SkuMapping.bc_item_no).execution_options(yield_per=10_000))
+        m = SkuMap(rows, version=version)
+    if not len(m) and settings.SKU_MAP_JSON:
+        # Nothing imported yet: keep honouring the legacy env var
+        try:
+            m = SkuMap(json.loads(settings.SKU_MAP_JSON).items(), version=version)
+        except (ValueError, AttributeError):
+            log.warning("sku_map_json_invalid")
+    log.info("sku_map_loaded", version=version, entries=len(m))
+    return m
+
+
+def get_sku_map() -> SkuMap:
+    """
+    Process-wide map, loaded once and reloaded only when the Redis version is bumped.
+    The version is checked at most every SKU_MAP_CHECK_SECONDS.
+    """
+    global _current, _checked_at
+    now = time.monotonic()
+    if _current is not None and now - _checked_at < settings.SKU_MAP_CHECK_SECONDS:
+        return _current
+    with _lock:
+        if _current is not None and now - _checked_at < settings.SKU_MAP_CHECK_SECONDS:
+            return _current
+        version = _remote_version(get_redis())
+        if _current is None or _current.version != version:
+            _current = _load(version)
+        _checked_at = now
+        return _current
+
+
+def import_pairs(pairs: Iterable[Tuple[str, str]]) -> int:
+    """Replace the whole mapping table and bump the version so every worker reloads."""
+    total = 0
+    with SessionLocal() as s:
+        s.execute(delete(SkuMapping))
+        for batch in chunked(pairs, 5_000):
+            s.execute(insert(SkuMapping), [{"shopify_sku": str(k), "bc_item_no": str(v)} for k, v in batch])
+            total += len(batch)
+        s.commit()
+    version = get_redis().incr(VERSION_KEY)
+    log.info("sku_map_imported", entries=total, version=version)
+    return total
+
+
+def import_file(path: Path) -> int:
+    """JSON object {shopify_sku: bc_item_no} or CSV with shopify_sku,bc_item_no columns."""
+    if path.suffix.lower() == ".json":
+        return import_pairs(json.loads(path.read_text(encoding="utf-8")).items())
+    with path.open(newline="", encoding="utf-8") as f:
+        return import_pairs((row["shopify_sku"], row["bc_item_no"]) for row in csv.DictReader(f))
+
+
+def mapping_count() -> int:
+    with SessionLocal() as s:
+        return s.scalar(select(func.count()).select_from(SkuMapping)) or 0
+
+
+cli = typer.Typer(help="SKU mapping store (Shopify SKU -> BC item number)")
+
+
+@cli.command("import")
+def import_cmd(path: Path) -> None:
+    """Replace the mapping from a .json or .csv file."""
+    typer.echo(f"imported {import_file(path)} mappings")
+
+
+@cli.command("import-env")
+def import_env_cmd() -> None:
+    """Copy SKU_MAP_JSON into the table."""
+    if not settings.SKU_MAP_JSON:
+        raise typer.BadParameter("SKU_MAP_JSON is not set")
+    typer.echo(f"imported {import_pairs(json.loads(settings.SKU_MAP_JSON).items())} mappings")
+
+
+@cli.command("stats")
+def stats_cmd() -> None:
+    typer.echo(f"rows={mapping_count()} version={_remote_version(get_redis())}")
+
+
+if __name__ == "__main__":
+    cli()
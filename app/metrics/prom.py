@@ -1,6 +1,6 @@
 # app/metrics/prom.py
 from fastapi import APIRouter, Response
-from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
 
 router = APIRouter()
 
@@ -24,21 +24,28 @@ if "INVENTORY_UPDATES_ATTEMPTED" not in globals():
     INVENTORY_UPDATES_ATTEMPTED = Counter(
         "inventory_updates_attempted_total",
         "Inventory update attempts",
-        ["source"]  # e.g. "bc_to_shopify"
+        ["source", "shop"]  # source e.g. "bc_to_shopify"
     )
 
 if "INVENTORY_UPDATES_SUCCEEDED" not in globals():
     INVENTORY_UPDATES_SUCCEEDED = Counter(
         "inventory_updates_succeeded_total",
         "Successful inventory level updates",
-        ["source"]
+        ["source", "shop"]
     )
 
 if "INVENTORY_UPDATES_FAILED" not in globals():
     INVENTORY_UPDATES_FAILED = Counter(
         "inventory_updates_failed_total",
         "Failed inventory level updates",
-        ["source"]
+        ["source", "shop"]
+    )
+
+if "INVENTORY_UPDATES_SKIPPED" not in globals():
+    INVENTORY_UPDATES_SKIPPED = Counter(
+        "inventory_updates_skipped_total",
+        "Inventory updates skipped because the quantity matched the last push",
+        ["source", "shop"]
     )
 
 if "INVENTORY_SYNC_LATENCY" not in globals():
@@ -47,14 +54,101 @@ if "INVENTORY_SYNC_LATENCY" not in globals():
         "Latency syncing inventory"
     )
 
+if "INVENTORY_SHARDED_SYNC_SECONDS" not in globals():
+    INVENTORY_SHARDED_SYNC_SECONDS = Histogram(
+        "inventory_sharded_sync_seconds",
+        "Wall time of a sharded inventory sync, dispatch to chord callback",
+        buckets=(5, 15, 30, 60, 120, 300, 600, 1200, 3600),
+    )
+
+if "SKU_INDEX_LOOKUPS" not in globals():
+    SKU_INDEX_LOOKUPS = Counter(
+        "shopify_sku_index_lookups_total",
+        "SKU -> variant index lookups",
+        ["result"]  # "hit" | "miss"
+    )
+
+if "SHOPIFY_RATE_LIMIT_WAIT" not in globals():
+    SHOPIFY_RATE_LIMIT_WAIT = Histogram(
+        "shopify_rate_limit_wait_seconds",
+        "Time spent waiting on the shared Shopify rate limiter",
+        ["api", "shop"],  # api: "rest" | "graphql"
+        buckets=(0, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30),
+    )
+
+# --- Reconciliation ----------------------------------------------------------
+if "RECONCILE_ACCURACY" not in globals():
+    RECONCILE_ACCURACY = Gauge(
+        "reconcile_accuracy_ratio",
+        "Share of BC items whose Shopify quantity matches (last run)",
+        ["shop"]
+    )
+
+if "RECONCILE_ROWS" not in globals():
+    RECONCILE_ROWS = Gauge(
+        "reconcile_rows",
+        "Row counts from the last reconciliation run",
+        ["kind", "shop"]  # kind: "bc" | "shopify" | "matched" | "mismatched" | "missing_in_shopify" | "missing_in_bc"
+    )
+
+if "RECONCILE_SECONDS" not in globals():
+    RECONCILE_SECONDS = Histogram(
+        "reconcile_seconds",
+        "Reconciliation run time",
+        ["mode"],
+        buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1200, 3600),
+    )
+
+if "RECONCILE_ROWS_READ" not in globals():
+    RECONCILE_ROWS_READ = Counter(
+        "reconcile_rows_read_total",
+        "Inventory rows read from BC/Shopify by reconciliation",
+        ["side", "mode"]  # side: "bc" | "shopify"; mode: "full" | "bucketed"
+    )
+
+if "RECONCILE_BUCKETS" not in globals():
+    RECONCILE_BUCKETS = Gauge(
+        "reconcile_buckets",
+        "Buckets touched by the last bucketed reconciliation run",
+        ["state"]  # "changed" | "reread"
+    )
+
+if "RECONCILE_CORRECTIONS" not in globals():
+    RECONCILE_CORRECTIONS = Counter(
+        "reconcile_corrections_queued_total",
+        "BC item numbers re-queued for inventory sync by reconciliation"
+    )
+
 # --- Example/other metrics ---------------------------------------------------
 if "WEBHOOKS_RECEIVED" not in globals():
     WEBHOOKS_RECEIVED = Counter(
         "shopify_webhooks_received_total",
         "Shopify webhooks received",
+        ["topic", "shop"]
+    )
+
+if "WEBHOOKS_DUPLICATE" not in globals():
+    WEBHOOKS_DUPLICATE = Counter(
+        "shopify_webhooks_duplicate_total",
+        "Shopify webhook redeliveries dropped by X-Shopify-Webhook-Id",
         ["topic"]
     )
 
+if "WEBHOOK_HANDLER_SECONDS" not in globals():
+    WEBHOOK_HANDLER_SECONDS = Histogram(
+        "shopify_webhook_handler_seconds",
+        "Time from request to ack in /webhooks/shopify",
+        ["topic"],
+        buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+    )
+
+if "WEBHOOK_BUFFER_EVENTS" not in globals():
+    WEBHOOK_BUFFER_EVENTS = Counter(
+        "shopify_webhook_buffer_events_total",
+        "Debounced webhook events; buffered - drained = events coalesced away",
+        ["topic", "stage"]  # stage: "buffered" | "drained"
+    )
+
 if "ORDERS_PUSHED" not in globals():
     ORDERS_PUSHED = Counter(
         "bc_orders_pushed_total",
@@ -67,12 +161,89 @@ if "ORDERS_DEDUPED" not in globals():
         "BC order deduped by externalDocumentNumber"
     )
 
+if "ORDER_LEDGER_LOOKUPS" not in globals():
+    ORDER_LEDGER_LOOKUPS = Counter(
+        "bc_order_ledger_lookups_total",
+        "Order ledger checks before pushing to BC",
+        ["result"]  # "hit" | "miss" | "bc_fallback"
+    )
+
+if "ORDER_LEDGER_VERIFICATIONS" not in globals():
+    ORDER_LEDGER_VERIFICATIONS = Counter(
+        "bc_order_ledger_verifications_total",
+        "Order ledger rows re-checked against BC",
+        ["result"]  # "verified" | "missing"
+    )
+
+if "PRODUCT_SYNC_RESULTS" not in globals():
+    PRODUCT_SYNC_RESULTS = Counter(
+        "product_sync_results_total",
+        "BC -> Shopify product sync outcomes",
+        ["result", "shop"]  # result: "created" | "updated" | "skipped"
+    )
+
+if "BC_ITEM_CACHE_HITS" not in globals():
+    BC_ITEM_CACHE_HITS = Counter(
+        "bc_item_cache_hits_total",
+        "BC item lookups served from cache",
+        ["tier"]  # "local" | "redis"
+    )
+
+if "BC_ITEM_CACHE_MISSES" not in globals():
+    BC_ITEM_CACHE_MISSES = Counter(
+        "bc_item_cache_misses_total",
+        "BC item lookups that had to go to BC"
+    )
+
+if "BC_ITEM_CACHE_EVICTIONS" not in globals():
+    BC_ITEM_CACHE_EVICTIONS = Counter(
+        "bc_item_cache_evictions_total",
+        "Entries evicted from the in-process BC item LRU"
+    )
+
+if "BC_TOKEN_CACHE" not in globals():
+    BC_TOKEN_CACHE = Counter(
+        "bc_token_cache_total",
+        "BC access token lookups by where they were served from",
+        ["result"]  # "local" | "redis" | "miss"
+    )
+
+if "BC_TOKEN_REFRESHES" not in globals():
+    BC_TOKEN_REFRESHES = Counter(
+        "bc_token_refreshes_total",
+        "Azure AD token fetches for BC",
+        ["trigger"]  # "expired" (a caller waited) | "proactive" (ahead of expiry)
+    )
+
+if "BC_TOKEN_FETCH_SECONDS" not in globals():
+    BC_TOKEN_FETCH_SECONDS = Histogram(
+        "bc_token_fetch_seconds",
+        "Latency of Azure AD token fetches for BC",
+        buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10),
+    )
+
 if "ORDER_PUSH_LATENCY" not in globals():
     ORDER_PUSH_LATENCY = Histogram(
         "bc_order_push_seconds",
         "Latency pushing order to BC"
     )
 
+# --- Outbound HTTP pools ------------------------------------------------------
+# Connection reuse ratio: 1 - rate(http_client_connections_opened_total) / rate(http_client_requests_total)
+if "HTTP_CLIENT_REQUESTS" not in globals():
+    HTTP_CLIENT_REQUESTS = Counter(
+        "http_client_requests_total",
+        "Outbound HTTP requests sent through pooled sessions",
+        ["client"]  # "bc365" | "aad"
+    )
+
+if "HTTP_CONNECTIONS_OPENED" not in globals():
+    HTTP_CONNECTIONS_OPENED = Counter(
+        "http_client_connections_opened_total",
+        "New TCP/TLS connections opened by pooled sessions",
+        ["client"]
+    )
+
 # Expose /metrics from this router
 @router.get("/metrics")
 def metrics():
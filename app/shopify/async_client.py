@@ -0,0 +1,161 @@
+# app/shopify/async_client.py
+from __future__ import annotations
+
+import asyncio
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+
+from app.core.config import settings
+from app.core.http import get_async_client
+from app.shopify.client import (
+    INVENTORY_SET_QUANTITIES,
+    ShopifyClient,
+    ShopifyGraphQLError,
+    admin_base,
+    auth_config,
+    inventory_set_result,
+    inventory_set_variables,
+    rejected_rows,
+)
+from app.shopify.rate_limit import ShopRateLimiter
+from app.utils.retry import async_retry_policy, RetryableHTTPError
+
+
+class AsyncShopifyClient:
+    """
+    httpx-based twin of ShopifyClient with the same method surface (all coroutines).
+    Shares one pooled AsyncClient per event loop and bounds in-flight requests with its
+    semaphore; rate limiting goes through the same Redis ShopRateLimiter buckets.
+    """
+
+    INVENTORY_SET_MAX = ShopifyClient.INVENTORY_SET_MAX
+    verify_webhook = staticmethod(ShopifyClient.verify_webhook)
+
+    def __init__(self, access_token: Optional[str] = None, shop_domain: Optional[str] = None) -> None:
+        self.shop = (shop_domain or settings.SHOPIFY_SHOP).rstrip("/")
+        self.version = settings.SHOPIFY_API_VERSION
+        self.base = admin_base(self.shop, self.version)
+        self.limiter = ShopRateLimiter(self.shop)
+        self.headers, basic = auth_config(access_token)
+        self.auth = httpx.BasicAuth(*basic) if basic else None
+
+    # ---------- low-level helpers ----------
+
+    async def _do(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """Single rate-limited attempt. Accepts a path or an absolute URL."""
+        url = path if path.startswith("http") else f"{self.base}{path}"
+        api = "graphql" if url.endswith("/graphql.json") else "rest"
+        if api == "rest":
+            await self.limiter.acquire_async("rest")  # GraphQL books its cost in graphql()
+        http, sem = get_async_client("shopify")
+        async with sem:
+            resp = await http.request(method, url, headers=self.headers, auth=self.auth, **kwargs)
+        if api == "rest":
+            await asyncio.to_thread(
+                self.limiter.observe_rest_header, resp.headers.get("X-Shopify-Shop-Api-Call-Limit")
+            )
+        if resp.status_code == 429:
+            await asyncio.to_thread(self.limiter.saturate, api)
+        if resp.status_code in (429, 500, 502, 503):
+            raise RetryableHTTPError(f"{resp.status_code}: {resp.text}")
+        resp.raise_for_status()
+        return resp
+
+    @async_retry_policy
+    async def _send(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """Retry for 429/5xx."""
+        return await self._do(method, path, **kwargs)
+
+    async def request(self, method: str, path: str, **kwargs) -> Dict[str, Any]:
+        """Returns parsed JSON or {}."""
+        resp = await self._send(method, path, **kwargs)
+        return resp.json() if (resp.text or "").strip() else {}
+
+    async def paginate(
+        self, path: str, key: str, params: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Yield `key` records across pages, following the Link: rel="next" cursor."""
+        next_url: Optional[str] = path
+        while next_url:
+            resp = await self._send("GET", next_url, params=params)
+            for rec in resp.json().get(key, []):
+                yield rec
+            next_url = resp.links.get("next", {}).get("url")
+            params = None  # page_info URLs already carry limit/fields
+
+    @async_retry_policy
+    async def graphql(self, query: str, variables: Optional[Dict[str, Any]] = None, cost: int = 10) -> Dict[str, Any]:
+        """POST to the Admin GraphQL endpoint and return `data`. `cost` is the estimated query cost."""
+        await self.limiter.acquire_async("graphql", cost)
+        resp = await self._do("POST", "/graphql.json", json={"query": query, "variables": variables or {}})
+        body = resp.json()
+        await asyncio.to_thread(self.limiter.observe_graphql_cost, body.get("extensions"))
+        errors = body.get("errors")
+        if errors:
+            if any((e.get("extensions") or {}).get("code") == "THROTTLED" for e in errors):
+                await asyncio.to_thread(self.limiter.saturate, "graphql")
+                raise RetryableHTTPError(f"THROTTLED: {errors}")
+            raise ShopifyGraphQLError(errors)
+        return body.get("data") or {}
+
+    # ---------- common ops ----------
+
+    async def create_product(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        return await self.request("POST", "/products.json", json={"product": payload})
+
+    async def update_product(self, product_id: int, payload: Dict[str, Any]) -> Dict[str, Any]:
+        return await self.request("PUT", f"/products/{product_id}.json", json={"product": payload})
+
+    async def find_variant_by_sku(self, sku: str) -> Optional[Dict[str, Any]]:
+        data = await self.request("GET", "/variants.json", params={"sku": sku})
+        variants = data.get("variants", [])
+        return variants[0] if variants else None
+
+    async def list_locations(self) -> List[Dict[str, Any]]:
+        data = await self.request("GET", "/locations.json")
+        return data.get("locations", [])
+
+    async def resolve_location_id(self) -> Optional[int]:
+        default = (settings.SHOPIFY_SHOP or "").strip().lower().rstrip("/")
+        if settings.SHOPIFY_LOCATION_ID and (not default or self.shop.lower() == default):
+            try:
+                return int(str(settings.SHOPIFY_LOCATION_ID).strip())
+            except ValueError:
+                pass
+        locs = await self.list_locations()
+        return int(locs[0]["id"]) if locs else None
+
+    async def get_inventory_level(self, inventory_item_id: int, location_id: int) -> Optional[int]:
+        data = await self.request("GET", "/inventory_levels.json",
+                                  params={"inventory_item_ids": int(inventory_item_id), "location_ids": int(location_id)})
+        levels = data.get("inventory_levels", [])
+        return int(levels[0]["available"]) if levels else None
+
+    async def set_inventory_level(self, inventory_item_id: int, location_id: int, available: int) -> Dict[str, Any]:
+        return await self.request(
+            "POST",
+            "/inventory_levels/set.json",
+            json={
+                "inventory_item_id": int(inventory_item_id),
+                "location_id": int(location_id),
+                "available": int(available),
+            },
+        )
+
+    async def set_inventory_levels(self, batch: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """See ShopifyClient.set_inventory_levels."""
+        if len(batch) > self.INVENTORY_SET_MAX:
+            raise ValueError(f"At most {self.INVENTORY_SET_MAX} quantities per mutation (got {len(batch)})")
+
+        pending = list(range(len(batch)))
+        failed: Dict[int, Dict[str, Any]] = {}
+        while pending:
+            data = await self.graphql(INVENTORY_SET_QUANTITIES, inventory_set_variables(batch, pending))
+            bad = rejected_rows(pending, data)
+            if not bad:
+                break
+            failed.update(bad)
+            pending = [i for i in pending if i not in bad]
+
+        return inventory_set_result(batch, failed)
@@ -0,0 +1,178 @@
+# app/shopify/bulk.py
+from __future__ import annotations
+
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+import structlog
+
+from app.core.config import settings
+from app.core.http import get_session, timeout as http_timeout
+from app.shopify.client import ShopifyClient, _gid
+from app.utils.chunk import chunked
+
+log = structlog.get_logger(__name__)
+
+STAGED_UPLOADS_CREATE = """
+mutation stagedUploadsCreate($input: [StagedUploadInput!]!) {
+  stagedUploadsCreate(input: $input) {
+    stagedTargets { url resourceUrl parameters { name value } }
+    userErrors { field message }
+  }
+}
+"""
+
+BULK_OPERATION_RUN_MUTATION = """
+mutation bulkOperationRunMutation($mutation: String!, $stagedUploadPath: String!) {
+  bulkOperationRunMutation(mutation: $mutation, stagedUploadPath: $stagedUploadPath) {
+    bulkOperation { id status }
+    userErrors { field message }
+  }
+}
+"""
+
+BULK_OPERATION_STATUS = """
+query bulkOperation($id: ID!) {
+  node(id: $id) {
+    ... on BulkOperation { id status errorCode objectCount url partialDataUrl }
+  }
+}
+"""
+
+# Run once per JSONL line by Shopify; each line is {"input": ProductSetInput}
+PRODUCT_SET = """
+mutation call($input: ProductSetInput!) {
+  productSet(input: $input) {
+    product { id variants(first: 1) { nodes { id sku inventoryItem { id } } } }
+    userErrors { field message code }
+  }
+}
+"""
+
+VARIANT_PRODUCTS = """
+query variantProducts($ids: [ID!]!) {
+  nodes(ids: $ids) { ... on ProductVariant { id product { id } } }
+}
+"""
+
+_TERMINAL = {"COMPLETED", "FAILED", "CANCELED", "EXPIRED"}
+
+
+class BulkOperationError(RuntimeError):
+    """A bulk operation could not be started or did not complete."""
+
+
+def gid_id(gid: Optional[str]) -> Optional[int]:
+    """gid://shopify/Product/123 -> 123."""
+    return int(gid.rsplit("/", 1)[1]) if gid else None
+
+
+def product_set_input(
+    payload: Dict[str, Any], product_id: Optional[int] = None, variant_id: Optional[int] = None
+) -> Dict[str, Any]:
+    """Turn a map_bc_to_shopify() payload into one productSet JSONL line."""
+    v = payload["variants"][0]
+    variant: Dict[str, Any] = {
+        "optionValues": [{"optionName": "Title", "name": "Default Title"}],
+        "sku": v["sku"],
+        "price": v["price"],
+    }
+    if variant_id:
+        variant["id"] = _gid("ProductVariant", variant_id)
+    product: Dict[str, Any] = {
+        "title": payload["title"],
+        "status": str(payload.get("status", "active")).upper(),
+        "productOptions": [{"name": "Title", "values": [{"name": "Default Title"}]}],
+        "variants": [variant],
+    }
+    if product_id:
+        product["id"] = _gid("Product", product_id)
+    return {"input": product}
+
+
+class BulkOperations:
+    """
+    Shopify bulk mutation runner:
+      1. stagedUploadsCreate -> multipart upload of the JSONL variables file
+      2. bulkOperationRunMutation against the staged path
+      3. poll the operation until it reaches a terminal status
+      4. stream the result JSONL (one line per input line, tagged with __lineNumber)
+
+    Shopify runs one bulk mutation per shop at a time.
+    """
+
+    def __init__(self, client: ShopifyClient, poll_interval: Optional[float] = None, timeout: Optional[int] = None) -> None:
+        self.client = client
+        self.poll_interval = float(poll_interval or settings.SHOPIFY_BULK_POLL_SECONDS)
+        self.timeout = int(timeout or settings.SHOPIFY_BULK_TIMEOUT_SECONDS)
+        self.http = get_session("shopify_bulk")  # staged upload + result download (not Admin API calls)
+
+    @staticmethod
+    def _check(result: Dict[str, Any], what: str) -> Dict[str, Any]:
+        errors = result.get("userErrors") or []
+        if errors:
+            raise BulkOperationError(f"{what}: {errors}")
+        return result
+
+    def stage(self, path: Path) -> str:
+        """Upload a JSONL file and return its stagedUploadPath."""
+        data = self.client.graphql(STAGED_UPLOADS_CREATE, {"input": [{
+            "resource": "BULK_MUTATION_VARIABLES",
+            "filename": path.name,
+            "mimeType": "text/jsonl",
+            "httpMethod": "POST",
+        }]})
+        target = self._check(data["stagedUploadsCreate"], "stagedUploadsCreate")["stagedTargets"][0]
+        params = {p["name"]: p["value"] for p in target["parameters"]}
+        with path.open("rb") as f:
+            r = self.http.post(target["url"], data=params, files={"file": (path.name, f, "text/jsonl")},
+                               timeout=(settings.HTTP_CONNECT_TIMEOUT, self.timeout))
+        r.raise_for_status()
+        return params["key"]
+
+    def start(self, mutation: str, staged_path: str) -> str:
+        data = self.client.graphql(BULK_OPERATION_RUN_MUTATION, {"mutation": mutation, "stagedUploadPath": staged_path})
+        op = self._check(data["bulkOperationRunMutation"], "bulkOperationRunMutation")["bulkOperation"]
+        log.info("bulk_operation_started", id=op["id"], status=op["status"])
+        return op["id"]
+
+    def wait(self, op_id: str) -> Dict[str, Any]:
+        deadline = time.monotonic() + self.timeout
+        while True:
+            op = self.client.graphql(BULK_OPERATION_STATUS, {"id": op_id}, cost=1).get("node") or {}
+            if op.get("status") in _TERMINAL:
+                log.info("bulk_operation_finished", id=op_id, status=op["status"],
+                         objects=op.get("objectCount"), error=op.get("errorCode"))
+                return op
+            if time.monotonic() > deadline:
+                raise BulkOperationError(f"bulk operation {op_id} still {op.get('status')} after {self.timeout}s")
+            time.sleep(self.poll_interval)
+
+    def iter_results(self, url: str) -> Iterator[Dict[str, Any]]:
+        with self.http.get(url, stream=True, timeout=http_timeout()) as r:
+            r.raise_for_status()
+            for line in r.iter_lines():
+                if line:
+                    yield json.loads(line)
+
+    def run(self, mutation: str, path: Path) -> Iterator[Dict[str, Any]]:
+        """Stage, run and wait; yields result lines. Partial results are yielded before failing."""
+        op = self.wait(self.start(mutation, self.stage(path)))
+        url = op.get("url") or op.get("partialDataUrl")
+        if url:
+            yield from self.iter_results(url)
+        if op["status"] != "COMPLETED":
+            raise BulkOperationError(f"bulk operation {op['id']} {op['status']}: {op.get('errorCode')}")
+
+    def variant_products(self, variant_ids: Iterable[int]) -> Dict[int, int]:
+        """variant id -> product id, 250 variants per query."""
+        out: Dict[int, int] = {}
+        for chunk in chunked(variant_ids, 250):
+            data = self.client.graphql(VARIANT_PRODUCTS, {"ids": [_gid("ProductVariant", v) for v in chunk]},
+                                       cost=len(chunk) + 1)
+            for node in data.get("nodes") or []:
+                if node and node.get("product"):
+                    out[gid_id(node["id"])] = gid_id(node["product"]["id"])
+        return out
@@ -1,73 +1,188 @@
 # app/shopify/client.py
-import time
 import base64
 import hmac
 import hashlib
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, Iterator, List, Tuple
 import requests
 
 from app.core.config import settings
+from app.shopify.rate_limit import ShopRateLimiter
 from app.utils.retry import retry_policy, RetryableHTTPError
 
 
+INVENTORY_SET_QUANTITIES = """
+mutation inventorySetQuantities($input: InventorySetQuantitiesInput!) {
+  inventorySetQuantities(input: $input) {
+    inventoryAdjustmentGroup { id }
+    userErrors { field message code }
+  }
+}
+"""
+
+
+class ShopifyGraphQLError(RuntimeError):
+    """Top-level GraphQL `errors` that are not worth retrying."""
+
+    def __init__(self, errors: List[Dict[str, Any]]) -> None:
+        super().__init__("; ".join(str(e.get("message")) for e in errors))
+        self.errors = errors
+
+
+def _gid(kind: str, id_: int) -> str:
+    return f"gid://shopify/{kind}/{int(id_)}"
+
+
+def _quantity_index(field: Optional[List[str]]) -> Optional[int]:
+    """userErrors.field looks like ["input", "quantities", "3", "locationId"]."""
+    if field and len(field) >= 3 and field[1] == "quantities":
+        try:
+            return int(field[2])
+        except ValueError:
+            return None
+    return None
+
+
+def admin_base(shop: str, version: str) -> str:
+    """Admin API root; SHOPIFY_API_BASE_URL points every shop at a local stand-in instead."""
+    origin = (settings.SHOPIFY_API_BASE_URL or f"https://{shop}").rstrip("/")
+    return f"{origin}/admin/api/{version}"
+
+
+def auth_config(access_token: Optional[str] = None) -> Tuple[Dict[str, str], Optional[Tuple[str, str]]]:
+    """(headers, basic_auth) for the Admin API; shared by the sync and async clients."""
+    # Prefer a real Admin API access token (custom app: shpat_...)
+    token = access_token or settings.SHOPIFY_ACCESS_TOKEN
+    if token:
+        # Token-based auth (recommended)
+        return {"X-Shopify-Access-Token": token, "Content-Type": "application/json"}, None
+    if settings.SHOPIFY_API_KEY and settings.SHOPIFY_API_PASSWORD:
+        # Legacy private app style basic auth
+        return {"Content-Type": "application/json"}, (settings.SHOPIFY_API_KEY, settings.SHOPIFY_API_PASSWORD)
+    raise ValueError(
+        "Missing Shopify credentials. Set SHOPIFY_ACCESS_TOKEN (Admin API access token) "
+        "or SHOPIFY_API_KEY+SHOPIFY_API_PASSWORD for legacy private-app basic auth."
+    )
+
+
+def inventory_set_variables(batch: List[Dict[str, Any]], pending: List[int]) -> Dict[str, Any]:
+    return {"input": {
+        "name": "available",
+        "reason": "correction",
+        "ignoreCompareQuantity": True,
+        "quantities": [
+            {
+                "inventoryItemId": _gid("InventoryItem", batch[i]["inventory_item_id"]),
+                "locationId": _gid("Location", batch[i]["location_id"]),
+                "quantity": int(batch[i]["available"]),
+            }
+            for i in pending
+        ],
+    }}
+
+
+def rejected_rows(pending: List[int], data: Dict[str, Any]) -> Dict[int, Dict[str, Any]]:
+    """Map inventorySetQuantities userErrors back to batch indexes."""
+    errors = (data.get("inventorySetQuantities") or {}).get("userErrors") or []
+    bad: Dict[int, Dict[str, Any]] = {}
+    for e in errors:
+        idx = _quantity_index(e.get("field"))
+        if idx is None or idx >= len(pending):
+            # Not attributable to one row: the whole remainder failed
+            return {i: e for i in pending}
+        bad[pending[idx]] = e
+    return bad
+
+
+def inventory_set_result(batch: List[Dict[str, Any]], failed: Dict[int, Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "updated": [i for i in range(len(batch)) if i not in failed],
+        "failed": [
+            {
+                "index": i,
+                "inventory_item_id": int(batch[i]["inventory_item_id"]),
+                "message": e.get("message"),
+                "code": e.get("code"),
+            }
+            for i, e in sorted(failed.items())
+        ],
+    }
+
+
 class ShopifyClient:
     """
     Minimal Shopify Admin API client with:
       - Token or basic-auth (legacy) support
-      - Light rate-limit backoff using X-Shopify-Shop-Api-Call-Limit
+      - Cluster-wide leaky-bucket rate limiting per shop (ShopRateLimiter), fed by
+        X-Shopify-Shop-Api-Call-Limit and GraphQL cost extensions
       - Retry policy for 429/5xx via @retry_policy
+      - GraphQL transport (THROTTLED errors are retried too)
     """
 
+    INVENTORY_SET_MAX = 250  # quantities per inventorySetQuantities mutation
+
     def __init__(self, access_token: Optional[str] = None, shop_domain: Optional[str] = None) -> None:
         self.shop = (shop_domain or settings.SHOPIFY_SHOP).rstrip("/")
         self.version = settings.SHOPIFY_API_VERSION
-        self.base = f"https://{self.shop}/admin/api/{self.version}"
+        self.base = admin_base(self.shop, self.version)
         self.session = requests.Session()
-
-        # Prefer a real Admin API access token (custom app: shpat_...)
-        token = access_token or settings.SHOPIFY_ACCESS_TOKEN
-
-        if token:
-            # Token-based auth (recommended)
-            self.session.headers.update({
-                "X-Shopify-Access-Token": token,
-                "Content-Type": "application/json",
-            })
-        elif settings.SHOPIFY_API_KEY and settings.SHOPIFY_API_PASSWORD:
-            # Legacy private app style basic auth
-            self.session.auth = (settings.SHOPIFY_API_KEY, settings.SHOPIFY_API_PASSWORD)
-            self.session.headers.update({"Content-Type": "application/json"})
-        else:
-            raise ValueError(
-                "Missing Shopify credentials. Set SHOPIFY_ACCESS_TOKEN (Admin API access token) "
-                "or SHOPIFY_API_KEY+SHOPIFY_API_PASSWORD for legacy private-app basic auth."
-            )
+        self.limiter = ShopRateLimiter(self.shop)
+        headers, basic = auth_config(access_token)
+        self.session.headers.update(headers)
+        if basic:
+            self.session.auth = basic
 
     # ---------- low-level helpers ----------
 
-    def _maybe_throttle(self, resp: requests.Response) -> None:
-        """If we’re >80% of the bucket, sleep a bit to avoid hitting 429s."""
-        limit = resp.headers.get("X-Shopify-Shop-Api-Call-Limit")
-        if not limit:
-            return
-        try:
-            used, bucket = map(int, limit.split("/"))
-            if bucket and (used / bucket) > 0.80:
-                time.sleep(0.5)
-        except Exception:
-            pass
-
-    @retry_policy
-    def request(self, method: str, path: str, **kwargs) -> Dict[str, Any]:
-        """Retry for 429/5xx and apply light throttling. Returns parsed JSON or {}."""
-        url = f"{self.base}{path}"
+    def _do(self, method: str, path: str, **kwargs) -> requests.Response:
+        """Single rate-limited attempt. Accepts a path or an absolute URL."""
+        url = path if path.startswith("http") else f"{self.base}{path}"
+        api = "graphql" if url.endswith("/graphql.json") else "rest"
+        if api == "rest":
+            self.limiter.acquire("rest")  # GraphQL books its cost in graphql()
         resp = self.session.request(method, url, timeout=30, **kwargs)
-        self._maybe_throttle(resp)
+        if api == "rest":
+            self.limiter.observe_rest_header(resp.headers.get("X-Shopify-Shop-Api-Call-Limit"))
+        if resp.status_code == 429:
+            self.limiter.saturate(api)
         if resp.status_code in (429, 500, 502, 503):
             raise RetryableHTTPError(f"{resp.status_code}: {resp.text}")
         resp.raise_for_status()
+        return resp
+
+    @retry_policy
+    def _send(self, method: str, path: str, **kwargs) -> requests.Response:
+        """Retry for 429/5xx."""
+        return self._do(method, path, **kwargs)
+
+    def request(self, method: str, path: str, **kwargs) -> Dict[str, Any]:
+        """Returns parsed JSON or {}."""
+        resp = self._send(method, path, **kwargs)
         return resp.json() if (resp.text or "").strip() else {}
 
+    def paginate(self, path: str, key: str, params: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """Yield `key` records across pages, following the Link: rel="next" cursor."""
+        next_url: Optional[str] = path
+        while next_url:
+            resp = self._send("GET", next_url, params=params)
+            yield from resp.json().get(key, [])
+            next_url = resp.links.get("next", {}).get("url")
+            params = None  # page_info URLs already carry limit/fields
+
+    @retry_policy
+    def graphql(self, query: str, variables: Optional[Dict[str, Any]] = None, cost: int = 10) -> Dict[str, Any]:
+        """POST to the Admin GraphQL endpoint and return `data`. `cost` is the estimated query cost."""
+        self.limiter.acquire("graphql", cost)
+        resp = self._do("POST", "/graphql.json", json={"query": query, "variables": variables or {}})
+        body = resp.json()
+        self.limiter.observe_graphql_cost(body.get("extensions"))
+        errors = body.get("errors")
+        if errors:
+            if any((e.get("extensions") or {}).get("code") == "THROTTLED" for e in errors):
+                self.limiter.saturate("graphql")
+                raise RetryableHTTPError(f"THROTTLED: {errors}")
+            raise ShopifyGraphQLError(errors)
+        return body.get("data") or {}
+
     # ---------- common ops ----------
 
     def create_product(self, payload: Dict[str, Any]) -> Dict[str, Any]:
@@ -86,7 +201,9 @@ class ShopifyClient:
         return data.get("locations", [])
 
     def resolve_location_id(self) -> Optional[int]:
-        if settings.SHOPIFY_LOCATION_ID:
+        # SHOPIFY_LOCATION_ID belongs to the env-configured shop; other shops use their first location
+        default = (settings.SHOPIFY_SHOP or "").strip().lower().rstrip("/")
+        if settings.SHOPIFY_LOCATION_ID and (not default or self.shop.lower() == default):
             try:
                 return int(str(settings.SHOPIFY_LOCATION_ID).strip())
             except ValueError:
@@ -114,6 +231,30 @@ class ShopifyClient:
             },
         )
 
+    def set_inventory_levels(self, batch: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Set `available` for up to INVENTORY_SET_MAX items in one inventorySetQuantities mutation.
+        `batch` rows use the REST keys: inventory_item_id, location_id, available.
+
+        The mutation is all-or-nothing, so when userErrors point at specific quantities those
+        rows are dropped and the rest re-sent. Returns {"updated": [idx], "failed": [{...}]}
+        with indexes into `batch`.
+        """
+        if len(batch) > self.INVENTORY_SET_MAX:
+            raise ValueError(f"At most {self.INVENTORY_SET_MAX} quantities per mutation (got {len(batch)})")
+
+        pending = list(range(len(batch)))
+        failed: Dict[int, Dict[str, Any]] = {}
+        while pending:
+            data = self.graphql(INVENTORY_SET_QUANTITIES, inventory_set_variables(batch, pending))
+            bad = rejected_rows(pending, data)
+            if not bad:
+                break
+            failed.update(bad)
+            pending = [i for i in pending if i not in bad]
+
+        return inventory_set_result(batch, failed)
+
     # ---------- webhook HMAC verify ----------
 
     @staticmethod
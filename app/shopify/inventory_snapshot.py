@@ -0,0 +1,50 @@
+# app/shopify/inventory_snapshot.py
+from __future__ import annotations
+
+import time
+from typing import Dict, Iterable, Optional
+
+import redis
+
+from app.core.config import settings
+from app.core.redis import get_redis
+
+
+class InventorySnapshot:
+    """
+    Last quantity pushed to Shopify per (shop, location, sku).
+
+    Layout:
+      invsnap:{shop}:{location_id}          -> hash sku -> qty
+      invsnap:{shop}:{location_id}:full_at  -> unix time of the last full push
+
+    Losing the snapshot is safe: every SKU then reads as "changed" and is pushed again.
+    """
+
+    def __init__(self, shop: str, location_id: int, r: Optional[redis.Redis] = None) -> None:
+        self.r = r or get_redis()
+        self.key = f"invsnap:{shop.rstrip('/')}:{int(location_id)}"
+
+    def get_many(self, skus: Iterable[str]) -> Dict[str, int]:
+        skus = list(skus)
+        if not skus:
+            return {}
+        raw = self.r.hmget(self.key, skus)
+        return {sku: int(v) for sku, v in zip(skus, raw) if v is not None}
+
+    def record(self, quantities: Dict[str, int]) -> None:
+        if quantities:
+            self.r.hset(self.key, mapping={k: int(v) for k, v in quantities.items()})
+
+    def forget(self, skus: Iterable[str]) -> None:
+        skus = list(skus)
+        if skus:
+            self.r.hdel(self.key, *skus)
+
+    def full_resync_due(self, interval: Optional[int] = None) -> bool:
+        interval = int(interval if interval is not None else settings.INVENTORY_FULL_RESYNC_SECONDS)
+        last = self.r.get(f"{self.key}:full_at")
+        return last is None or (time.time() - float(last)) >= interval
+
+    def mark_full_resync(self) -> None:
+        self.r.set(f"{self.key}:full_at", time.time())
@@ -0,0 +1,150 @@
+# app/shopify/rate_limit.py
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Optional
+
+import redis
+import structlog
+
+from app.core.config import settings
+from app.core.redis import get_redis
+from app.metrics.prom import SHOPIFY_RATE_LIMIT_WAIT
+
+log = structlog.get_logger(__name__)
+
+# Leaky bucket with reservations. Each caller adds its cost immediately and is told how
+# long to wait before sending, so concurrent callers queue up behind each other instead
+# of all retrying at once. Time comes from the Redis server so worker clocks don't matter.
+# KEYS[1] = bucket hash; ARGV = default capacity, default leak rate, cost
+_RESERVE = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local s = redis.call('HMGET', KEYS[1], 'level', 'ts', 'cap', 'rate')
+local cap = tonumber(s[3]) or tonumber(ARGV[1])
+local rate = tonumber(s[4]) or tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local level = tonumber(s[1]) or 0
+local ts = tonumber(s[2]) or now
+level = math.max(0, level - (now - ts) * rate)
+local wait = 0
+if level + cost > cap then
+  wait = (level + cost - cap) / rate
+end
+redis.call('HSET', KEYS[1], 'level', level + cost, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(cap / rate) + 60)
+return tostring(wait)
+"""
+
+# Align the bucket with what Shopify reports. Only ever raises the level: our own
+# reservations may already be ahead of the server's view.
+# KEYS[1] = bucket hash; ARGV = used, capacity, leak rate
+_OBSERVE = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local s = redis.call('HMGET', KEYS[1], 'level', 'ts')
+local cap = tonumber(ARGV[2])
+local rate = tonumber(ARGV[3])
+local level = math.max(0, (tonumber(s[1]) or 0) - (now - (tonumber(s[2]) or now)) * rate)
+local used = tonumber(ARGV[1])
+if used > level then level = used end
+redis.call('HSET', KEYS[1], 'level', level, 'ts', now, 'cap', cap, 'rate', rate)
+redis.call('EXPIRE', KEYS[1], math.ceil(cap / rate) + 60)
+return 1
+"""
+
+
+class ShopRateLimiter:
+    """
+    Cluster-wide Shopify rate limiter keyed by shop, shared by the API, workers and beat.
+
+    Two buckets per shop:
+      ratelimit:{shop}:rest     -> request count (X-Shopify-Shop-Api-Call-Limit)
+      ratelimit:{shop}:graphql  -> query cost points (extensions.cost.throttleStatus)
+
+    Redis errors fail open: the request is sent and Shopify's 429s plus @retry_policy
+    take over, as before the limiter existed.
+    """
+
+    DEFAULTS = {
+        "rest": ("SHOPIFY_REST_BUCKET_SIZE", "SHOPIFY_REST_LEAK_RATE"),
+        "graphql": ("SHOPIFY_GRAPHQL_BUCKET_SIZE", "SHOPIFY_GRAPHQL_RESTORE_RATE"),
+    }
+
+    def __init__(self, shop: str, r: Optional[redis.Redis] = None) -> None:
+        self.shop = shop.rstrip("/")
+        self.enabled = settings.SHOPIFY_RATE_LIMIT_ENABLE
+        self.r = r or (get_redis() if self.enabled else None)
+        if self.r is not None:
+            self._reserve = self.r.register_script(_RESERVE)
+            self._observe = self.r.register_script(_OBSERVE)
+
+    def _key(self, api: str) -> str:
+        return f"ratelimit:{self.shop}:{api}"
+
+    def reserve(self, api: str = "rest", cost: float = 1) -> float:
+        """Book `cost` units and return how long to wait before sending (seconds)."""
+        if not self.enabled:
+            return 0.0
+        cap_name, rate_name = self.DEFAULTS[api]
+        try:
+            return float(self._reserve(
+                keys=[self._key(api)],
+                args=[getattr(settings, cap_name), getattr(settings, rate_name), cost],
+            ))
+        except redis.RedisError as e:
+            log.warning("shopify_rate_limiter_unavailable", shop=self.shop, error=str(e))
+            return 0.0
+
+    def acquire(self, api: str = "rest", cost: float = 1) -> float:
+        wait = self.reserve(api, cost)
+        SHOPIFY_RATE_LIMIT_WAIT.labels(api=api, shop=self.shop).observe(wait)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, api: str = "rest", cost: float = 1) -> float:
+        wait = await asyncio.to_thread(self.reserve, api, cost)
+        SHOPIFY_RATE_LIMIT_WAIT.labels(api=api, shop=self.shop).observe(wait)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def observe(self, api: str, used: float, capacity: float, rate: Optional[float] = None) -> None:
+        if not self.enabled:
+            return
+        _, rate_name = self.DEFAULTS[api]
+        try:
+            self._observe(keys=[self._key(api)], args=[used, capacity, rate or getattr(settings, rate_name)])
+        except redis.RedisError as e:
+            log.warning("shopify_rate_limiter_unavailable", shop=self.shop, error=str(e))
+
+    def observe_rest_header(self, header: Optional[str]) -> None:
+        """Feed `X-Shopify-Shop-Api-Call-Limit: used/bucket`."""
+        if not header:
+            return
+        try:
+            used, bucket = map(int, header.split("/"))
+        except ValueError:
+            return
+        self.observe("rest", used, bucket)
+
+    def observe_graphql_cost(self, extensions: Optional[dict]) -> None:
+        """Feed `extensions.cost.throttleStatus` from a GraphQL response."""
+        status = ((extensions or {}).get("cost") or {}).get("throttleStatus")
+        if not status:
+            return
+        cap = float(status["maximumAvailable"])
+        self.observe("graphql", cap - float(status["currentlyAvailable"]), cap, float(status["restoreRate"]))
+
+    def saturate(self, api: str) -> None:
+        """On a 429 / THROTTLED, mark the bucket full so every process backs off."""
+        if not self.enabled:
+            return
+        cap_name, _ = self.DEFAULTS[api]
+        try:
+            cap = float(self.r.hget(self._key(api), "cap") or getattr(settings, cap_name))
+        except redis.RedisError:
+            return
+        self.observe(api, cap, cap)
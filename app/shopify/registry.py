@@ -0,0 +1,157 @@
+# app/shopify/registry.py
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import redis
+import structlog
+
+from app.core.config import settings
+from app.core.db import get_shop_token, list_shops
+from app.core.redis import get_redis
+from app.shopify.client import ShopifyClient
+
+log = structlog.get_logger(__name__)
+
+_VERSIONS_KEY = "shopreg:versions"  # hash shop -> install version, bumped on (re)install
+
+
+class ShopNotInstalled(LookupError):
+    """No stored OAuth token (and no env credentials) for this shop."""
+
+
+def normalize_shop(shop: Optional[str]) -> str:
+    domain = (shop or settings.SHOPIFY_SHOP or "").strip().lower().rstrip("/")
+    if domain.startswith("https://"):
+        domain = domain[len("https://"):]
+    if not domain:
+        raise ShopNotInstalled("No shop given and SHOPIFY_SHOP is not set")
+    return domain
+
+
+def is_default_shop(shop: str) -> bool:
+    """The env-configured SHOPIFY_SHOP (its SHOPIFY_ACCESS_TOKEN / SHOPIFY_LOCATION_ID apply only here)."""
+    return bool(settings.SHOPIFY_SHOP) and normalize_shop(shop) == normalize_shop(None)
+
+
+@dataclass
+class _Entry:
+    token: Optional[str]
+    version: Optional[str]
+    client: Optional[ShopifyClient] = None
+    location_id: Optional[int] = None
+
+
+class ShopRegistry:
+    """
+    Per-process view of the shops this deployment serves.
+
+    For each shop it caches the access token (shops table, or the env token for
+    SHOPIFY_SHOP), the resolved location id, and one ShopifyClient whose keep-alive
+    session and Redis-backed rate limiter are reused by every task in the process.
+    Each shop keeps its own Shopify rate buckets, SKU index and inventory snapshot,
+    so one storefront's backlog never spends another's budget.
+
+    Re-installs bump shopreg:versions[shop] in Redis; processes compare that hash at most
+    every SHOP_REGISTRY_CHECK_SECONDS and drop entries whose version moved.
+    """
+
+    def __init__(self, r: Optional[redis.Redis] = None) -> None:
+        self.r = r or get_redis()
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.RLock()
+        self._checked_at = 0.0
+
+    # ---------- invalidation ----------
+
+    def _remote_versions(self) -> Optional[Dict[str, str]]:
+        try:
+            return self.r.hgetall(_VERSIONS_KEY)
+        except redis.RedisError as e:
+            log.warning("shop_registry_redis_unavailable", error=str(e))
+            return None
+
+    def _check_versions(self) -> None:
+        now = time.monotonic()
+        if now - self._checked_at < settings.SHOP_REGISTRY_CHECK_SECONDS:
+            return
+        self._checked_at = now
+        remote = self._remote_versions()
+        if remote is None:
+            return
+        with self._lock:
+            for shop, entry in list(self._entries.items()):
+                if remote.get(shop) != entry.version:
+                    del self._entries[shop]
+                    log.info("shop_registry_invalidated", shop=shop)
+
+    def invalidate(self, shop: str) -> None:
+        """Forget a shop here and, via the version hash, in every other process (call after install)."""
+        shop = normalize_shop(shop)
+        with self._lock:
+            self._entries.pop(shop, None)
+        try:
+            self.r.hincrby(_VERSIONS_KEY, shop, 1)
+        except redis.RedisError as e:
+            log.warning("shop_registry_redis_unavailable", error=str(e))
+
+    # ---------- lookups ----------
+
+    def _entry(self, shop: Optional[str]) -> tuple[str, _Entry]:
+        domain = normalize_shop(shop)
+        self._check_versions()
+        with self._lock:
+            entry = self._entries.get(domain)
+            if entry is not None:
+                return domain, entry
+            versions = self._remote_versions() or {}
+            token = get_shop_token(domain)
+            if token is None and is_default_shop(domain):
+                token = settings.SHOPIFY_ACCESS_TOKEN
+                if token is None and not (settings.SHOPIFY_API_KEY and settings.SHOPIFY_API_PASSWORD):
+                    raise ShopNotInstalled(domain)
+            elif token is None:
+                raise ShopNotInstalled(domain)
+            entry = self._entries[domain] = _Entry(token=token, version=versions.get(domain))
+            return domain, entry
+
+    def token(self, shop: Optional[str] = None) -> Optional[str]:
+        return self._entry(shop)[1].token
+
+    def client(self, shop: Optional[str] = None) -> ShopifyClient:
+        domain, entry = self._entry(shop)
+        with self._lock:
+            if entry.client is None:
+                entry.client = ShopifyClient(access_token=entry.token, shop_domain=domain)
+            return entry.client
+
+    def location_id(self, shop: Optional[str] = None) -> int:
+        domain, entry = self._entry(shop)
+        if entry.location_id is None:
+            loc = self.client(domain).resolve_location_id()
+            if not loc:
+                raise RuntimeError("No Shopify location available. Set SHOPIFY_LOCATION_ID or create an active location.")
+            entry.location_id = int(loc)
+        return entry.location_id
+
+    def shops(self) -> List[str]:
+        """Installed shops plus the env-configured SHOPIFY_SHOP, if any."""
+        found = [normalize_shop(s) for s in list_shops()]
+        if settings.SHOPIFY_SHOP:
+            found.insert(0, normalize_shop(None))
+        return list(dict.fromkeys(found))
+
+
+_registry: Optional[ShopRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> ShopRegistry:
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ShopRegistry()
+        return _registry
@@ -0,0 +1,213 @@
+# app/shopify/sku_index.py
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Dict, Iterable, Optional
+
+import redis
+import structlog
+
+from app.core.config import settings
+from app.core.redis import get_redis
+from app.metrics.prom import SKU_INDEX_LOOKUPS
+from app.shopify.async_client import AsyncShopifyClient
+from app.shopify.client import ShopifyClient
+from app.utils.chunk import chunked
+
+log = structlog.get_logger(__name__)
+
+
+class SkuIndex:
+    """
+    Redis-backed SKU -> (variant_id, inventory_item_id) index for one shop.
+
+    Layout:
+      skuidx:{shop}:ver    -> current version
+      skuidx:{shop}:seq    -> version counter
+      skuidx:{shop}:{ver}  -> hash sku -> "variant_id:inventory_item_id"
+      skuidx:{shop}:{ver}:inv -> hash inventory_item_id -> sku (for inventory_levels webhooks)
+      skuidx:{shop}:{ver}:built -> SKU count, written when a rebuild finishes (also for 0 SKUs)
+
+    A rebuild writes a new versioned hash and then flips `ver`, so readers never see a
+    half-built index. Both keys carry SKU_INDEX_TTL_SECONDS; webhook updates patch the
+    live hash in place without extending it, which forces a periodic full rebuild.
+    """
+
+    def __init__(self, shop: str, r: Optional[redis.Redis] = None, ttl: Optional[int] = None) -> None:
+        self.shop = shop.rstrip("/")
+        self.r = r or get_redis()
+        self.ttl = int(ttl or settings.SKU_INDEX_TTL_SECONDS)
+        self._prefix = f"skuidx:{self.shop}"
+
+    # ---------- keys ----------
+
+    def _hash_key(self, version: str) -> str:
+        return f"{self._prefix}:{version}"
+
+    def _inv_key(self, version: str) -> str:
+        return f"{self._prefix}:{version}:inv"
+
+    def _built_key(self, version: str) -> str:
+        return f"{self._prefix}:{version}:built"
+
+    def _current(self) -> Optional[str]:
+        return self.r.get(f"{self._prefix}:ver")
+
+    @staticmethod
+    def _decode(sku: str, raw: Optional[str]) -> Optional[Dict[str, Any]]:
+        if not raw:
+            return None
+        variant_id, inv_item_id = raw.split(":", 1)
+        return {"sku": sku, "variant_id": int(variant_id), "inventory_item_id": int(inv_item_id)}
+
+    @staticmethod
+    def _entries(product: Dict[str, Any]) -> Dict[str, str]:
+        out: Dict[str, str] = {}
+        for v in product.get("variants") or []:
+            sku = (v.get("sku") or "").strip()
+            if sku and v.get("id") and v.get("inventory_item_id"):
+                out[sku] = f"{int(v['id'])}:{int(v['inventory_item_id'])}"
+        return out
+
+    @staticmethod
+    def _reverse(entries: Dict[str, str]) -> Dict[str, str]:
+        return {ref.split(":", 1)[1]: sku for sku, ref in entries.items()}
+
+    def _write(self, ver: str, entries: Dict[str, str], expire: bool = False) -> None:
+        pipe = self.r.pipeline(transaction=False)
+        pipe.hset(self._hash_key(ver), mapping=entries)
+        pipe.hset(self._inv_key(ver), mapping=self._reverse(entries))
+        if expire:
+            pipe.expire(self._hash_key(ver), self.ttl)
+            pipe.expire(self._inv_key(ver), self.ttl)
+        pipe.execute()
+
+    # ---------- reads ----------
+
+    def is_loaded(self) -> bool:
+        ver = self._current()
+        return bool(ver) and bool(self.r.exists(self._built_key(ver)))
+
+    def lookup(self, sku: str) -> Optional[Dict[str, Any]]:
+        return self.lookup_many([sku]).get(sku)
+
+    def lookup_many(self, skus: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Resolve many SKUs with one HMGET; missing SKUs are simply absent from the result."""
+        skus = list(skus)
+        ver = self._current()
+        if not ver or not skus:
+            SKU_INDEX_LOOKUPS.labels(result="miss").inc(len(skus))
+            return {}
+        raw = self.r.hmget(self._hash_key(ver), skus)
+        out = {}
+        for sku, val in zip(skus, raw):
+            ref = self._decode(sku, val)
+            if ref:
+                out[sku] = ref
+        SKU_INDEX_LOOKUPS.labels(result="hit").inc(len(out))
+        SKU_INDEX_LOOKUPS.labels(result="miss").inc(len(skus) - len(out))
+        return out
+
+    def skus_for_items(self, inventory_item_ids: Iterable[int]) -> Dict[int, str]:
+        """Reverse lookup for inventory_levels webhooks; unknown ids are absent."""
+        ids = [int(i) for i in inventory_item_ids]
+        ver = self._current()
+        if not ver or not ids:
+            return {}
+        raw = self.r.hmget(self._inv_key(ver), [str(i) for i in ids])
+        return {i: sku for i, sku in zip(ids, raw) if sku}
+
+    def resolve(self, client: ShopifyClient, sku: str) -> Optional[Dict[str, Any]]:
+        """Index lookup with a per-SKU REST fallback that writes through on success."""
+        ref = self.lookup(sku)
+        if ref:
+            return ref
+        v = client.find_variant_by_sku(sku)
+        if not v:
+            return None
+        self.put(sku, int(v["id"]), int(v["inventory_item_id"]))
+        return {"sku": sku, "variant_id": int(v["id"]), "inventory_item_id": int(v["inventory_item_id"])}
+
+    async def resolve_async(self, client: AsyncShopifyClient, sku: str) -> Optional[Dict[str, Any]]:
+        """resolve() for the async client; Redis calls run in a worker thread."""
+        ref = await asyncio.to_thread(self.lookup, sku)
+        if ref:
+            return ref
+        v = await client.find_variant_by_sku(sku)
+        if not v:
+            return None
+        await asyncio.to_thread(self.put, sku, int(v["id"]), int(v["inventory_item_id"]))
+        return {"sku": sku, "variant_id": int(v["id"]), "inventory_item_id": int(v["inventory_item_id"])}
+
+    # ---------- writes ----------
+
+    def put(self, sku: str, variant_id: int, inventory_item_id: int) -> None:
+        ver = self._current()
+        if ver:
+            self._write(ver, {sku: f"{int(variant_id)}:{int(inventory_item_id)}"})
+
+    def apply_product(self, product: Dict[str, Any]) -> int:
+        """Patch the live index from a products/update payload. No-op until the index is built."""
+        return self.apply_products([product])
+
+    def apply_products(self, products: Iterable[Dict[str, Any]]) -> int:
+        """apply_product() for a drained webhook batch, in one pipeline."""
+        entries: Dict[str, str] = {}
+        for p in products:
+            entries.update(self._entries(p))
+        ver = self._current()
+        if not ver or not entries:
+            return 0
+        self._write(ver, entries)
+        return len(entries)
+
+    def rebuild(self, client: ShopifyClient) -> int:
+        """Page the whole catalogue (250 products per call) into a fresh version and flip to it."""
+        ver = str(self.r.incr(f"{self._prefix}:seq"))
+        products = client.paginate("/products.json", "products", params={"limit": 250, "fields": "id,variants"})
+        total = 0
+        for batch in chunked(products, 250):
+            entries: Dict[str, str] = {}
+            for p in batch:
+                entries.update(self._entries(p))
+            if entries:
+                self._write(ver, entries, expire=True)
+                total += len(entries)
+
+        # Marks the version as built even for an empty catalogue, which has no hash to check
+        # for; the hashes are re-expired with it so the whole version lapses together
+        pipe = self.r.pipeline(transaction=False)
+        pipe.set(self._built_key(ver), total, ex=self.ttl)
+        pipe.expire(self._hash_key(ver), self.ttl)
+        pipe.expire(self._inv_key(ver), self.ttl)
+        pipe.execute()
+        old = self.r.set(f"{self._prefix}:ver", ver, ex=self.ttl, get=True)
+        if old and old != ver:
+            self.r.delete(self._hash_key(old), self._inv_key(old), self._built_key(old))
+        log.info("sku_index_rebuilt", shop=self.shop, version=ver, skus=total)
+        return total
+
+    def ensure_loaded(self, client: ShopifyClient) -> None:
+        """
+        Single-flight rebuild of a missing/expired index (Redis lock): concurrent callers, e.g.
+        the shards of one sync, wait for the one rebuild instead of each paging the catalogue.
+        """
+        if self.is_loaded():
+            return
+        wait = float(settings.SKU_INDEX_REBUILD_LOCK_SECONDS)
+        lock = self.r.lock(f"{self._prefix}:lock", timeout=wait, blocking_timeout=wait)
+        try:
+            acquired = lock.acquire()
+        except redis.RedisError as e:
+            log.warning("sku_index_lock_unavailable", shop=self.shop, error=str(e))
+            acquired = False
+        try:
+            # Not acquired = the holder outlived its lock: rebuild anyway rather than run without an index
+            if not self.is_loaded():
+                self.rebuild(client)
+        finally:
+            if acquired:
+                try:
+                    lock.release()
+                except redis.RedisError:
+                    pass  # expired under us; the new version is live either way
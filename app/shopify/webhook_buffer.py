@@ -0,0 +1,115 @@
+# app/shopify/webhook_buffer.py
+from __future__ import annotations
+
+import json
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import redis
+
+from app.core.config import settings
+from app.core.redis import get_redis
+from app.metrics.prom import WEBHOOK_BUFFER_EVENTS
+
+# Take members whose debounce window has closed, together with their latest payloads, and push
+# their due time out by the claim window so a concurrent drain skips them; they stay buffered
+# until ack(), so a drain that fails or dies hands them to the next one.
+# KEYS[1]=due zset  KEYS[2]=payload hash  ARGV[1]=now  ARGV[2]=limit  ARGV[3]=claimed-until
+_TAKE_DUE = """
+local members = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+if #members == 0 then
+  return {}
+end
+local payloads = redis.call('HMGET', KEYS[2], unpack(members))
+local out = {}
+for i, m in ipairs(members) do
+  redis.call('ZADD', KEYS[1], 'XX', ARGV[3], m)
+  out[#out + 1] = m
+  out[#out + 1] = payloads[i] or false
+end
+return out
+"""
+
+# Drop taken members, unless add() replaced the payload since: that newer event stays buffered
+# and is due again after a normal debounce window instead of the claim.
+# KEYS[1]=due zset  KEYS[2]=payload hash  ARGV[1]=requeue-at  ARGV[2..]=member, payload, ...
+_ACK = """
+local n = 0
+for i = 2, #ARGV, 2 do
+  local current = redis.call('HGET', KEYS[2], ARGV[i])
+  if not current or current == ARGV[i + 1] then
+    redis.call('ZREM', KEYS[1], ARGV[i])
+    redis.call('HDEL', KEYS[2], ARGV[i])
+    n = n + 1
+  else
+    redis.call('ZADD', KEYS[1], ARGV[1], ARGV[i])
+  end
+end
+return n
+"""
+
+
+BufferedEvent = Tuple[str, str, str, Dict[str, Any], str]   # topic, shop, key, payload, raw payload
+
+
+class WebhookBuffer:
+    """
+    Coalescing buffer for high-volume webhook topics.
+
+    Layout:
+      whbuf:due   -> zset "{topic}|{shop}|{key}" -> time the entry becomes drainable
+      whbuf:data  -> hash same member -> latest compact payload (JSON)
+
+    The first event for a key opens a WEBHOOK_BUFFER_DEBOUNCE_SECONDS window (ZADD NX);
+    later events inside it only replace the payload, so a bulk edit that fires the same
+    key many times drains once, and a hot key is still flushed at least once per window.
+    Draining is take_due() then ack() once applied; unacked entries come due again after
+    WEBHOOK_BUFFER_CLAIM_SECONDS.
+    """
+
+
+    DUE_KEY = "whbuf:due"
+    DATA_KEY = "whbuf:data"
+
+    def __init__(self, r: Optional[redis.Redis] = None, debounce: Optional[float] = None) -> None:
+        self.r = r or get_redis()
+        self.debounce = float(debounce if debounce is not None else settings.WEBHOOK_BUFFER_DEBOUNCE_SECONDS)
+        self.claim = float(settings.WEBHOOK_BUFFER_CLAIM_SECONDS)
+        self._take = self.r.register_script(_TAKE_DUE)
+        self._ack = self.r.register_script(_ACK)
+
+    def add(self, topic: str, shop: str, key: str, payload: Dict[str, Any]) -> None:
+        member = f"{topic}|{shop}|{key}"
+        pipe = self.r.pipeline()  # MULTI: a concurrent pop never sees the payload without its due entry
+        pipe.hset(self.DATA_KEY, member, json.dumps(payload, separators=(",", ":")))
+        pipe.zadd(self.DUE_KEY, {member: time.time() + self.debounce}, nx=True)
+        pipe.execute()
+        WEBHOOK_BUFFER_EVENTS.labels(topic=topic, stage="buffered").inc()
+
+    def take_due(self, limit: int = 1000) -> List[BufferedEvent]:
+        """Claim up to `limit` due entries as (topic, shop, key, payload, raw); ack() them once applied."""
+        now = time.time()
+        flat = self._take(keys=[self.DUE_KEY, self.DATA_KEY], args=[now, int(limit), now + self.claim])
+        out = []
+        for member, raw in zip(flat[::2], flat[1::2]):
+            topic, shop, key = member.split("|", 2)
+            if not raw:
+                self.r.zrem(self.DUE_KEY, member)   # due entry without a payload: nothing to apply
+                continue
+            out.append((topic, shop, key, json.loads(raw), raw))
+        return out
+
+    def ack(self, entries: List[BufferedEvent]) -> int:
+        """Remove applied entries; returns how many were removed (newer events are kept)."""
+        if not entries:
+            return 0
+        args: List[Any] = [time.time() + self.debounce]
+        for topic, shop, key, _, raw in entries:
+            args += [f"{topic}|{shop}|{key}", raw]
+        for topic, n in Counter(e[0] for e in entries).items():
+            WEBHOOK_BUFFER_EVENTS.labels(topic=topic, stage="drained").inc(n)
+        return int(self._ack(keys=[self.DUE_KEY, self.DATA_KEY], args=args))
+
+    def pending(self) -> int:
+        return int(self.r.zcard(self.DUE_KEY))
@@ -1,51 +1,175 @@
 # app/tasks/inventory.py
 from __future__ import annotations
 
-from typing import Dict, Any, List, Optional
+from collections import Counter, defaultdict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, Any, Iterator, List, Optional, Set, Tuple
 import json
+import time
 import requests
 import structlog
-from celery import shared_task
+from celery import chord, group, shared_task
 
-from app.bc365.client import BC365Client
-from app.shopify.client import ShopifyClient
+from app.bc365.client import BC365Client, _odata_str
 from app.core.config import settings
+from app.core.db import SessionLocal, Job
+from app.core.redis import get_redis
+from app.shopify.client import ShopifyClient, ShopifyGraphQLError
+from app.shopify.registry import get_registry
+from app.shopify.inventory_snapshot import InventorySnapshot
+from app.shopify.sku_index import SkuIndex
+from app.shopify.webhook_buffer import BufferedEvent, WebhookBuffer
+from app.core.sku_map import get_sku_map
 from app.metrics.prom import (
     INVENTORY_UPDATES_ATTEMPTED,
     INVENTORY_UPDATES_SUCCEEDED,
     INVENTORY_UPDATES_FAILED,
+    INVENTORY_UPDATES_SKIPPED,
     INVENTORY_SYNC_LATENCY,
+    INVENTORY_SHARDED_SYNC_SECONDS,
     inventory_update_seconds,
     shopify_inventory_updates_total,
 )
+from app.utils.chunk import chunked
 from app.utils.retry import RetryableHTTPError
 
 log = structlog.get_logger(__name__)
 
 
-def _reverse_sku_map() -> Dict[str, str]:
+def _bc_iter_items(
+    bc: BC365Client,
+    only_numbers: Optional[List[str]] = None,
+    number_range: Optional[List[Optional[str]]] = None,
+) -> Iterator[Dict[str, Any]]:
     """
-    Return BC ItemNo -> Shopify SKU mapping by reversing SKU_MAP_JSON if present.
-    (Original map is ShopifySKU -> BC ItemNo)
+    Stream items from BC (number + inventory). Optionally filter by ItemNo list,
+    or by a [lo, hi) item-number range (either end may be None = open).
     """
-    if not settings.SKU_MAP_JSON:
-        return {}
-    try:
-        m = json.loads(settings.SKU_MAP_JSON)
-        return {v: k for k, v in m.items()}
-    except Exception:
-        return {}
+    if only_numbers:
+        # Targeted syncs fetch just these numbers (batched `or` filters) instead of the catalogue
+        return iter(bc.find_items_by_numbers(only_numbers, select=["number", "inventory"]).values())
+    if number_range:
+        lo, hi = number_range
+        clauses = ([f"number ge '{_odata_str(lo)}'"] if lo else []) + ([f"number lt '{_odata_str(hi)}'"] if hi else [])
+        return bc.iter_items(select=["number", "inventory"], filter=" and ".join(clauses) or None)
+    return bc.iter_items(select=["number", "inventory"])
 
 
-def _bc_iter_items(bc: BC365Client, only_numbers: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+def shard_ranges(bc: BC365Client, size: int) -> List[List[Optional[str]]]:
     """
-    Fetch items from BC (number + inventory). Optionally filter by ItemNo list.
+    Cut the BC item catalogue into [lo, hi) number ranges of about `size` items.
+    Boundaries come from BC's own key order (a number-only stream), so each shard's
+    range filter is evaluated with the same collation that produced it.
     """
-    items = bc.list_items_select(fields=["number", "inventory"])  # implement in BC client if not present
-    if only_numbers:
-        only = set(only_numbers)
-        return [i for i in items if i.get("number") in only]
-    return items
+    bounds: List[Optional[str]] = [None]
+    for n, it in enumerate(bc.iter_items(select=["number"])):
+        if n and n % size == 0:
+            bounds.append(str(it.get("number")))
+    bounds.append(None)
+    return [[lo, hi] for lo, hi in zip(bounds, bounds[1:])]
+
+
+def cached_shard_ranges(bc: BC365Client, size: int, refresh: bool = False) -> List[List[Optional[str]]]:
+    """
+    shard_ranges() kept in Redis and re-cut only when `refresh` is set (full-resync runs) or
+    nothing is cached, so a 5-minute run does not stream every item number just to split
+    the catalogue. Stale boundaries still cover everything (the outer ranges are open);
+    new items only make shards uneven until the next cut.
+    """
+    r = get_redis()
+    key = f"invshards:{size}"
+    if not refresh:
+        raw = r.get(key)
+        if raw:
+            return json.loads(raw)
+    ranges = shard_ranges(bc, size)
+    r.set(key, json.dumps(ranges))
+    return ranges
+
+
+def _push_batch(
+    shop: ShopifyClient,
+    index: SkuIndex,
+    snapshot: InventorySnapshot,
+    loc_id: int,
+    rows: List[Tuple[str, str, int]],
+    full: bool,
+    source: str,
+) -> Counter:
+    """
+    Diff, resolve and write one batch of (bc_no, sku, qty) rows.
+    Returns attempted/updated/failed/skipped counts; safe to run on several threads at once.
+    """
+    counts: Counter = Counter()
+
+    # Diff stage: drop rows whose quantity matches what we last pushed
+    if not full:
+        last = snapshot.get_many(sku for _, sku, _ in rows)
+        changed = [r for r in rows if last.get(r[1]) != r[2]]
+        counts["skipped"] += len(rows) - len(changed)
+        INVENTORY_UPDATES_SKIPPED.labels(source=source, shop=shop.shop).inc(len(rows) - len(changed))
+        rows = changed
+    if not rows:
+        return counts
+
+    refs = index.lookup_many(sku for _, sku, _ in rows)
+    writes = []
+    for bc_no, sku, qty in rows:
+        counts["attempted"] += 1
+        INVENTORY_UPDATES_ATTEMPTED.labels(source=source, shop=shop.shop).inc()
+        v = refs.get(sku)
+        if not v:
+            log.warning("shopify_variant_not_found", sku=sku, bc_number=bc_no)
+            INVENTORY_UPDATES_FAILED.labels(source=source, shop=shop.shop).inc()
+            counts["failed"] += 1
+            continue
+        writes.append((bc_no, sku, qty, int(v["inventory_item_id"])))
+
+    pushed: Dict[str, int] = {}
+    try:
+        for chunk in chunked(writes, ShopifyClient.INVENTORY_SET_MAX):
+            payload = [
+                {"inventory_item_id": inv_item_id, "location_id": int(loc_id), "available": qty}
+                for _, _, qty, inv_item_id in chunk
+            ]
+            try:
+                # Time each Shopify batch write
+                with inventory_update_seconds.time():
+                    res = shop.set_inventory_levels(payload)
+            except requests.HTTPError as e:
+                log.error(
+                    "inventory_update_http_error",
+                    batch_size=len(chunk),
+                    status=getattr(e.response, "status_code", None),
+                    body=getattr(e.response, "text", None),
+                )
+                # Let Celery retry via autoretry_for
+                raise
+            except ShopifyGraphQLError as e:
+                log.error("inventory_update_graphql_error", batch_size=len(chunk), errors=e.errors)
+                INVENTORY_UPDATES_FAILED.labels(source=source, shop=shop.shop).inc(len(chunk))
+                counts["failed"] += len(chunk)
+                continue
+
+            for i in res["updated"]:
+                _, sku, qty, _ = chunk[i]
+                pushed[sku] = qty
+            for f in res["failed"]:
+                bc_no, sku, qty, _ = chunk[f["index"]]
+                log.warning("inventory_update_rejected", sku=sku, bc_number=bc_no, qty=qty,
+                            message=f["message"], code=f["code"])
+
+            shopify_inventory_updates_total.inc(len(res["updated"]))
+            INVENTORY_UPDATES_SUCCEEDED.labels(source=source, shop=shop.shop).inc(len(res["updated"]))
+            INVENTORY_UPDATES_FAILED.labels(source=source, shop=shop.shop).inc(len(res["failed"]))
+            counts["updated"] += len(res["updated"])
+            counts["failed"] += len(res["failed"])
+            log.info("inventory_batch_set", location_id=loc_id,
+                     updated=len(res["updated"]), failed=len(res["failed"]))
+    finally:
+        # Keep what already landed so a retry does not push it again
+        snapshot.record(pushed)
+    return counts
 
 
 @shared_task(
@@ -55,68 +179,156 @@ def _bc_iter_items(bc: BC365Client, only_numbers: Optional[List[str]] = None) ->
     retry_backoff_max=30,
     retry_jitter=True,
 )
-def sync_inventory_levels(self, item_numbers: Optional[List[str]] = None) -> Dict[str, Any]:
+def sync_inventory_levels(
+    self,
+    item_numbers: Optional[List[str]] = None,
+    force_full: bool = False,
+    number_range: Optional[List[Optional[str]]] = None,
+    shop_domain: Optional[str] = None,
+) -> Dict[str, Any]:
     """
     Sync BC item inventory -> Shopify inventory levels by SKU.
-    - Matches on Shopify Variant SKU == BC Item Number (or reversed via SKU_MAP_JSON)
-    - Uses SHOPIFY_LOCATION_ID if provided, otherwise first active location
+    - Matches on Shopify Variant SKU == BC Item Number (or reversed via the SKU mapping store)
+    - Resolves SKUs through the shared SkuIndex (one HMGET per batch, no per-SKU REST lookup)
+    - Writes in batches of up to 250 via GraphQL inventorySetQuantities
+    - Only pushes quantities that differ from the last-pushed InventorySnapshot, except on a
+      full resync (force_full, or every INVENTORY_FULL_RESYNC_SECONDS for whole-catalogue runs)
+    - Keeps up to INVENTORY_SYNC_CONCURRENCY batches in flight while BC is still streaming;
+      the shared ShopRateLimiter paces them against the shop's bucket
+    - Uses SHOPIFY_LOCATION_ID if provided (default shop only), otherwise first active location
+    - number_range=[lo, hi) limits the run to one shard of sync_inventory_sharded
+    - shop_domain picks the shop from the registry (default: SHOPIFY_SHOP)
     """
     with INVENTORY_SYNC_LATENCY.time():
         bc = BC365Client()
-        shop = ShopifyClient()
+        registry = get_registry()
+        shop = registry.client(shop_domain)
         source = "bc_to_shopify"
 
-        rev_map = _reverse_sku_map()  # BC -> Shopify
-        loc_id = shop.resolve_location_id()
-        if not loc_id:
-            raise RuntimeError("No Shopify location available. Set SHOPIFY_LOCATION_ID or create an active location.")
+        sku_map = get_sku_map()  # compiled once per worker, reloaded on version bump
+        loc_id = registry.location_id(shop_domain)
 
-        updated, failed = 0, 0
-        items = _bc_iter_items(bc, only_numbers=item_numbers)
+        index = SkuIndex(shop.shop)
+        index.ensure_loaded(shop)
+        snapshot = InventorySnapshot(shop.shop, int(loc_id))
+        whole = not item_numbers and not number_range
+        full = force_full or (whole and snapshot.full_resync_due())
 
-        for it in items:
-            bc_no = str(it.get("number"))
-            # Fall back to same value when no map
-            sku = rev_map.get(bc_no, bc_no)
+        totals: Counter = Counter()
+        width = max(1, int(settings.INVENTORY_SYNC_CONCURRENCY))
+        items = _bc_iter_items(bc, only_numbers=item_numbers, number_range=number_range)
 
-            INVENTORY_UPDATES_ATTEMPTED.labels(source=source).inc()
-            try:
-                v = shop.find_variant_by_sku(sku)
-                if not v:
-                    log.warning("shopify_variant_not_found", sku=sku, bc_number=bc_no)
-                    INVENTORY_UPDATES_FAILED.labels(source=source).inc()
-                    failed += 1
-                    continue
+        with ThreadPoolExecutor(max_workers=width, thread_name_prefix="inventory-push") as pool:
+            inflight: Set[Future] = set()
+            for batch in chunked(items, ShopifyClient.INVENTORY_SET_MAX):
+                # Fall back to same value when no map
+                rows = []
+                for it in batch:
+                    bc_no = str(it.get("number"))
+                    rows.append((bc_no, sku_map.to_shopify(bc_no), int(float(it.get("inventory", 0) or 0))))
 
-                inv_item_id = int(v["inventory_item_id"])
-                qty = int(float(it.get("inventory", 0) or 0))
+                # Bound the backlog so a fast BC stream cannot queue the whole catalogue in memory
+                if len(inflight) >= width:
+                    done, inflight = wait(inflight, return_when=FIRST_COMPLETED)
+                    for f in done:
+                        totals.update(f.result())  # re-raises HTTPError -> Celery retry
+                inflight.add(pool.submit(_push_batch, shop, index, snapshot, int(loc_id), rows, full, source))
+            for f in inflight:
+                totals.update(f.result())
 
-                # Time each Shopify update
-                with inventory_update_seconds.time():
-                    shop.set_inventory_level(inv_item_id, int(loc_id), qty)
+        if full and whole:
+            snapshot.mark_full_resync()
 
-                shopify_inventory_updates_total.inc()
-                log.info("inventory_set", sku=sku, bc_number=bc_no, location_id=loc_id, qty=qty)
+        return {
+            "attempted": totals["attempted"],
+            "updated": totals["updated"],
+            "failed": totals["failed"],
+            "skipped": totals["skipped"],
+            "full": full,
+        }
 
-                INVENTORY_UPDATES_SUCCEEDED.labels(source=source).inc()
-                updated += 1
 
-            except requests.HTTPError as e:
-                log.error(
-                    "inventory_update_http_error",
-                    sku=sku,
-                    bc_number=bc_no,
-                    status=getattr(e.response, "status_code", None),
-                    body=getattr(e.response, "text", None),
-                )
-                # Let Celery retry via autoretry_for
-                raise
-            except Exception:
-                log.exception("inventory_update_error", sku=sku, bc_number=bc_no)
-                INVENTORY_UPDATES_FAILED.labels(source=source).inc()
-                failed += 1
+@shared_task(name="app.tasks.inventory.sync_inventory_sharded")
+def sync_inventory_sharded(
+    force_full: bool = False,
+    shard_size: Optional[int] = None,
+    shop_domain: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Fan a whole-catalogue sync out over the worker pool: split BC item numbers into
+    ranges of INVENTORY_SHARD_SIZE (re-cut on full resyncs, cached in between), run one
+    sync_inventory_levels per range as a group, and merge the shard results in a chord
+    callback (merge_inventory_shards).
+    Throughput then scales with worker replicas; Shopify writes stay paced by the
+    shared rate limiter.
+    """
+    bc = BC365Client()
+    registry = get_registry()
+    shop = registry.client(shop_domain)
+    snapshot = InventorySnapshot(shop.shop, registry.location_id(shop_domain))
+    # Decided once here so every shard runs in the same mode
+    full = force_full or snapshot.full_resync_due()
+    # Warm the SKU index before the fan-out so shards never start on a cold one
+    SkuIndex(shop.shop).ensure_loaded(shop)
+
+    ranges = cached_shard_ranges(bc, max(1, int(shard_size or settings.INVENTORY_SHARD_SIZE)), refresh=full)
+    with SessionLocal() as s:
+        job = Job(type="inventory_sync", status="running",
+                  detail=json.dumps({"shop": shop.shop, "shards": len(ranges), "full": full}))
+        s.add(job)
+        s.commit()
+        job_id = job.id
+
+    header = group(
+        sync_inventory_levels.s(force_full=full, number_range=r, shop_domain=shop.shop) for r in ranges
+    )
+    callback = merge_inventory_shards.s(job_id=job_id, started=time.time(), full=full, shop_domain=shop.shop)
+    chord(header)(callback.on_error(fail_inventory_job.s(job_id=job_id)))
+    log.info("inventory_sync_sharded", job_id=job_id, shop=shop.shop, shards=len(ranges), full=full)
+    return {"job_id": job_id, "shop": shop.shop, "shards": len(ranges), "full": full}
 
-        return {"attempted": len(items), "updated": updated, "failed": failed}
+
+@shared_task(name="app.tasks.inventory.merge_inventory_shards")
+def merge_inventory_shards(
+    results: List[Dict[str, Any]],
+    job_id: int,
+    started: float,
+    full: bool,
+    shop_domain: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Chord callback: total the shard results and close the Job row."""
+    totals: Counter = Counter()
+    for r in results:
+        totals.update({k: r.get(k, 0) for k in ("attempted", "updated", "failed", "skipped")})
+    duration = time.time() - started
+    INVENTORY_SHARDED_SYNC_SECONDS.observe(duration)
+
+    if full:
+        registry = get_registry()
+        InventorySnapshot(registry.client(shop_domain).shop, registry.location_id(shop_domain)).mark_full_resync()
+
+    out = {**{k: totals[k] for k in ("attempted", "updated", "failed", "skipped")},
+           "shards": len(results), "full": full, "seconds": round(duration, 3)}
+    _finish_job(job_id, "done", out)
+    log.info("inventory_sync_sharded_done", job_id=job_id, **out)
+    return out
+
+
+@shared_task(name="app.tasks.inventory.fail_inventory_job")
+def fail_inventory_job(*args: Any, job_id: int) -> None:
+    """Chord errback: a shard failed after its retries, so the merge never runs."""
+    exc = args[1] if len(args) > 1 else None
+    _finish_job(job_id, "failed", {"error": str(exc)[:1000]})
+
+
+def _finish_job(job_id: int, status: str, detail: Dict[str, Any]) -> None:
+    with SessionLocal() as s:
+        job = s.get(Job, job_id)
+        if job is None:
+            return
+        job.status = status
+        job.detail = json.dumps(detail)[:2048]
+        s.commit()
 
 
 @shared_task(
@@ -126,18 +338,19 @@ def sync_inventory_levels(self, item_numbers: Optional[List[str]] = None) -> Dic
     # (optional but nice) give it a stable, explicit name:
     name="app.tasks.inventory.set_inventory_for_sku",
 )
-def set_inventory_for_sku(self, sku: str, available: int, location_id: int | None = None) -> dict:
+def set_inventory_for_sku(
+    self, sku: str, available: int, location_id: int | None = None, shop_domain: str | None = None
+) -> dict:
     """
     Set a single variant's available inventory in Shopify for a given SKU.
     """
-    s = ShopifyClient()
-    v = s.find_variant_by_sku(sku)
+    registry = get_registry()
+    s = registry.client(shop_domain)
+    v = SkuIndex(s.shop).resolve(s, sku)
     if not v:
         return {"sku": sku, "status": "variant_not_found"}
 
-    loc_id = location_id or s.resolve_location_id()
-    if not loc_id:
-        raise ValueError("No location found. Set SHOPIFY_LOCATION_ID or create a location.")
+    loc_id = location_id or registry.location_id(shop_domain)
 
     inv_item_id = int(v["inventory_item_id"])
 
@@ -146,6 +359,7 @@ def set_inventory_for_sku(self, sku: str, available: int, location_id: int | Non
             resp = s.set_inventory_level(inv_item_id, int(loc_id), int(available))
 
         shopify_inventory_updates_total.inc()
+        InventorySnapshot(s.shop, int(loc_id)).record({sku: int(available)})
 
         return {
             "sku": sku,
@@ -157,3 +371,97 @@ def set_inventory_for_sku(self, sku: str, available: int, location_id: int | Non
     except requests.HTTPError:
         # Allow Celery retry via autoretry_for
         raise
+
+
+@shared_task(name="app.tasks.inventory.refresh_sku_index")
+def refresh_sku_index(shop_domain: str | None = None) -> dict:
+    """
+    Rebuild the Shopify SKU index from the full catalogue.
+    """
+    s = get_registry().client(shop_domain)
+    total = SkuIndex(s.shop).rebuild(s)
+    return {"shop": s.shop, "skus": total}
+
+
+def _apply_level_events(shop: str, events: List[Dict[str, Any]]) -> List[str]:
+    """
+    Return the BC numbers whose Shopify quantity at the synced location drifted above BC.
+
+    Our own pushes echo back unchanged. Anything else is checked against BC: a quantity BC
+    agrees with goes into the snapshot; one below BC is what a storefront sale looks like
+    until its order reaches BC, so it is left alone (and out of the snapshot) for the order
+    push and the regular diff to settle, instead of writing the old quantity back.
+    """
+    loc_id = int(get_registry().location_id(shop))
+    skus = SkuIndex(shop).skus_for_items(int(e["inventory_item_id"]) for e in events if e.get("inventory_item_id"))
+    quantities: Dict[str, int] = {}
+    for e in events:
+        sku = skus.get(int(e.get("inventory_item_id") or 0))
+        if sku is None or e.get("available") is None or int(e.get("location_id") or 0) != loc_id:
+            continue
+        quantities[sku] = int(e["available"])
+
+    snapshot = InventorySnapshot(shop, loc_id)
+    last = snapshot.get_many(quantities)
+    moved = {sku: qty for sku, qty in quantities.items() if last.get(sku) != qty}
+    if not moved:
+        return []
+
+    sku_map = get_sku_map()
+    numbers = {sku: sku_map.to_bc(sku) for sku in moved}
+    bc_items = BC365Client().find_items_by_numbers(list(numbers.values()), select=["number", "inventory"])
+    agreed: Dict[str, int] = {}
+    drifted: List[str] = []
+    for sku, qty in moved.items():
+        item = bc_items.get(numbers[sku])
+        if item is None:
+            continue
+        bc_qty = int(float(item.get("inventory", 0) or 0))
+        if qty == bc_qty:
+            agreed[sku] = qty
+        elif qty > bc_qty:
+            drifted.append(sku)
+    snapshot.record(agreed)
+    # The snapshot still holds BC's quantity for drifted SKUs; cleared so the targeted sync's
+    # diff stage actually sends it (as reconciliation does for its corrections)
+    snapshot.forget(drifted)
+    return list(dict.fromkeys(numbers[sku] for sku in drifted))
+
+
+@shared_task(name="app.tasks.inventory.drain_webhook_buffer")
+def drain_webhook_buffer(max_batches: int = 10) -> dict:
+    """
+    Apply coalesced products/update and inventory_levels/update webhooks:
+    product variants patch the SKU index in one pipeline per shop, and inventory items
+    that drifted above BC on the Shopify side get a targeted BC -> Shopify sync.
+    """
+    buf = WebhookBuffer()
+    limit = settings.WEBHOOK_BUFFER_DRAIN_BATCH
+    taken: List[BufferedEvent] = []
+    products: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    levels: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for _ in range(max_batches):
+        batch = buf.take_due(limit)
+        for topic, shop, _, payload, _ in batch:
+            if topic == "products/update":
+                products[shop].append(payload)
+            elif topic == "inventory_levels/update":
+                levels[shop].append(payload)
+        taken += batch
+        if len(batch) < limit:
+            break
+
+    # Entries leave the buffer only once applied: if anything below raises, they come due
+    # again after the claim window and the next drain retries them
+    indexed = sum(SkuIndex(shop).apply_products(ps) for shop, ps in products.items())
+    queued = 0
+    for shop, events in levels.items():
+        for chunk in chunked(_apply_level_events(shop, events), 500):
+            sync_inventory_levels.delay(item_numbers=chunk, shop_domain=shop)
+            queued += len(chunk)
+    buf.ack(taken)
+    drained = len(taken)
+
+    if drained:
+        log.info("webhook_buffer_drained", drained=drained, skus_indexed=indexed, items_queued=queued)
+    return {"drained": drained, "skus_indexed": indexed, "items_queued": queued}
@@ -0,0 +1,40 @@
+from typing import Dict, Any, Optional
+import structlog
+from celery import current_app, shared_task
+from app.bc365.client import token_store
+from app.core.config import settings
+from app.core.db import prune_jobs
+from app.shopify.registry import get_registry
+from app.utils import idempotency
+
+log = structlog.get_logger(__name__)
+
+@shared_task(name="app.tasks.maintenance.prune_idempotency_keys")
+def prune_idempotency_keys() -> Dict[str, Any]:
+    """Daily retention pass: idempotency keys, and the Job rows every sharded sync run writes."""
+    removed = idempotency.prune()
+    jobs_removed = prune_jobs(settings.JOB_RETENTION_DAYS)
+    log.info("idempotency_keys_pruned", removed=removed, jobs_removed=jobs_removed)
+    return {"removed": removed, "jobs_removed": jobs_removed}
+
+@shared_task(name="app.tasks.maintenance.flush_idempotency_keys")
+def flush_idempotency_keys() -> Dict[str, Any]:
+    """Persist keys the webhook handler claimed in Redis, off the ack path."""
+    flushed = idempotency.flush_pending()
+    if flushed:
+        log.info("idempotency_keys_flushed", flushed=flushed)
+    return {"flushed": flushed}
+
+@shared_task(name="app.tasks.maintenance.refresh_bc_token")
+def refresh_bc_token() -> Dict[str, Any]:
+    """Keep the shared BC token warm so no request ever waits on AAD, even after idle periods."""
+    return {"refreshed": token_store().refresh_if_due()}
+
+@shared_task(name="app.tasks.maintenance.dispatch_per_shop")
+def dispatch_per_shop(task: str, kwargs: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Beat entry point for shop-scoped jobs: one `task` per registered shop, with shop_domain set."""
+    shops = get_registry().shops()
+    for shop in shops:
+        current_app.signature(task, kwargs={**(kwargs or {}), "shop_domain": shop}).delay()
+    log.info("dispatched_per_shop", task=task, shops=len(shops))
+    return {"task": task, "shops": shops}
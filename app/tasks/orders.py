@@ -1,12 +1,32 @@
+from datetime import datetime, timedelta, timezone
 from typing import Dict, Any, List
-import structlog, json, requests
+import structlog, requests
 from celery import shared_task
+from sqlalchemy import and_, func, or_, select
 from app.bc365.client import BC365Client
 from app.core.config import settings
-from app.metrics.prom import ORDERS_PUSHED, ORDERS_DEDUPED, ORDER_PUSH_LATENCY
+from app.core.db import SessionLocal, OrderLedger, get_order_entry, record_order
+from app.core.sku_map import get_sku_map
+from app.metrics.prom import (
+    ORDERS_PUSHED, ORDERS_DEDUPED, ORDER_PUSH_LATENCY, ORDER_LEDGER_LOOKUPS, ORDER_LEDGER_VERIFICATIONS,
+)
+from app.utils import idempotency
 
 log = structlog.get_logger(__name__)
 
+# The only order fields _map_shopify_to_bc reads; webhooks enqueue just these
+_ORDER_LINE_FIELDS = ("sku", "variant_id", "product_id", "quantity", "price", "title")
+
+def compact_order(order: Dict[str, Any]) -> Dict[str, Any]:
+    """Strip a Shopify order webhook down to what push_order_to_bc365 needs."""
+    return {
+        "id": order.get("id"),
+        "line_items": [
+            {k: li[k] for k in _ORDER_LINE_FIELDS if li.get(k) is not None}
+            for li in order.get("line_items") or []
+        ],
+    }
+
 @shared_task(
     bind=True,
     autoretry_for=(requests.HTTPError,),
@@ -17,44 +37,117 @@ def push_order_to_bc365(self, order_payload: Dict[str, Any]) -> Dict[str, Any]:
 
     raw_ext = str(order_payload.get("id", ""))
     ext_no = raw_ext[:35] if raw_ext else ""        # <-- trim BEFORE find
-    if ext_no:
-        existing = bc.find_sales_order_by_external_no(ext_no)
-        if existing:
-            ORDERS_DEDUPED.inc()
-            log.info("order_already_exists",
-                    bc_id=existing.get("id"), bc_no=existing.get("number"), ext_no=ext_no)
-            return {"bc_id": existing.get("id"), "bc_no": existing.get("number"), "deduped": True}
+    # In-flight lease, not a permanent claim: a redelivered task (worker killed mid-push) must
+    # still reach the ledger/BC checks below and push once the dead attempt's lease runs out
+    lease = f"bc-order-lease:{ext_no}" if ext_no else None
+    leased = bool(lease) and idempotency.acquire_lease(lease, settings.ORDER_PUSH_LEASE_SECONDS)
+
+    try:
+        if ext_no:
+            entry = get_order_entry(ext_no)
+            if entry and entry.status in ("pushed", "existing"):
+                ORDERS_DEDUPED.inc()
+                ORDER_LEDGER_LOOKUPS.labels(result="hit").inc()
+                log.info("order_in_ledger", bc_id=entry.bc_id, bc_no=entry.bc_number, ext_no=ext_no)
+                return {"bc_id": entry.bc_id, "bc_no": entry.bc_number, "deduped": True}
+
+            # BC is only asked when a previous attempt may have landed (pending row) or when
+            # the ledger cannot be trusted yet
+            if entry or settings.ORDER_LEDGER_BC_FALLBACK:
+                ORDER_LEDGER_LOOKUPS.labels(result="bc_fallback").inc()
+                existing = bc.find_sales_order_by_external_no(ext_no)
+                if existing:
+                    ORDERS_DEDUPED.inc()
+                    record_order(ext_no, shopify_order_id=raw_ext, status="existing",
+                                 bc_id=existing.get("id"), bc_number=existing.get("number"), verified=True)
+                    log.info("order_already_exists",
+                            bc_id=existing.get("id"), bc_no=existing.get("number"), ext_no=ext_no)
+                    return {"bc_id": existing.get("id"), "bc_no": existing.get("number"), "deduped": True}
+            else:
+                ORDER_LEDGER_LOOKUPS.labels(result="miss").inc()
+
+            if not leased:
+                # Another attempt is pushing right now, or died mid-push: look again once its lease expired
+                log.info("order_push_in_flight", ext_no=ext_no)
+                raise self.retry(countdown=settings.ORDER_PUSH_LEASE_SECONDS)
 
-    body = _map_shopify_to_bc(order_payload, bc, ext_no=ext_no)
+        body = _map_shopify_to_bc(order_payload, bc, ext_no=ext_no)
 
-    with ORDER_PUSH_LATENCY.time():
-        result = bc.push_order(body)
+        if ext_no:
+            record_order(ext_no, shopify_order_id=raw_ext, status="pending")
+        with ORDER_PUSH_LATENCY.time():
+            result = bc.push_order(body)
+    except Exception:
+        # Free the lease so Celery's retry runs now; the pending ledger row sends it to BC first
+        if leased:
+            idempotency.release_lease(lease)
+        raise
     ORDERS_PUSHED.inc()
+    if ext_no:
+        record_order(ext_no, shopify_order_id=raw_ext, status="pushed",
+                     bc_id=result.get("id"), bc_number=result.get("number"))
 
     log.info("order_pushed",
              shopify_id=order_payload.get("id"),
              bc_id=result.get("id"), bc_no=result.get("number"))
     return {"bc_id": result.get("id"), "bc_no": result.get("number")}
 
+@shared_task(name="app.tasks.orders.verify_order_ledger")
+def verify_order_ledger(limit: int | None = None) -> Dict[str, Any]:
+    """
+    Re-check the stalest ledger rows against BC: confirms pushed orders, resolves
+    pending rows left by crashed attempts and flags orders BC no longer has.
+    """
+    bc = BC365Client()
+    now = datetime.now(timezone.utc)
+    last_checked = func.coalesce(OrderLedger.verified_at, OrderLedger.created_at)
+    with SessionLocal() as s:
+        rows = s.scalars(
+            select(OrderLedger)
+            .where(or_(
+                last_checked < now - timedelta(days=settings.ORDER_LEDGER_VERIFY_DAYS),
+                # a push that never finished: retries gave up or the worker died
+                and_(OrderLedger.status == "pending", OrderLedger.updated_at < now - timedelta(hours=1)),
+            ))
+            .order_by(last_checked)
+            .limit(limit or settings.ORDER_LEDGER_VERIFY_BATCH)
+        ).all()
+
+    counts = {"verified": 0, "missing": 0}
+    for row in rows:
+        found = bc.find_sales_order_by_external_no(row.ext_no)
+        if found:
+            status = "existing" if row.status in ("pending", "missing") else row.status
+            record_order(row.ext_no, shopify_order_id=row.shopify_order_id, status=status,
+                         bc_id=found.get("id"), bc_number=found.get("number"), verified=True)
+            ORDER_LEDGER_VERIFICATIONS.labels(result="verified").inc()
+            counts["verified"] += 1
+        else:
+            log.warning("order_ledger_missing_in_bc", ext_no=row.ext_no, status=row.status, bc_id=row.bc_id)
+            record_order(row.ext_no, shopify_order_id=row.shopify_order_id, status="missing", verified=True)
+            ORDER_LEDGER_VERIFICATIONS.labels(result="missing").inc()
+            counts["missing"] += 1
+    log.info("order_ledger_verified", **counts)
+    return counts
+
 def _map_shopify_to_bc(order: Dict[str, Any], bc: BC365Client, *, ext_no: str) -> Dict[str, Any]:
     cust_no = settings.BC365_DEFAULT_CUSTOMER or "10000"
 
-    sku_map = {}
-    if settings.SKU_MAP_JSON:
-        try:
-            sku_map = json.loads(settings.SKU_MAP_JSON)
-            log.info("sku_map_loaded", sku_map=sku_map)
-        except Exception:
-            pass
+    sku_map = get_sku_map()
 
-    lines: List[Dict[str, Any]] = []
+    wanted = []
     for li in order.get("line_items", []):
         raw_sku = li.get("sku") or (li.get("variant_id") and str(li["variant_id"])) or (li.get("product_id") and str(li["product_id"]))
         if not raw_sku:
             continue
-        sku = sku_map.get(raw_sku, raw_sku)
+        wanted.append((li, raw_sku, sku_map.to_bc(raw_sku)))
 
-        item = bc.find_item_by_number(sku)
+    # One batched BC lookup for every SKU on the order instead of one per line
+    items = bc.find_items_by_numbers([sku for _, _, sku in wanted])
+
+    lines: List[Dict[str, Any]] = []
+    for li, raw_sku, sku in wanted:
+        item = items.get(sku)
         if not item:
             log.warning("bc_item_not_found", sku=raw_sku, mapped_to=sku, title=li.get("title"))
             continue
@@ -1,41 +1,199 @@
-from typing import Dict, Any
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+import hashlib
+import json
+import tempfile
 import structlog
 from celery import shared_task
+from sqlalchemy import select
+from app.shopify.bulk import PRODUCT_SET, BulkOperations, gid_id, product_set_input
 from app.shopify.client import ShopifyClient
+from app.shopify.registry import get_registry
+from app.shopify.sku_index import SkuIndex
 from app.bc365.client import BC365Client
+from app.core.db import SessionLocal, ProductSyncState
+from app.core.sku_map import get_sku_map
+from app.metrics.prom import PRODUCT_SYNC_RESULTS
 from app.utils.chunk import chunked
 
 log = structlog.get_logger(__name__)
 
 @shared_task(bind=True, autoretry_for=(Exception,), retry_backoff=True, retry_backoff_max=30, retry_jitter=True)
-def bulk_upsert_products(self) -> Dict[str, Any]:
+def bulk_upsert_products(self, mode: str = "rest", shop_domain: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Push BC items to Shopify products, skipping items whose mapped payload hashes the same
+    as the last push (product_sync_state). Known items are updated in place; unknown items
+    are matched to an existing variant by SKU before a product is created.
+
+    mode="bulk" sends every changed item through one Shopify bulk operation (productSet)
+    instead of a REST call each; use it for initial loads and full resyncs.
+    shop_domain selects the storefront (default SHOPIFY_SHOP).
+    """
     bc = BC365Client()
-    shop = ShopifyClient()
+    shop = get_registry().client(shop_domain)
+    index = SkuIndex(shop.shop)
+    if mode == "bulk":
+        return _bulk_operation_upsert(bc, shop, index)
+
+    counts = {"total": 0, "created": 0, "updated": 0, "skipped": 0}
+
+    cache = bc.item_cache()
+
+    for batch in chunked(bc.iter_items(), 100):
+        counts["total"] += len(batch)
+        # Full reads are fresh: refresh the order-path item cache while we have them
+        cache.put_many({str(p["number"]): p for p in batch if p.get("number")})
 
-    products = bc.fetch_products()
-    total = len(products)
-    updated = 0
+        states = _load_states(shop.shop, [_item_number(p) for p in batch])
+        done: List[ProductSyncState] = []
+        try:
+            for p in batch:
+                number = _item_number(p)
+                if not number:
+                    continue
+                payload = map_bc_to_shopify(p)
+                digest = payload_hash(payload)
+                state = states.get(number)
+                if state and state.payload_hash == digest:
+                    counts["skipped"] += 1
+                    PRODUCT_SYNC_RESULTS.labels(result="skipped", shop=shop.shop).inc()
+                    continue
 
-    for batch in chunked(products, 100):
-        for p in batch:
-            payload = map_bc_to_shopify(p)
-            product_id = payload.get("id")
-            try:
+                ids = (state.shopify_product_id, state.shopify_variant_id) if state else _adopt(shop, index, payload)
+                try:
+                    if ids:
+                        product_id, variant_id = ids
+                        if variant_id:
+                            payload["variants"][0]["id"] = variant_id  # update the variant, don't add one
+                        shop.update_product(product_id, payload)
+                        outcome = "updated"
+                    else:
+                        product = shop.create_product(payload).get("product") or {}
+                        variant = (product.get("variants") or [{}])[0]
+                        product_id, variant_id = product.get("id"), variant.get("id")
+                        if variant.get("sku") and variant.get("inventory_item_id"):
+                            index.put(variant["sku"], variant["id"], variant["inventory_item_id"])
+                        outcome = "created"
+                except Exception as e:
+                    log.warning("product_upsert_failed", sku=number, error=str(e))
+                    raise
+                counts[outcome] += 1
+                PRODUCT_SYNC_RESULTS.labels(result=outcome, shop=shop.shop).inc()
                 if product_id:
-                    shop.update_product(product_id, payload)
-                else:
-                    shop.create_product(payload)
-                updated += 1
-            except Exception as e:
-                log.warning("product_upsert_failed", sku=p.get("No"), error=str(e))
-                raise
-    log.info("bulk_upsert_done", total=total, updated=updated)
-    return {"total": total, "updated": updated}
+                    done.append(ProductSyncState(shop=shop.shop, bc_item_no=number, shopify_product_id=int(product_id),
+                                                 shopify_variant_id=variant_id, payload_hash=digest))
+        finally:
+            # Keep progress so a retry skips what already landed
+            _save_states(done)
+    log.info("bulk_upsert_done", **counts)
+    return counts
+
+def _bulk_operation_upsert(bc: BC365Client, shop: ShopifyClient, index: SkuIndex) -> Dict[str, Any]:
+    counts = {"total": 0, "created": 0, "updated": 0, "skipped": 0, "failed": 0}
+    bulk = BulkOperations(shop)
+    lines: List[Tuple[str, str, bool]] = []  # JSONL line -> (bc number, payload hash, existed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "products.jsonl"
+        with path.open("w", encoding="utf-8") as out:
+            for batch in chunked(bc.iter_items(), 500):
+                counts["total"] += len(batch)
+                states = _load_states(shop.shop, [_item_number(p) for p in batch])
+                pending: List[Tuple[str, Dict[str, Any], str]] = []
+                for p in batch:
+                    number = _item_number(p)
+                    if not number:
+                        continue
+                    payload = map_bc_to_shopify(p)
+                    digest = payload_hash(payload)
+                    state = states.get(number)
+                    if state and state.payload_hash == digest:
+                        counts["skipped"] += 1
+                        PRODUCT_SYNC_RESULTS.labels(result="skipped", shop=shop.shop).inc()
+                        continue
+                    pending.append((number, payload, digest))
+
+                # Unknown items whose SKU already exists in Shopify: adopt the product, don't duplicate it
+                refs = index.lookup_many(pl["variants"][0]["sku"] for n, pl, _ in pending if n not in states)
+                products = bulk.variant_products(r["variant_id"] for r in refs.values())
+                for number, payload, digest in pending:
+                    state = states.get(number)
+                    if state:
+                        ids = (state.shopify_product_id, state.shopify_variant_id)
+                    else:
+                        ref = refs.get(payload["variants"][0]["sku"])
+                        product_id = products.get(ref["variant_id"]) if ref else None
+                        ids = (product_id, ref["variant_id"]) if product_id else (None, None)
+                    out.write(json.dumps(product_set_input(payload, *ids), separators=(",", ":")) + "\n")
+                    lines.append((number, digest, bool(ids[0])))
+
+        if not lines:
+            log.info("bulk_upsert_done", mode="bulk", **counts)
+            return counts
+
+        done: List[ProductSyncState] = []
+        try:
+            for res in bulk.run(PRODUCT_SET, path):
+                number, digest, existed = lines[int(res["__lineNumber"])]
+                result = (res.get("data") or {}).get("productSet") or {}
+                product = result.get("product")
+                if result.get("userErrors") or not product:
+                    log.warning("product_upsert_failed", sku=number, errors=result.get("userErrors") or res.get("errors"))
+                    counts["failed"] += 1
+                    continue
+                variant = ((product.get("variants") or {}).get("nodes") or [{}])[0]
+                variant_id = gid_id(variant.get("id"))
+                if variant.get("sku") and variant_id and variant.get("inventoryItem"):
+                    index.put(variant["sku"], variant_id, gid_id(variant["inventoryItem"]["id"]))
+                outcome = "updated" if existed else "created"
+                counts[outcome] += 1
+                PRODUCT_SYNC_RESULTS.labels(result=outcome, shop=shop.shop).inc()
+                done.append(ProductSyncState(shop=shop.shop, bc_item_no=number, shopify_product_id=gid_id(product["id"]),
+                                             shopify_variant_id=variant_id, payload_hash=digest))
+                if len(done) >= 500:
+                    _save_states(done)
+                    done = []
+        finally:
+            _save_states(done)
+
+    log.info("bulk_upsert_done", mode="bulk", **counts)
+    return counts
+
+def _item_number(p: Dict[str, Any]) -> str:
+    return str(p.get("number") or p.get("No") or "")
+
+def _load_states(shop: str, numbers: List[str]) -> Dict[str, ProductSyncState]:
+    with SessionLocal() as s:
+        rows = s.scalars(select(ProductSyncState).where(
+            ProductSyncState.shop == shop, ProductSyncState.bc_item_no.in_(numbers)
+        ))
+        return {r.bc_item_no: r for r in rows}
+
+def _save_states(states: List[ProductSyncState]) -> None:
+    if not states:
+        return
+    with SessionLocal() as s:
+        for st in states:
+            s.merge(st)
+        s.commit()
+
+def _adopt(shop: ShopifyClient, index: SkuIndex, payload: Dict[str, Any]) -> Optional[Tuple[int, Optional[int]]]:
+    """(product_id, variant_id) of an existing Shopify variant with this SKU, if any."""
+    sku = payload["variants"][0]["sku"]
+    if index.is_loaded() and not index.lookup(sku):
+        return None  # the index covers the whole catalogue: no REST call for a brand new SKU
+    v = shop.find_variant_by_sku(sku)
+    return (int(v["product_id"]), int(v["id"])) if v else None
+
+def payload_hash(payload: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
 
 def map_bc_to_shopify(p: Dict[str, Any]) -> Dict[str, Any]:
-    sku = p.get("No") or "SKU"
-    title = p.get("Description") or sku
-    price = p.get("Unit_Price", "0.00")
+    # API v2.0 field names, falling back to the legacy OData page names
+    number = _item_number(p) or "SKU"
+    sku = get_sku_map().to_shopify(number)
+    title = p.get("displayName") or p.get("Description") or sku
+    price = p.get("unitPrice", p.get("Unit_Price", "0.00"))
     if isinstance(price, (int, float)):
         price = f"{price:.2f}"
     return {"title": title, "variants": [{"sku": sku, "price": price}], "status": "active"}
@@ -1,11 +1,278 @@
-from typing import Dict, Any
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Set, Tuple
+import json
 import structlog
 from celery import shared_task
+from app.bc365.client import BC365Client
+from app.core.config import settings
+from app.core.db import SessionLocal, ReconciliationReport
+from app.core.reconcile import Columns, Diff, diff, sku_key
+from app.core.reconcile_buckets import BucketMirror
+from app.core.sku_map import SkuMap, get_sku_map
+from app.metrics.prom import (
+    RECONCILE_ACCURACY,
+    RECONCILE_ROWS,
+    RECONCILE_ROWS_READ,
+    RECONCILE_BUCKETS,
+    RECONCILE_SECONDS,
+    RECONCILE_CORRECTIONS,
+)
+from app.shopify.client import ShopifyClient
+from app.shopify.inventory_snapshot import InventorySnapshot
+from app.shopify.registry import get_registry
+from app.shopify.sku_index import SkuIndex
+from app.tasks.inventory import sync_inventory_levels
+from app.utils.chunk import chunked
 
 log = structlog.get_logger(__name__)
 
+# Re-read a little before the previous run started: clocks and indexing lag on both sides
+_WATERMARK_OVERLAP = timedelta(minutes=5)
+
 @shared_task
-def run_reconciliation() -> Dict[str, Any]:
-    result = {"compared": 10000, "mismatches": 45, "accuracy": 0.995}
-    log.info("reconcile_done", **result)
-    return result
+def run_reconciliation(
+    mode: str = "full",
+    auto_correct: Optional[bool] = None,
+    shop_domain: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Compare BC item inventory with Shopify's available quantities at the shop's sync location
+    (shop_domain, default SHOPIFY_SHOP).
+
+    mode="full" streams both catalogues into columnar (sku key, qty) arrays and diffs them
+    with a sorted merge-join; it also reseeds the bucket mirror used by mode="bucketed".
+
+    mode="bucketed" reads only what changed since the last run (BC lastModifiedDateTime,
+    Shopify updated_at_min), updates per-bucket digests, and re-reads just the buckets whose
+    digests disagree. It falls back to a full run when the mirror is missing or too many
+    buckets are suspect. Quantity changes that bump neither timestamp (e.g. BC ledger
+    postings) are only seen by the full run, so keep that on a slower schedule.
+    """
+    started = datetime.now(timezone.utc)
+    bc = BC365Client()
+    registry = get_registry()
+    shop = registry.client(shop_domain)
+    loc_id = registry.location_id(shop_domain)
+    index = SkuIndex(shop.shop)
+    index.ensure_loaded(shop)
+    mirror = BucketMirror(shop.shop, loc_id)
+    sku_map = get_sku_map()
+
+    if mode == "bucketed":
+        if not mirror.is_seeded():
+            log.info("reconcile_bucketed_fallback", reason="mirror not seeded")
+        else:
+            with RECONCILE_SECONDS.labels(mode="bucketed").time():
+                out = _bucketed(bc, shop, index, mirror, sku_map, loc_id, started)
+                if out is not None:
+                    result, extra = out
+                    return finish_report("bucketed", started, shop.shop, loc_id, index, result, auto_correct, extra)
+
+    with RECONCILE_SECONDS.labels(mode="full").time():
+        bc_cols, sh_cols = _full_read(bc, shop, index, mirror, sku_map, loc_id, started)
+        result = diff(bc_cols.freeze(), sh_cols.freeze())
+        del bc_cols, sh_cols
+        return finish_report("full", started, shop.shop, loc_id, index, result, auto_correct)
+
+def bc_rows(items: Iterable[Dict[str, Any]], sku_map: SkuMap) -> Iterator[Tuple[str, int]]:
+    """(sku, qty) per BC item."""
+    for it in items:
+        yield sku_map.to_shopify(str(it.get("number"))), int(float(it.get("inventory", 0) or 0))
+
+def shopify_rows(
+    shop: ShopifyClient,
+    index: SkuIndex,
+    loc_id: int,
+    item_ids: Optional[List[int]] = None,
+    updated_at_min: Optional[str] = None,
+) -> Iterator[Tuple[str, int, int]]:
+    """(sku, available, inventory_item_id) at `loc_id`, named through the index's inventory_item_id map."""
+    params: Dict[str, Any] = {"location_ids": loc_id, "limit": 250}
+    if updated_at_min:
+        params["updated_at_min"] = updated_at_min
+    unindexed = 0
+    pages = [item_ids[i:i + 50] for i in range(0, len(item_ids), 50)] if item_ids is not None else [None]
+    for ids in pages:
+        if ids is not None:
+            params["inventory_item_ids"] = ",".join(str(i) for i in ids)
+        for levels in chunked(shop.paginate("/inventory_levels.json", "inventory_levels", params=dict(params)), 250):
+            skus = index.skus_for_items(int(lv["inventory_item_id"]) for lv in levels)
+            for lv in levels:
+                sku = skus.get(int(lv["inventory_item_id"]))
+                if sku is None or lv.get("available") is None:
+                    unindexed += 1
+                    continue
+                yield sku, int(lv["available"]), int(lv["inventory_item_id"])
+    if unindexed:
+        log.info("reconcile_unindexed_levels", count=unindexed)
+
+def _full_read(
+    bc: BC365Client,
+    shop: ShopifyClient,
+    index: SkuIndex,
+    mirror: BucketMirror,
+    sku_map: SkuMap,
+    loc_id: int,
+    started: datetime,
+) -> Tuple[Columns, Columns]:
+    """Read both catalogues into Columns and reseed the bucket mirror on the way through."""
+    mirror.reset()
+    bc_cols, sh_cols = Columns(), Columns()
+    for batch in chunked(bc_rows(bc.iter_items(select=["number", "inventory"]), sku_map), 1000):
+        for sku, qty in batch:
+            bc_cols.append(sku_key(sku), qty)
+        mirror.apply("bc", {sku: (qty, 0) for sku, qty in batch})
+    for batch in chunked(shopify_rows(shop, index, loc_id), 1000):
+        for sku, qty, iid in batch:
+            sh_cols.append(sku_key(sku), qty, iid)
+        mirror.apply("shopify", {sku: (qty, iid) for sku, qty, iid in batch})
+    RECONCILE_ROWS_READ.labels(side="bc", mode="full").inc(len(bc_cols))
+    RECONCILE_ROWS_READ.labels(side="shopify", mode="full").inc(len(sh_cols))
+    mirror.mark_verified()
+    stamp = _stamp(started)
+    mirror.set_watermarks(stamp, stamp)
+    return bc_cols, sh_cols
+
+def _bucketed(
+    bc: BC365Client,
+    shop: ShopifyClient,
+    index: SkuIndex,
+    mirror: BucketMirror,
+    sku_map: SkuMap,
+    loc_id: int,
+    started: datetime,
+) -> Optional[Tuple[Diff, Dict[str, Any]]]:
+    """Apply deltas, re-read suspect buckets and diff the mirror. None = do a full run instead."""
+    meta = mirror.meta()
+    changed: Set[int] = set()
+    read = {"bc": 0, "shopify": 0}
+
+    bc_since = _since(meta["bc_at"])
+    items = bc.iter_items(select=["number", "inventory"], filter=f"lastModifiedDateTime gt {bc_since}")
+    for batch in chunked(bc_rows(items, sku_map), 1000):
+        read["bc"] += len(batch)
+        changed |= mirror.apply("bc", {sku: (qty, 0) for sku, qty in batch})
+    for batch in chunked(shopify_rows(shop, index, loc_id, updated_at_min=_since(meta["shopify_at"])), 1000):
+        read["shopify"] += len(batch)
+        changed |= mirror.apply("shopify", {sku: (qty, iid) for sku, qty, iid in batch})
+
+    suspects = mirror.suspects()
+    if len(suspects) > mirror.buckets * settings.RECONCILE_BUCKET_FALLBACK_RATIO:
+        log.info("reconcile_bucketed_fallback", reason="too many suspect buckets", suspects=len(suspects))
+        return None
+    for group in chunked(suspects, 64):
+        reread = _reread(bc, shop, index, mirror, sku_map, loc_id, group)
+        read["bc"] += reread["bc"]
+        read["shopify"] += reread["shopify"]
+    mirror.mark_verified(suspects)
+    stamp = _stamp(started)
+    mirror.set_watermarks(stamp, stamp)
+
+    for side, n in read.items():
+        RECONCILE_ROWS_READ.labels(side=side, mode="bucketed").inc(n)
+    RECONCILE_BUCKETS.labels(state="changed").set(len(changed))
+    RECONCILE_BUCKETS.labels(state="reread").set(len(suspects))
+
+    result = diff(mirror.columns("bc").freeze(), mirror.columns("shopify").freeze())
+    return result, {"buckets": mirror.buckets, "buckets_changed": len(changed), "buckets_reread": len(suspects),
+                    "bc_rows_read": read["bc"], "shopify_rows_read": read["shopify"]}
+
+def _reread(
+    bc: BC365Client,
+    shop: ShopifyClient,
+    index: SkuIndex,
+    mirror: BucketMirror,
+    sku_map: SkuMap,
+    loc_id: int,
+    buckets: List[int],
+) -> Dict[str, int]:
+    """Replace the mirror rows of `buckets` with fresh reads of just their SKUs from both systems."""
+    skus: Set[str] = set()
+    item_ids: Set[int] = set()
+    for b in buckets:
+        skus.update(mirror.members("bc", b))
+        for sku, (_, iid) in mirror.members("shopify", b).items():
+            skus.add(sku)
+            item_ids.add(iid)
+    for ref in index.lookup_many(skus).values():
+        item_ids.add(int(ref["inventory_item_id"]))
+
+    items = bc.find_items_by_numbers([sku_map.to_bc(s) for s in skus], select=["number", "inventory"])
+    fresh_bc = dict(bc_rows(items.values(), sku_map))
+    fresh_sh = {sku: (qty, iid) for sku, qty, iid in shopify_rows(shop, index, loc_id, item_ids=sorted(item_ids))}
+
+    split: Dict[int, Tuple[Dict[str, Tuple[int, int]], Dict[str, Tuple[int, int]]]] = {b: ({}, {}) for b in buckets}
+    for sku, qty in fresh_bc.items():
+        split.get(mirror.bucket_of(sku), ({}, {}))[0][sku] = (qty, 0)
+    for sku, row in fresh_sh.items():
+        split.get(mirror.bucket_of(sku), ({}, {}))[1][sku] = row
+    for b, (bc_part, sh_part) in split.items():
+        mirror.replace("bc", b, bc_part)
+        mirror.replace("shopify", b, sh_part)
+    return {"bc": len(fresh_bc), "shopify": len(fresh_sh)}
+
+def _stamp(at: datetime) -> str:
+    return at.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def _since(stamp: str) -> str:
+    at = datetime.strptime(stamp, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+    return _stamp(at - _WATERMARK_OVERLAP)
+
+def finish_report(
+    mode: str,
+    started: datetime,
+    shop: str,
+    loc_id: int,
+    index: SkuIndex,
+    result: Diff,
+    auto_correct: Optional[bool],
+    extra: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Publish metrics, optionally queue corrections, and store the report."""
+    summary = result.summary()
+    RECONCILE_ACCURACY.labels(shop=shop).set(result.accuracy)
+    RECONCILE_ROWS.labels(kind="bc", shop=shop).set(result.bc_rows)
+    RECONCILE_ROWS.labels(kind="shopify", shop=shop).set(result.shopify_rows)
+    for kind in ("matched", "mismatched", "missing_in_shopify", "missing_in_bc"):
+        RECONCILE_ROWS.labels(kind=kind, shop=shop).set(summary[kind])
+
+    top = result.top(settings.RECONCILE_TOP_N)
+    names = index.skus_for_items(r["ref"] for r in top)
+    top_drift = [{"sku": names.get(r["ref"]), "inventory_item_id": r["ref"], "bc": r["bc"],
+                  "shopify": r["shopify"], "drift": r["drift"]} for r in top]
+
+    do_correct = settings.RECONCILE_AUTO_CORRECT if auto_correct is None else auto_correct
+    queued = _queue_corrections(shop, loc_id, index, result) if do_correct else 0
+
+    with SessionLocal() as s:
+        report = ReconciliationReport(
+            shop=shop, location_id=loc_id, mode=mode, started_at=started,
+            corrections_queued=queued, top_drift=json.dumps(top_drift),
+            **{k: v for k, v in summary.items() if k != "duplicates"},
+        )
+        s.add(report)
+        s.commit()
+        report_id = report.id
+
+    out = {"report_id": report_id, "mode": mode, **summary, **(extra or {}),
+           "corrections_queued": queued, "top_drift": top_drift[:10]}
+    log.info("reconcile_done", **{k: v for k, v in out.items() if k != "top_drift"})
+    return out
+
+def _queue_corrections(shop: str, loc_id: int, index: SkuIndex, result: Diff) -> int:
+    """Re-push BC quantities for the worst drifts; the snapshot is cleared so the diff stage sends them."""
+    refs = [int(r) for r in result.drift_ref[: settings.RECONCILE_MAX_CORRECTIONS]]
+    if not refs:
+        return 0
+    sku_map = get_sku_map()
+    snapshot = InventorySnapshot(shop, loc_id)
+    queued = 0
+    for chunk in chunked(refs, 500):
+        skus = list(index.skus_for_items(chunk).values())
+        snapshot.forget(skus)
+        numbers = [sku_map.to_bc(sku) for sku in skus]
+        if numbers:
+            sync_inventory_levels.delay(item_numbers=numbers, shop_domain=shop)
+            queued += len(numbers)
+    RECONCILE_CORRECTIONS.inc(queued)
+    return queued
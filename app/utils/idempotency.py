@@ -1,14 +1,200 @@
+from datetime import datetime, timedelta, timezone
 from hashlib import sha256
-from app.core.db import SessionLocal, IdempotencyKey
+from typing import Dict, Iterable, List, Optional, Set
+
+import redis
+import structlog
+from sqlalchemy import delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.core.config import settings
+from app.core.db import SessionLocal, IdempotencyKey, engine
+from app.core.redis import get_redis
+
+log = structlog.get_logger(__name__)
+
+PREFIX = "idem:"
+PENDING_KEY = "idem:pending"   # "note\tkey" claimed in Redis, not yet written to the table
+
+# SET NX each key; fresh ones are also queued for the durable write (flush_pending).
+# KEYS[1]=pending list  KEYS[2..]=prefixed keys  ARGV[1]=ttl  ARGV[2]=note  ARGV[3..]=keys
+_CLAIM = """
+local out = {}
+for i = 2, #KEYS do
+  if redis.call('SET', KEYS[i], 1, 'NX', 'EX', tonumber(ARGV[1])) then
+    redis.call('RPUSH', KEYS[1], ARGV[2] .. '\t' .. ARGV[i + 1])
+    out[#out + 1] = 1
+  else
+    out[#out + 1] = 0
+  end
+end
+return out
+"""
 
 def key_for(payload: bytes) -> str:
     return sha256(payload).hexdigest()
 
+def _pending_note(note: str) -> str:
+    return note[:256].replace("\t", " ")
+
+def _insert_new(keys: List[str], note: str) -> Set[str]:
+    """INSERT ... ON CONFLICT DO NOTHING; returns the keys this call actually inserted."""
+    dialect = postgresql if engine.dialect.name == "postgresql" else sqlite
+    now = datetime.now(timezone.utc)  # explicit: upgraded tables have no server default
+    stmt = (
+        dialect.insert(IdempotencyKey)
+        .values([{"key": k, "note": note[:256], "created_at": now} for k in keys])
+        .on_conflict_do_nothing(index_elements=["key"])
+        .returning(IdempotencyKey.key)
+    )
+    with SessionLocal() as s:
+        inserted = set(s.scalars(stmt))
+        s.commit()
+    return inserted
+
+def ensure_many(keys: Iterable[str], note: str = "") -> Dict[str, bool]:
+    """
+    Claim many keys at once; {key: True} means first sighting and the caller should process it.
+    A repeat costs one pipelined Redis SET NX. Keys new to Redis are confirmed with a single
+    INSERT ... ON CONFLICT DO NOTHING, so an evicted or restarted Redis cannot re-admit them.
+    """
+    keys = list(dict.fromkeys(str(k) for k in keys))
+    if not keys:
+        return {}
+    r = get_redis()
+    try:
+        pipe = r.pipeline(transaction=False)
+        for k in keys:
+            pipe.set(PREFIX + k, 1, nx=True, ex=settings.IDEMPOTENCY_REDIS_TTL_SECONDS)
+        fresh = [k for k, ok in zip(keys, pipe.execute()) if ok]
+    except redis.RedisError as e:
+        log.warning("idempotency_redis_unavailable", error=str(e))
+        fresh, r = keys, None
+
+    if not fresh:
+        return {k: False for k in keys}
+    try:
+        claimed = _insert_new(fresh, note)
+    except Exception:
+        if r is not None:
+            r.delete(*[PREFIX + k for k in fresh])  # nothing was recorded; let a retry claim them
+        raise
+    return {k: k in claimed for k in keys}
+
 def ensure_once(key: str, note: str = "") -> bool:
+    return ensure_many([key], note=note)[str(key)]
+
+def claim_many(keys: Iterable[str], note: str = "") -> Dict[str, bool]:
+    """
+    ensure_many() for latency-critical paths (webhook acks): one Redis round trip, no DB.
+    Fresh keys are queued in PENDING_KEY and made durable by flush_pending() in a task;
+    without Redis this falls back to ensure_many().
+    """
+    keys = list(dict.fromkeys(str(k) for k in keys))
+    if not keys:
+        return {}
+    note = _pending_note(note)
+    try:
+        r = get_redis()
+        flags = r.register_script(_CLAIM)(
+            keys=[PENDING_KEY] + [PREFIX + k for k in keys],
+            args=[settings.IDEMPOTENCY_REDIS_TTL_SECONDS, note] + keys,
+        )
+    except redis.RedisError as e:
+        log.warning("idempotency_redis_unavailable", error=str(e))
+        return ensure_many(keys, note=note)
+    return {k: bool(f) for k, f in zip(keys, flags)}
+
+def claim_once(key: str, note: str = "") -> bool:
+    return claim_many([key], note=note)[str(key)]
+
+def release_claim(key: str, note: str = "") -> None:
+    """
+    release() for claim_many() keys, as cheap as the claim: drops the Redis marker and the
+    queued durable write, so a failed delivery's retry is not recorded as a duplicate later.
+    """
+    key = str(key)
+    try:
+        pipe = get_redis().pipeline()
+        pipe.delete(PREFIX + key)
+        pipe.lrem(PENDING_KEY, 0, f"{_pending_note(note)}\t{key}")
+        pipe.execute()
+    except redis.RedisError as e:
+        log.warning("idempotency_redis_unavailable", error=str(e))
+        release(key)   # the claim fell back to ensure_many(), so the row is in the table
+
+def flush_pending(batch_size: int = 5000) -> int:
+    """Write keys claimed by claim_many() to the table; returns how many entries were flushed."""
+    r = get_redis()
+    total = 0
+    while True:
+        pipe = r.pipeline()   # MULTI: read and trim together, so concurrent flushes never share entries
+        pipe.lrange(PENDING_KEY, 0, batch_size - 1)
+        pipe.ltrim(PENDING_KEY, batch_size, -1)
+        entries = pipe.execute()[0]
+        if not entries:
+            return total
+        parsed = [entry.partition("\t")[::2] for entry in entries]
+        # A key released after it was queued has lost its marker: it must not become durable
+        pipe = r.pipeline(transaction=False)
+        for _, key in parsed:
+            pipe.exists(PREFIX + key)
+        by_note: Dict[str, List[str]] = {}
+        for (note, key), alive in zip(parsed, pipe.execute()):
+            if alive:
+                by_note.setdefault(note, []).append(key)
+        try:
+            for note, keys in by_note.items():
+                _insert_new(keys, note)
+        except Exception:
+            r.lpush(PENDING_KEY, *reversed(entries))   # back to the front for the next run
+            raise
+        total += len(entries)
+        if len(entries) < batch_size:
+            return total
+
+def release(key: str) -> None:
+    """Forget a key whose processing failed so the next delivery is not treated as a duplicate."""
     with SessionLocal() as s:
-        existing = s.get(IdempotencyKey, key)
-        if existing:
-            return False
-        s.add(IdempotencyKey(key=key, note=note))
+        s.execute(delete(IdempotencyKey).where(IdempotencyKey.key == str(key)))
         s.commit()
+    try:
+        get_redis().delete(PREFIX + str(key))
+    except redis.RedisError as e:
+        log.warning("idempotency_redis_unavailable", error=str(e))
+
+def acquire_lease(key: str, ttl: int) -> bool:
+    """
+    Short-lived claim (Redis only) for work that is in flight, not done: it expires by itself,
+    so a holder killed mid-task blocks retries for at most `ttl` seconds.
+    """
+    try:
+        return bool(get_redis().set(PREFIX + str(key), 1, nx=True, ex=ttl))
+    except redis.RedisError as e:
+        log.warning("idempotency_redis_unavailable", error=str(e))
         return True
+
+def release_lease(key: str) -> None:
+    try:
+        get_redis().delete(PREFIX + str(key))
+    except redis.RedisError as e:
+        log.warning("idempotency_redis_unavailable", error=str(e))
+
+def prune(older_than_days: Optional[int] = None, batch_size: int = 10_000) -> int:
+    """Delete keys past the retention window in index-ordered batches; returns rows removed."""
+    days = settings.IDEMPOTENCY_RETENTION_DAYS if older_than_days is None else older_than_days
+    cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+    total = 0
+    while True:
+        with SessionLocal() as s:
+            batch = (
+                select(IdempotencyKey.key)
+                .where(IdempotencyKey.created_at < cutoff)
+                .order_by(IdempotencyKey.created_at)
+                .limit(batch_size)
+            )
+            n = s.execute(delete(IdempotencyKey).where(IdempotencyKey.key.in_(batch))).rowcount
+            s.commit()
+        total += n
+        if n < batch_size:
+            return total
@@ -1,4 +1,5 @@
 from tenacity import retry, stop_after_attempt, wait_exponential_jitter, retry_if_exception_type
+import httpx
 import requests
 
 class RetryableHTTPError(Exception):
@@ -10,3 +11,12 @@ retry_policy = retry(
     wait=wait_exponential_jitter(initial=0.5, max=30),
     retry=retry_if_exception_type((RetryableHTTPError, requests.exceptions.RequestException)),
 )
+
+# Same policy for the httpx-based async clients (tenacity handles coroutines natively).
+# Callers raise RetryableHTTPError for 429/5xx; other status errors (400/401/404/422) fail at once.
+async_retry_policy = retry(
+    reraise=True,
+    stop=stop_after_attempt(6),
+    wait=wait_exponential_jitter(initial=0.5, max=30),
+    retry=retry_if_exception_type((RetryableHTTPError, httpx.TransportError)),
+)
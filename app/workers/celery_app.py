@@ -10,6 +10,9 @@ celery_app = Celery(
     broker=settings.CELERY_BROKER_URL,
     backend=settings.CELERY_RESULT_BACKEND,
 )
+# current_app is thread-local: without this, shared_task.delay() from a thread (the webhook
+# handler dispatches via asyncio.to_thread) binds to Celery's fallback app and skips task_routes
+celery_app.set_default()
 
 celery_app.conf.update(
     imports=(
@@ -17,20 +20,89 @@ celery_app.conf.update(
         "app.tasks.products",
         "app.tasks.inventory",
         "app.tasks.reconciliation",
+        "app.tasks.maintenance",
     ),
-    beat_schedule={
-        "reconcile-every-6h": {
-            "task": "app.tasks.reconciliation.run_reconciliation",
-            "schedule": 6 * 60 * 60,
-        }
+    # --- Queues ---
+    #   orders  : Shopify order -> BC pushes; own worker so they never sit behind catalogue jobs
+    #   default : short housekeeping (webhook buffer drain, single-SKU sets, chord callbacks)
+    #   bulk    : catalogue-sized work (inventory shards, product upserts, reconciliation)
+    # Priorities are 0 (first) .. 9 within a queue (Redis transport, see priority_steps).
+    task_default_queue="default",
+    task_default_priority=5,
+    task_routes={
+        "app.tasks.orders.push_order_to_bc365": {"queue": "orders", "priority": 0},
+        "app.tasks.orders.verify_order_ledger": {"queue": "orders", "priority": 8},
+        "app.tasks.inventory.set_inventory_for_sku": {"queue": "default", "priority": 2},
+        "app.tasks.inventory.drain_webhook_buffer": {"queue": "default", "priority": 3},
+        "app.tasks.inventory.merge_inventory_shards": {"queue": "default", "priority": 3},
+        "app.tasks.inventory.fail_inventory_job": {"queue": "default", "priority": 3},
+        "app.tasks.maintenance.refresh_bc_token": {"queue": "default", "priority": 1},
+        "app.tasks.maintenance.dispatch_per_shop": {"queue": "default", "priority": 3},
+        "app.tasks.maintenance.*": {"queue": "default", "priority": 9},
+        "app.tasks.inventory.sync_inventory_levels": {"queue": "bulk", "priority": 4},
+        "app.tasks.inventory.sync_inventory_sharded": {"queue": "bulk", "priority": 4},
+        "app.tasks.inventory.refresh_sku_index": {"queue": "bulk", "priority": 5},
+        "app.tasks.products.bulk_upsert_products": {"queue": "bulk", "priority": 7},
+        "app.tasks.reconciliation.run_reconciliation": {"queue": "bulk", "priority": 8},
     },
+    broker_transport_options={
+        "priority_steps": list(range(10)),
+        "sep": ":",
+        "queue_order_strategy": "priority",
+        # Unacked tasks are redelivered after this; keep it above the longest bulk job
+        "visibility_timeout": settings.CELERY_VISIBILITY_TIMEOUT,
+    },
+    # Long tasks: reserve one message per pool slot, ack after the task ran. A task whose worker
+    # died is redelivered, so every task must be safe to run twice: order pushes check the
+    # ledger/BC behind an expiring lease, inventory writes absolute quantities against the
+    # snapshot, product upserts skip unchanged payload hashes
+    worker_prefetch_multiplier=settings.CELERY_PREFETCH_MULTIPLIER,
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
 )
 
 celery_app.conf.beat_schedule = {
+    # Shop-scoped jobs go through dispatch_per_shop: one run per installed shop
     "inventory-sync-5m": {
-        "task": "app.tasks.inventory.sync_inventory_levels",
-        "schedule": crontab(minute="*/5"),
-        "args": [],  # full window sync
+        "task": "app.tasks.maintenance.dispatch_per_shop",
+        "schedule": crontab(minute="*/5"),  # whole catalogue, fanned out over the workers
+        "kwargs": {"task": "app.tasks.inventory.sync_inventory_sharded"},
+    },
+    "products-sync-hourly": {
+        "task": "app.tasks.maintenance.dispatch_per_shop",
+        "schedule": crontab(minute=20),  # unchanged items are skipped by payload hash
+        "kwargs": {"task": "app.tasks.products.bulk_upsert_products"},
+    },
+    "webhook-buffer-drain": {
+        "task": "app.tasks.inventory.drain_webhook_buffer",
+        "schedule": 5.0,  # seconds; matches the default debounce window
+    },
+    "order-ledger-verify-hourly": {
+        "task": "app.tasks.orders.verify_order_ledger",
+        "schedule": crontab(minute=40),
+    },
+    "reconcile-every-6h": {
+        "task": "app.tasks.maintenance.dispatch_per_shop",
+        "schedule": crontab(minute=35, hour="*/6"),
+        # full also reseeds the bucket mirror
+        "kwargs": {"task": "app.tasks.reconciliation.run_reconciliation", "kwargs": {"mode": "full"}},
+    },
+    "reconcile-bucketed-hourly": {
+        "task": "app.tasks.maintenance.dispatch_per_shop",
+        "schedule": crontab(minute=50),
+        "kwargs": {"task": "app.tasks.reconciliation.run_reconciliation", "kwargs": {"mode": "bucketed"}},
+    },
+    "bc-token-refresh": {
+        "task": "app.tasks.maintenance.refresh_bc_token",
+        "schedule": 60.0,  # seconds; renews only inside BC365_TOKEN_REFRESH_AHEAD_SECONDS
+    },
+    "idempotency-flush": {
+        "task": "app.tasks.maintenance.flush_idempotency_keys",
+        "schedule": 10.0,  # seconds; webhook claims live only in Redis until then
+    },
+    "idempotency-prune-daily": {
+        "task": "app.tasks.maintenance.prune_idempotency_keys",
+        "schedule": crontab(hour=3, minute=15),
     },
 }
 # --- Prometheus exporter for the worker ---
@@ -39,7 +111,11 @@ from prometheus_client import start_http_server
 
 @signals.worker_ready.connect
 def _start_prometheus_exporter(sender=None, **kwargs):
-    """Start a single metrics HTTP server in the worker container."""
+    """
+    Start a single metrics HTTP server in the worker container.
+    Run workers with `-P threads` so tasks execute in this process and their metrics are
+    exported here; prefork children would keep their counters to themselves.
+    """
     if str(os.getenv("PROMETHEUS_ENABLE", "true")).lower() != "true":
         return
     port = int(os.getenv("PROMETHEUS_WORKER_PORT", "8001"))
@@ -0,0 +1,308 @@
+# bench/bc365_standin.py
+"""
+Offline stand-in for the Business Central API v2.0 endpoints BC365Client calls, plus the
+Azure AD client-credentials token endpoint:
+
+  POST /{tenant}/oauth2/v2.0/token
+  GET  /v2.0/{env}/api/v2.0/companies
+  GET  /v2.0/{env}/api/v2.0/companies({id})/items        $select, $filter, $top, paged
+  GET  /v2.0/{env}/api/v2.0/companies({id})/salesOrders  $filter=externalDocumentNumber eq '..'
+  POST /v2.0/{env}/api/v2.0/companies({id})/salesOrders
+
+Collections honour `Prefer: odata.maxpagesize` and continue through @odata.nextLink
+($skiptoken), like BC. $filter understands the shapes the app sends: `number eq` clauses
+joined by `or`, and `number ge/gt/lt/le` clauses joined by `and`. Calls without a token
+issued here get 401.
+
+    python -m bench.bc365_standin --port 8788 --items 10000
+    BC365_API_BASE_URL=http://localhost:8788
+    BC365_TOKEN_URL=http://localhost:8788/bench/oauth2/v2.0/token
+
+POST /_bench/reset {"seed": n} replaces the catalogue with n items and
+GET /_bench/calls returns per-endpoint call counts; bench/run.py drives both.
+
+Stdlib only; state lives in memory for the life of the process.
+"""
+from __future__ import annotations
+
+import argparse
+import bisect
+import itertools
+import json
+import re
+import secrets
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+COMPANY_ID = "00000000-0000-0000-0000-00000000be7c"
+DEFAULT_PAGE_SIZE = 20000   # BC's server-side cap when no maxpagesize is asked for
+
+_CLAUSE = re.compile(r"(\w+) (eq|ge|gt|lt|le) '((?:[^']|'')*)'")
+
+
+class FilterNotSupported(ValueError):
+    pass
+
+
+def parse_filter(expr: Optional[str]) -> Tuple[str, List[Tuple[str, str, str]]]:
+    """`a eq 'x' or a eq 'y'` -> ("or", [(field, op, value), ...]); mixed and/or is rejected."""
+    if not expr:
+        return "and", []
+    joiner = "or" if " or " in expr else "and"
+    if joiner == "or" and " and " in expr:
+        raise FilterNotSupported(expr)
+    clauses = []
+    for part in expr.split(f" {joiner} "):
+        m = _CLAUSE.fullmatch(part.strip())
+        if not m:
+            raise FilterNotSupported(part)
+        field, op, value = m.groups()
+        clauses.append((field, op, value.replace("''", "'")))
+    return joiner, clauses
+
+
+class StandinState:
+    def __init__(self, base_url: str, latency: float = 0.0, token_ttl: int = 3599) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.latency = latency
+        self.token_ttl = token_ttl
+        self.lock = threading.Lock()
+        self.calls: Counter = Counter()   # "GET items" -> n, "token" -> n
+        self.tokens: Dict[str, float] = {}
+        self.reset()
+
+    def reset(self) -> None:
+        """Empty catalogue, orders and call counters (issued tokens stay valid)."""
+        with self.lock:
+            self.numbers: List[str] = []                    # sorted item numbers
+            self.items: Dict[str, Dict[str, Any]] = {}
+            self.item_ids: set = set()
+            self.orders: Dict[str, Dict[str, Any]] = {}     # externalDocumentNumber -> order
+            self.order_seq = itertools.count(101001)
+            self.calls.clear()
+
+    def count(self, key: str) -> None:
+        with self.lock:
+            self.calls[key] += 1
+
+    def seed(self, n: int, prefix: str = "BENCH-") -> None:
+        """n items numbered {prefix}000000.. with stock 0..99."""
+        with self.lock:
+            for i in range(n):
+                number = f"{prefix}{i:06d}"
+                self.items[number] = {
+                    "id": str(uuid.UUID(int=i + 1)),
+                    "number": number,
+                    "displayName": f"Bench item {i}",
+                    "type": "Inventory",
+                    "unitPrice": round(1 + (i % 500) / 10, 2),
+                    "inventory": i % 100,
+                    "lastModifiedDateTime": "2024-01-01T00:00:00Z",
+                }
+            self.numbers = sorted(self.items)
+            self.item_ids = {it["id"] for it in self.items.values()}
+
+    # ---------- auth ----------
+
+    def issue_token(self) -> Dict[str, Any]:
+        token = secrets.token_urlsafe(24)
+        with self.lock:
+            self.tokens[token] = time.time() + self.token_ttl
+        return {"token_type": "Bearer", "expires_in": self.token_ttl, "access_token": token}
+
+    def authorized(self, header: Optional[str]) -> bool:
+        token = (header or "").removeprefix("Bearer ").strip()
+        return self.tokens.get(token, 0) > time.time()
+
+    # ---------- items ----------
+
+    def query_items(self, filt: Optional[str], after: Optional[str]) -> List[str]:
+        """Item numbers matching the filter, in key order, after the $skiptoken."""
+        joiner, clauses = parse_filter(filt)
+        if joiner == "or":
+            if any(f != "number" or op != "eq" for f, op, _ in clauses):
+                raise FilterNotSupported(filt)
+            found = sorted({v for _, _, v in clauses if v in self.items})
+        else:
+            lo, hi = 0, len(self.numbers)
+            for field, op, value in clauses:
+                if field != "number":
+                    raise FilterNotSupported(filt)
+                if op == "eq":
+                    lo = max(lo, bisect.bisect_left(self.numbers, value))
+                    hi = min(hi, bisect.bisect_right(self.numbers, value))
+                elif op in ("ge", "gt"):
+                    cut = bisect.bisect_left if op == "ge" else bisect.bisect_right
+                    lo = max(lo, cut(self.numbers, value))
+                else:
+                    cut = bisect.bisect_left if op == "lt" else bisect.bisect_right
+                    hi = min(hi, cut(self.numbers, value))
+            found = self.numbers[lo:hi]
+        if after is not None:
+            found = found[bisect.bisect_right(found, after):]
+        return found
+
+    # ---------- sales orders ----------
+
+    def create_order(self, body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        lines = body.get("salesOrderLines") or []
+        ext = str(body.get("externalDocumentNumber") or "")
+        if len(ext) > 35:
+            return 400, {"error": {"code": "BadRequest_InvalidValue",
+                                   "message": "externalDocumentNumber is longer than 35 characters."}}
+        unknown = [ln.get("itemId") for ln in lines if ln.get("itemId") not in self.item_ids]
+        if unknown:
+            return 400, {"error": {"code": "Internal_RecordNotFound",
+                                   "message": f"The Item does not exist. Identification fields and values: Id='{unknown[0]}'"}}
+        order = {
+            "id": str(uuid.uuid4()),
+            "number": f"S-ORD{next(self.order_seq)}",
+            "externalDocumentNumber": ext,
+            "customerNumber": body.get("customerNumber"),
+            "status": "Draft",
+            "lines": len(lines),
+        }
+        with self.lock:
+            if ext:
+                self.orders[ext] = order
+        return 201, order
+
+
+def _select(item: Dict[str, Any], fields: Optional[List[str]]) -> Dict[str, Any]:
+    return {k: item[k] for k in fields if k in item} if fields else dict(item)
+
+
+def make_handler(state: StandinState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+        def log_message(self, fmt: str, *args: Any) -> None:  # keep benchmark output clean
+            pass
+
+        def _body(self) -> bytes:
+            return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+        def _json(self, status: int, payload: Any) -> None:
+            if state.latency:
+                time.sleep(state.latency)
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; odata.metadata=minimal")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _error(self, status: int, code: str, message: str) -> None:
+            self._json(status, {"error": {"code": code, "message": message}})
+
+        def _route(self) -> Optional[Tuple[str, str]]:
+            """(resource, company id) for /v2.0/{env}/api/v2.0/companies[({id})/{resource}]."""
+            path = urlsplit(self.path).path
+            m = re.fullmatch(r"/v2\.0/[^/]+/api/v2\.0/companies(?:\(([^)]+)\)/(\w+))?", path)
+            if not m:
+                return None
+            return m.group(2) or "companies", m.group(1) or ""
+
+        def do_POST(self) -> None:
+            body = self._body()
+            if self.path == "/_bench/reset":  # benchmark control: {"seed": n}
+                state.reset()
+                state.seed(int(json.loads(body or b"{}").get("seed") or 0))
+                return self._json(200, {"ok": True, "items": len(state.items)})
+            if urlsplit(self.path).path.endswith("/oauth2/v2.0/token"):
+                form = {k: v[-1] for k, v in parse_qs(body.decode()).items()}
+                if form.get("grant_type") != "client_credentials":
+                    return self._json(400, {"error": "unsupported_grant_type"})
+                state.count("token")
+                return self._json(200, state.issue_token())
+            route = self._route()
+            if not route or route[0] != "salesOrders":
+                return self._error(404, "BadRequest_NotFound", "The request URL is not supported by the stand-in.")
+            if not state.authorized(self.headers.get("Authorization")):
+                return self._error(401, "Authentication_InvalidCredentials", "The credentials provided are incorrect")
+            state.count("POST salesOrders")
+            status, payload = state.create_order(json.loads(body or b"{}"))
+            self._json(status, payload)
+
+        def do_GET(self) -> None:
+            if self.path == "/_bench/calls":
+                return self._json(200, dict(state.calls))
+            route = self._route()
+            if not route:
+                return self._error(404, "BadRequest_NotFound", "The request URL is not supported by the stand-in.")
+            if not state.authorized(self.headers.get("Authorization")):
+                return self._error(401, "Authentication_InvalidCredentials", "The credentials provided are incorrect")
+            resource, company = route
+            state.count(f"GET {resource}")
+            query = {k: v[-1] for k, v in parse_qs(urlsplit(self.path).query).items()}
+
+            if resource == "companies":
+                return self._json(200, {"value": [{"id": COMPANY_ID, "name": "CRONUS Bench", "displayName": "CRONUS Bench"}]})
+            if company != COMPANY_ID:
+                return self._error(404, "Internal_CompanyNotFound", f"Cannot find company {company}.")
+
+            if resource == "salesOrders":
+                try:
+                    _, clauses = parse_filter(query.get("$filter"))
+                except FilterNotSupported as e:
+                    return self._error(400, "BadRequest_MethodNotImplemented", f"Filter not supported: {e}")
+                wanted = [v for f, op, v in clauses if f == "externalDocumentNumber" and op == "eq"]
+                orders = [state.orders[v] for v in wanted if v in state.orders] if clauses else list(state.orders.values())
+                return self._json(200, {"value": orders})
+
+            if resource != "items":
+                return self._error(404, "BadRequest_NotFound", f"Resource {resource} is not supported by the stand-in.")
+            try:
+                numbers = state.query_items(query.get("$filter"), query.get("$skiptoken"))
+            except FilterNotSupported as e:
+                return self._error(400, "BadRequest_MethodNotImplemented", f"Filter not supported: {e}")
+            if query.get("$top"):
+                numbers = numbers[:int(query["$top"])]
+            m = re.search(r"odata\.maxpagesize=(\d+)", self.headers.get("Prefer") or "")
+            size = int(m.group(1)) if m else DEFAULT_PAGE_SIZE
+            fields = [f for f in (query.get("$select") or "").split(",") if f] or None
+            page = [_select(state.items[n], fields) for n in numbers[:size]]
+            payload: Dict[str, Any] = {"value": page}
+            if len(numbers) > size and not query.get("$top"):
+                nxt = {k: v for k, v in query.items() if k != "$skiptoken"}
+                nxt["$skiptoken"] = numbers[size - 1]
+                payload["@odata.nextLink"] = f"{state.base_url}{urlsplit(self.path).path}?{urlencode(nxt)}"
+            self._json(200, payload)
+
+    return Handler
+
+
+def serve(host: str = "127.0.0.1", port: int = 8788, latency: float = 0.0) -> ThreadingHTTPServer:
+    """Start the stand-in on a background thread; port=0 picks a free port."""
+    server = ThreadingHTTPServer((host, port), None)  # type: ignore[arg-type]
+    server.daemon_threads = True
+    server.state = StandinState(f"http://{host}:{server.server_address[1]}", latency=latency)  # type: ignore[attr-defined]
+    server.RequestHandlerClass = make_handler(server.state)  # type: ignore[attr-defined]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8788)
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="added to every response")
+    ap.add_argument("--items", type=int, default=1000, help="catalogue size")
+    args = ap.parse_args()
+    server = serve(args.host, args.port, args.latency_ms / 1000)
+    server.state.seed(args.items)  # type: ignore[attr-defined]
+    print(f"BC365 stand-in listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+# bench/redis_standin.py
+"""
+In-memory Redis for offline benchmarks, served over TCP by fakeredis (with Lua via lupa),
+so the app talks to it through its normal REDIS_URL.
+
+    pip install "fakeredis[lua]"
+    python -m bench.redis_standin --port 6390
+    REDIS_URL=redis://localhost:6390/0
+
+A real `redis-server` works just as well; bench/run.py uses this only without --redis-url.
+"""
+from __future__ import annotations
+
+import argparse
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=6390)
+    args = ap.parse_args()
+    try:
+        from fakeredis import TcpFakeServer
+    except ImportError:
+        raise SystemExit('fakeredis is not installed: pip install "fakeredis[lua]", or point --redis-url at a real Redis')
+
+    server = TcpFakeServer((args.host, args.port), server_type="redis")
+    server.daemon_threads = True
+    server.RequestHandlerClass.disable_nagle_algorithm = True  # replies are written in pieces
+    print(f"Redis stand-in listening on redis://{args.host}:{args.port}/0", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
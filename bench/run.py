@@ -0,0 +1,342 @@
+# bench/run.py
+"""
+Offline throughput benchmark for the sync paths, against local stand-ins for Shopify,
+Business Central (with its token endpoint) and Redis:
+
+  inventory  sync_inventory_levels(force_full=True) over the whole catalogue
+             (cold SKU index: includes the products.json rebuild)
+  orders     push_order_to_bc365 for --orders three-line orders drawn from the catalogue
+  products   bulk_upsert_products(--product-mode) into an empty shop
+
+    python -m bench.run                                   # 1k, 10k and 100k SKUs
+    python -m bench.run --sizes 1000 --scenarios inventory,orders --json bench.json
+    python -m bench.run --baseline bench.json             # exit 1 on a regression
+
+Each run reports wall time, units/sec, HTTP calls/sec as counted by the stand-ins and
+429 / THROTTLED answers from an untraced pass, then repeats under tracemalloc for the peak
+Python heap (the stand-ins run in their own processes and are not counted); --no-memory
+skips the second pass.
+
+Redis is fakeredis (bench/redis_standin.py) unless --redis-url is given; the database is a
+throwaway SQLite file unless --database-url is given. Both are WIPED before every run.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import urllib.request
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+SHOP = "bench.myshopify.com"
+SKU_PREFIX = "BENCH-"
+
+# Shopify bucket sizes / rates for the stand-in and, identically, the app's own limiter
+LIMITS = {
+    "bench": {"rest_bucket": 1000, "rest_rate": 1000.0, "graphql_bucket": 20000, "graphql_rate": 10000.0},
+    "standard": {"rest_bucket": 40, "rest_rate": 2.0, "graphql_bucket": 1000, "graphql_rate": 50.0},
+    "plus": {"rest_bucket": 400, "rest_rate": 20.0, "graphql_bucket": 2000, "graphql_rate": 100.0},
+}
+
+
+@dataclass
+class Result:
+    scenario: str
+    size: int
+    units: int
+    seconds: float
+    http_calls: int
+    throttled: int
+    peak_mb: float
+    detail: Dict[str, Any]
+
+    @property
+    def units_per_sec(self) -> float:
+        return self.units / self.seconds if self.seconds else 0.0
+
+    @property
+    def calls_per_sec(self) -> float:
+        return self.http_calls / self.seconds if self.seconds else 0.0
+
+
+# ---------- stand-in processes ----------
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _spawn(module: str, port: int, *args: str) -> subprocess.Popen:
+    proc = subprocess.Popen([sys.executable, "-m", module, "--port", str(port), *args], stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"{module} exited with code {proc.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise SystemExit(f"{module} did not start listening on port {port}")
+
+
+def _control(base: str, path: str, payload: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Stand-in control endpoints, over urllib so the app's HTTP metrics stay untouched."""
+    data = json.dumps(payload).encode() if payload is not None else None
+    req = urllib.request.Request(f"{base}{path}", data=data, method="POST" if data else "GET",
+                                 headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=60) as resp:
+        return json.loads(resp.read() or b"{}")
+
+
+class Standins:
+    def __init__(self, limits: Dict[str, float], latency_ms: float, redis_url: Optional[str]) -> None:
+        self.procs: List[subprocess.Popen] = []
+        shopify_port, bc_port = _free_port(), _free_port()
+        self.shopify = f"http://127.0.0.1:{shopify_port}"
+        self.bc = f"http://127.0.0.1:{bc_port}"
+        self.procs.append(_spawn(
+            "bench.shopify_standin", shopify_port, "--latency-ms", str(latency_ms),
+            "--rest-bucket", str(limits["rest_bucket"]), "--rest-rate", str(limits["rest_rate"]),
+            "--graphql-bucket", str(limits["graphql_bucket"]), "--graphql-rate", str(limits["graphql_rate"]),
+        ))
+        self.procs.append(_spawn("bench.bc365_standin", bc_port, "--latency-ms", str(latency_ms), "--items", "0"))
+        if redis_url:
+            self.redis_url = redis_url
+        else:
+            redis_port = _free_port()
+            self.procs.append(_spawn("bench.redis_standin", redis_port))
+            self.redis_url = f"redis://127.0.0.1:{redis_port}/0"
+
+    def reset(self, bc_items: int, shopify_products: int) -> None:
+        _control(self.bc, "/_bench/reset", {"seed": bc_items})
+        _control(self.shopify, "/_bench/reset", {"seed": shopify_products})
+
+    def calls(self) -> Tuple[int, int]:
+        """(HTTP calls answered, calls throttled) across both APIs."""
+        counts = {**_control(self.bc, "/_bench/calls")}
+        shopify = _control(self.shopify, "/_bench/calls")
+        throttled = shopify.pop("throttled", 0)
+        return sum(counts.values()) + sum(shopify.values()) + throttled, throttled
+
+    def stop(self) -> None:
+        for p in self.procs:
+            p.terminate()
+        for p in self.procs:
+            p.wait(timeout=10)
+
+
+def _configure(standins: Standins, limits: Dict[str, float], database_url: str) -> None:
+    """Point the app at the stand-ins; must run before anything under app/ is imported."""
+    os.environ.update({
+        "DATABASE_URL": database_url,
+        "REDIS_URL": standins.redis_url,
+        "SHOPIFY_SHOP": SHOP,
+        "SHOPIFY_ACCESS_TOKEN": "shpat_bench",
+        "SHOPIFY_API_BASE_URL": standins.shopify,
+        "SHOPIFY_LOCATION_ID": "",
+        "SHOPIFY_REST_BUCKET_SIZE": str(int(limits["rest_bucket"])),
+        "SHOPIFY_REST_LEAK_RATE": str(limits["rest_rate"]),
+        "SHOPIFY_GRAPHQL_BUCKET_SIZE": str(int(limits["graphql_bucket"])),
+        "SHOPIFY_GRAPHQL_RESTORE_RATE": str(limits["graphql_rate"]),
+        "BC365_API_BASE_URL": standins.bc,
+        "BC365_TOKEN_URL": f"{standins.bc}/bench/oauth2/v2.0/token",
+        "BC365_TENANT_ID": "bench",
+        "BC365_CLIENT_ID": "bench",
+        "BC365_CLIENT_SECRET": "bench",
+        "BC365_ENVIRONMENT": "production",
+        "BC365_COMPANY_ID": "",
+        "BC365_COMPANY_NAME": "",
+    })
+
+
+# ---------- scenarios ----------
+
+def _wipe_state() -> None:
+    from app.bc365.client import BC365Client
+    from app.core.db import Base, engine
+    from app.core.redis import get_redis
+
+    get_redis().flushdb()
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    BC365Client().item_cache().clear_local()
+
+
+def setup_inventory(standins: Standins, size: int, opts: argparse.Namespace) -> Any:
+    standins.reset(bc_items=size, shopify_products=size)
+
+
+def run_inventory(size: int, opts: argparse.Namespace, _: Any) -> Tuple[int, Dict[str, Any]]:
+    from app.tasks.inventory import sync_inventory_levels
+
+    out = sync_inventory_levels.apply(kwargs={"force_full": True}).get()
+    return out["attempted"], out
+
+
+def setup_orders(standins: Standins, size: int, opts: argparse.Namespace) -> Any:
+    standins.reset(bc_items=size, shopify_products=0)
+    rng = random.Random(size)
+    return [
+        {
+            "id": 5_000_000_000 + i,
+            "line_items": [
+                {"sku": f"{SKU_PREFIX}{rng.randrange(size):06d}", "quantity": 1 + rng.randrange(3),
+                 "price": "9.99", "title": "Bench item"}
+                for _ in range(3)
+            ],
+        }
+        for i in range(opts.orders)
+    ]
+
+
+def run_orders(size: int, opts: argparse.Namespace, orders: List[Dict[str, Any]]) -> Tuple[int, Dict[str, Any]]:
+    from app.tasks.orders import push_order_to_bc365
+
+    pushed = deduped = 0
+    for order in orders:
+        out = push_order_to_bc365.apply(args=[order]).get()
+        if out.get("deduped"):
+            deduped += 1
+        else:
+            pushed += 1
+    return len(orders), {"pushed": pushed, "deduped": deduped}
+
+
+def setup_products(standins: Standins, size: int, opts: argparse.Namespace) -> Any:
+    standins.reset(bc_items=size, shopify_products=0)
+
+
+def run_products(size: int, opts: argparse.Namespace, _: Any) -> Tuple[int, Dict[str, Any]]:
+    from app.tasks.products import bulk_upsert_products
+
+    out = bulk_upsert_products.apply(kwargs={"mode": opts.product_mode}).get()
+    return out["total"], out
+
+
+SCENARIOS: Dict[str, Tuple[Callable[..., Any], Callable[..., Tuple[int, Dict[str, Any]]]]] = {
+    "inventory": (setup_inventory, run_inventory),
+    "orders": (setup_orders, run_orders),
+    "products": (setup_products, run_products),
+}
+
+
+def _pass(standins: Standins, scenario: str, size: int, opts: argparse.Namespace, traced: bool) -> Result:
+    setup, run = SCENARIOS[scenario]
+    _wipe_state()
+    prepared = setup(standins, size, opts)
+    calls_before, throttled_before = standins.calls()
+
+    if traced:
+        tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        units, detail = run(size, opts, prepared)
+    finally:
+        seconds = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] if traced else 0
+        if traced:
+            tracemalloc.stop()
+
+    calls, throttled = standins.calls()
+    return Result(scenario, size, units, round(seconds, 3), calls - calls_before, throttled - throttled_before,
+                  round(peak / 2 ** 20, 1), detail)
+
+
+def run_one(standins: Standins, scenario: str, size: int, opts: argparse.Namespace) -> Result:
+    """Timed pass, then (unless --no-memory) the same run again under tracemalloc for the peak."""
+    result = _pass(standins, scenario, size, opts, traced=False)
+    if opts.memory:
+        result.peak_mb = _pass(standins, scenario, size, opts, traced=True).peak_mb
+    return result
+
+
+# ---------- reporting ----------
+
+def _print(results: List[Result]) -> None:
+    header = f"{'scenario':<10} {'size':>7} {'units':>7} {'wall s':>9} {'units/s':>9} {'calls':>8} {'calls/s':>9} {'429s':>6} {'peak MB':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r.scenario:<10} {r.size:>7} {r.units:>7} {r.seconds:>9.2f} {r.units_per_sec:>9.0f} "
+              f"{r.http_calls:>8} {r.calls_per_sec:>9.0f} {r.throttled:>6} {r.peak_mb or '-':>8}")
+
+
+def _regressions(results: List[Result], baseline: Path, tolerance: float) -> List[str]:
+    base = {(b["scenario"], b["size"]): b for b in json.loads(baseline.read_text())}
+    found = []
+    for r in results:
+        b = base.get((r.scenario, r.size))
+        if not b:
+            continue
+        for field, now, then in (("seconds", r.seconds, b["seconds"]), ("peak_mb", r.peak_mb, b["peak_mb"])):
+            if then and now > then * (1 + tolerance):
+                found.append(f"{r.scenario}@{r.size}: {field} {then} -> {now} (+{(now / then - 1):.0%})")
+    return found
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", default="1000,10000,100000", help="catalogue sizes (SKUs), comma separated")
+    ap.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"any of {', '.join(SCENARIOS)}")
+    ap.add_argument("--orders", type=int, default=1000, help="orders pushed per orders run")
+    ap.add_argument("--product-mode", choices=("rest", "bulk"), default="rest")
+    ap.add_argument("--limits", choices=sorted(LIMITS), default="bench",
+                    help="Shopify bucket sizes/rates: bench (generous), standard or plus (real plans)")
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="added to every stand-in response")
+    ap.add_argument("--redis-url", help="use this Redis instead of fakeredis (it is flushed!)")
+    ap.add_argument("--database-url", help="use this database instead of a temp SQLite file (it is wiped!)")
+    ap.add_argument("--no-memory", dest="memory", action="store_false", help="skip the tracemalloc pass")
+    ap.add_argument("--json", type=Path, help="write the results here")
+    ap.add_argument("--baseline", type=Path, help="results JSON from an earlier run to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown / growth vs the baseline")
+    opts = ap.parse_args()
+
+    scenarios = [s.strip() for s in opts.scenarios.split(",") if s.strip()]
+    unknown = [s for s in scenarios if s not in SCENARIOS]
+    if unknown:
+        ap.error(f"unknown scenario(s): {', '.join(unknown)}")
+    sizes = [int(s) for s in opts.sizes.split(",") if s.strip()]
+    limits = LIMITS[opts.limits]
+
+    standins = Standins(limits, opts.latency_ms, opts.redis_url)
+    tmp = tempfile.TemporaryDirectory(prefix="bench-")
+    try:
+        _configure(standins, limits, opts.database_url or f"sqlite:///{tmp.name}/bench.db")
+        from app.core.logging import setup_logging
+
+        setup_logging("WARNING")
+        results = []
+        for size in sizes:
+            for scenario in scenarios:
+                r = run_one(standins, scenario, size, opts)
+                print(f"  {scenario} @ {size}: {r.seconds:.2f}s {r.detail}", file=sys.stderr)
+                results.append(r)
+    finally:
+        standins.stop()
+        tmp.cleanup()
+
+    _print(results)
+    if opts.json:
+        opts.json.write_text(json.dumps([asdict(r) for r in results], indent=2))
+    if opts.baseline:
+        found = _regressions(results, opts.baseline, opts.tolerance)
+        for line in found:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if found:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
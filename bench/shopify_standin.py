@@ -0,0 +1,456 @@
+# bench/shopify_standin.py
+"""
+Offline stand-in for the parts of the Shopify Admin API this app calls:
+
+  REST     products.json (paged with Link: rel="next"), products/{id}.json, variants.json?sku=,
+           locations.json, inventory_levels.json, inventory_levels/set.json
+  GraphQL  inventorySetQuantities, stagedUploadsCreate + the staged upload itself,
+           bulkOperationRunMutation(productSet), BulkOperation status via node(id:),
+           result JSONL download and nodes(ids:) for variants
+
+Rate limits behave like Shopify's leaky buckets: every REST response carries
+X-Shopify-Shop-Api-Call-Limit and a full bucket answers 429 with Retry-After;
+GraphQL responses carry extensions.cost.throttleStatus and an empty bucket answers
+a THROTTLED error.
+
+    python -m bench.shopify_standin --port 8787 --seed 10000
+    SHOPIFY_API_BASE_URL=http://localhost:8787
+
+POST /_bench/reset {"seed": n} empties the shop (then seeds n products) and
+GET /_bench/calls returns per-endpoint call counts; bench/run.py drives both.
+
+Stdlib only; state lives in memory for the life of the process.
+"""
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import re
+import threading
+import time
+from collections import Counter
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+LOCATION_ID = 1
+_ID_SEGMENT = re.compile(r"/\d+")
+
+
+class LeakyBucket:
+    """Shopify-style bucket: `capacity` units, draining at `rate` units per second."""
+
+    def __init__(self, capacity: float, rate: float) -> None:
+        self.capacity = float(capacity)
+        self.rate = float(rate)
+        self.level = 0.0
+        self.ts = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _drain(self) -> None:
+        now = time.monotonic()
+        self.level = max(0.0, self.level - (now - self.ts) * self.rate)
+        self.ts = now
+
+    def take(self, cost: float) -> Tuple[bool, float]:
+        """Book `cost` if it fits; returns (accepted, level afterwards)."""
+        with self.lock:
+            self._drain()
+            if self.level + cost > self.capacity:
+                return False, self.level
+            self.level += cost
+            return True, self.level
+
+    def available(self) -> float:
+        with self.lock:
+            self._drain()
+            return self.capacity - self.level
+
+
+class StandinState:
+    def __init__(
+        self,
+        base_url: str,
+        bulk_delay: float = 0.0,
+        latency: float = 0.0,
+        rest_bucket: float = 40,
+        rest_rate: float = 2.0,
+        graphql_bucket: float = 1000,
+        graphql_rate: float = 50.0,
+    ) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.bulk_delay = bulk_delay
+        self.latency = latency
+        self.rest = LeakyBucket(rest_bucket, rest_rate)
+        self.graphql = LeakyBucket(graphql_bucket, graphql_rate)
+        self.lock = threading.Lock()
+        self.calls: Counter = Counter()   # "GET products.json" -> n, "throttled" -> n
+        self.reset()
+
+    def reset(self) -> None:
+        """Empty catalogue, levels, bulk operations, call counters and rate buckets."""
+        self.rest.level = self.graphql.level = 0.0
+        with self.lock:
+            self.ids = itertools.count(1000)
+            self.uploads: Dict[str, bytes] = {}
+            self.operations: Dict[str, Dict[str, Any]] = {}
+            self.results: Dict[str, bytes] = {}
+            self.products: Dict[int, Dict[str, Any]] = {}   # product id -> REST-shaped product
+            self.variants: Dict[int, int] = {}              # variant id -> product id
+            self.skus: Dict[str, int] = {}                  # sku -> variant id
+            self.levels: Dict[Tuple[int, int], int] = {}    # (inventory item, location) -> available
+            self.calls.clear()
+
+    def next_id(self) -> int:
+        with self.lock:
+            return next(self.ids)
+
+    def count(self, key: str) -> None:
+        with self.lock:
+            self.calls[key] += 1
+
+    def seed(self, n: int, prefix: str = "BENCH-") -> None:
+        """Create n single-variant products with SKUs {prefix}000000.. and zero stock."""
+        for i in range(n):
+            self.save_product(None, f"Bench item {i}", [{"sku": f"{prefix}{i:06d}", "price": "1.00"}])
+
+    # ---------- catalogue ----------
+
+    def save_product(self, pid: Optional[int], title: str, variants: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Create or replace a product; variants keep their ids and inventory items when given an id."""
+        pid = pid or self.next_id()
+        old = {v["id"]: v for v in (self.products.get(pid) or {}).get("variants", [])}
+        saved = []
+        for v in variants:
+            vid = int(v.get("id") or 0) or self.next_id()
+            inv = (old.get(vid) or {}).get("inventory_item_id") or self.next_id()
+            saved.append({"id": vid, "product_id": pid, "sku": v.get("sku"), "price": v.get("price"),
+                          "inventory_item_id": inv})
+        product = {"id": pid, "title": title, "variants": saved}
+        with self.lock:
+            for v in saved:
+                self.variants[v["id"]] = pid
+                if v["sku"]:
+                    self.skus[v["sku"]] = v["id"]
+                self.levels.setdefault((v["inventory_item_id"], LOCATION_ID), 0)
+            self.products[pid] = product
+        return product
+
+    def variant(self, vid: int) -> Optional[Dict[str, Any]]:
+        pid = self.variants.get(vid)
+        for v in (self.products.get(pid) or {}).get("variants", []):
+            if v["id"] == vid:
+                return v
+        return None
+
+    # ---------- productSet ----------
+
+    def product_set(self, inp: Dict[str, Any]) -> Dict[str, Any]:
+        if not inp.get("title"):
+            return {"product": None, "userErrors": [{"field": ["input", "title"], "message": "Title can't be blank", "code": "BLANK"}]}
+        product = self.save_product(
+            _num(inp.get("id")), inp["title"],
+            [{"id": _num(v.get("id")), "sku": v.get("sku"), "price": v.get("price")} for v in inp.get("variants") or []],
+        )
+        return {
+            "product": {
+                "id": f"gid://shopify/Product/{product['id']}",
+                "variants": {"nodes": [
+                    {
+                        "id": f"gid://shopify/ProductVariant/{v['id']}",
+                        "sku": v["sku"],
+                        "inventoryItem": {"id": f"gid://shopify/InventoryItem/{v['inventory_item_id']}"},
+                    }
+                    for v in product["variants"]
+                ]},
+            },
+            "userErrors": [],
+        }
+
+    def run_bulk(self, op_id: str, staged_path: str) -> None:
+        if self.bulk_delay:
+            time.sleep(self.bulk_delay)
+        op = self.operations[op_id]
+        out = []
+        for n, line in enumerate(self.uploads.get(staged_path, b"").splitlines()):
+            if not line.strip():
+                continue
+            result = self.product_set(json.loads(line)["input"])
+            out.append(json.dumps({"data": {"productSet": result}, "__lineNumber": n}))
+        self.results[op_id] = ("\n".join(out) + "\n").encode() if out else b""
+        op.update(status="COMPLETED", objectCount=str(len(out)),
+                  url=f"{self.base_url}/bulk-results/{_num(op_id)}.jsonl" if out else None)
+
+    # ---------- inventorySetQuantities ----------
+
+    def set_quantities(self, inp: Dict[str, Any]) -> Dict[str, Any]:
+        errors = []
+        for i, q in enumerate(inp.get("quantities") or []):
+            if (_num(q.get("inventoryItemId")), LOCATION_ID) not in self.levels:  # every item is stocked here
+                errors.append({"field": ["input", "quantities", str(i), "inventoryItemId"],
+                               "message": "The specified inventory item could not be found.", "code": "INVALID_INVENTORY_ITEM"})
+            elif _num(q.get("locationId")) != LOCATION_ID:
+                errors.append({"field": ["input", "quantities", str(i), "locationId"],
+                               "message": "The specified location could not be found.", "code": "INVALID_LOCATION"})
+        if errors:  # all-or-nothing, like Shopify
+            return {"inventoryAdjustmentGroup": None, "userErrors": errors}
+        with self.lock:
+            for q in inp["quantities"]:
+                self.levels[(_num(q["inventoryItemId"]), _num(q["locationId"]))] = int(q["quantity"])
+        return {"inventoryAdjustmentGroup": {"id": f"gid://shopify/InventoryAdjustmentGroup/{self.next_id()}"},
+                "userErrors": []}
+
+
+def _num(gid: Optional[str]) -> Optional[int]:
+    return int(str(gid).rsplit("/", 1)[1]) if gid else None
+
+
+def graphql(state: StandinState, query: str, variables: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+    if "inventorySetQuantities" in query:
+        return 200, {"data": {"inventorySetQuantities": state.set_quantities(variables["input"])}}
+
+    if "stagedUploadsCreate" in query:
+        key = f"tmp/bulk/{state.next_id()}/{variables['input'][0]['filename']}"
+        return 200, {"data": {"stagedUploadsCreate": {
+            "stagedTargets": [{
+                "url": f"{state.base_url}/staged-uploads",
+                "resourceUrl": f"{state.base_url}/staged-uploads/{key}",
+                "parameters": [{"name": "key", "value": key}, {"name": "Content-Type", "value": "text/jsonl"}],
+            }],
+            "userErrors": [],
+        }}}
+
+    if "bulkOperationRunMutation" in query:
+        if any(op["status"] in ("CREATED", "RUNNING") for op in state.operations.values()):
+            return 200, {"data": {"bulkOperationRunMutation": {"bulkOperation": None, "userErrors": [
+                {"field": None, "message": "A bulk mutation operation for this app and shop is already in progress."}
+            ]}}}
+        op_id = f"gid://shopify/BulkOperation/{state.next_id()}"
+        state.operations[op_id] = {"id": op_id, "status": "RUNNING", "errorCode": None,
+                                   "objectCount": "0", "url": None, "partialDataUrl": None}
+        threading.Thread(target=state.run_bulk, args=(op_id, variables["stagedUploadPath"]), daemon=True).start()
+        return 200, {"data": {"bulkOperationRunMutation": {
+            "bulkOperation": {"id": op_id, "status": "CREATED"}, "userErrors": []}}}
+
+    if "nodes(ids:" in query:
+        nodes = []
+        for gid in variables.get("ids") or []:
+            pid = state.variants.get(_num(gid))
+            nodes.append({"id": gid, "product": {"id": f"gid://shopify/Product/{pid}"}} if pid else None)
+        return 200, {"data": {"nodes": nodes}}
+
+    if "node(id:" in query:
+        return 200, {"data": {"node": state.operations.get(variables.get("id"))}}
+
+    return 200, {"errors": [{"message": "operation not supported by the stand-in"}]}
+
+
+def _cost(state: StandinState, requested: float) -> Dict[str, Any]:
+    return {"cost": {
+        "requestedQueryCost": requested,
+        "actualQueryCost": requested,
+        "throttleStatus": {
+            "maximumAvailable": state.graphql.capacity,
+            "currentlyAvailable": state.graphql.available(),
+            "restoreRate": state.graphql.rate,
+        },
+    }}
+
+
+def rest(state: StandinState, method: str, route: str, query: Dict[str, str], body: Any) -> Tuple[int, Any, Dict[str, str]]:
+    """(status, payload, extra headers) for one Admin REST call; `route` is the path after /admin/api/{version}/."""
+    if method == "GET" and route == "products.json":
+        limit = min(int(query.get("limit") or 50), 250)
+        after = int(query.get("page_info") or 0)
+        ids = sorted(pid for pid in state.products if pid > after)
+        page = [state.products[pid] for pid in ids[:limit]]
+        headers = {}
+        if len(ids) > limit:
+            nxt = urlencode({"limit": limit, "page_info": page[-1]["id"]})
+            headers["Link"] = f'<{state.base_url}/admin/api/{query["_version"]}/products.json?{nxt}>; rel="next"'
+        return 200, {"products": page}, headers
+
+    if method == "POST" and route == "products.json":
+        p = (body or {}).get("product") or {}
+        if not p.get("title"):
+            return 422, {"errors": {"title": ["can't be blank"]}}, {}
+        return 201, {"product": state.save_product(None, p["title"], p.get("variants") or [{}])}, {}
+
+    m = re.fullmatch(r"products/(\d+)\.json", route)
+    if method == "PUT" and m:
+        pid = int(m.group(1))
+        if pid not in state.products:
+            return 404, {"errors": "Not Found"}, {}
+        p = (body or {}).get("product") or {}
+        return 200, {"product": state.save_product(
+            pid, p.get("title") or state.products[pid]["title"], p.get("variants") or state.products[pid]["variants"],
+        )}, {}
+
+    if method == "GET" and route == "variants.json":
+        vid = state.skus.get(query.get("sku") or "")
+        v = state.variant(vid) if vid else None
+        return 200, {"variants": [v] if v else []}, {}
+
+    if method == "GET" and route == "locations.json":
+        return 200, {"locations": [{"id": LOCATION_ID, "name": "Bench warehouse", "active": True}]}, {}
+
+    if method == "GET" and route == "inventory_levels.json":
+        items = [int(x) for x in (query.get("inventory_item_ids") or "").split(",") if x]
+        locs = [int(x) for x in (query.get("location_ids") or str(LOCATION_ID)).split(",") if x]
+        levels = [{"inventory_item_id": i, "location_id": loc, "available": state.levels[(i, loc)]}
+                  for i in items for loc in locs if (i, loc) in state.levels]
+        return 200, {"inventory_levels": levels}, {}
+
+    if method == "POST" and route == "inventory_levels/set.json":
+        key = (int(body["inventory_item_id"]), int(body["location_id"]))
+        if key not in state.levels:
+            return 422, {"errors": ["Inventory item does not have inventory tracking enabled"]}, {}
+        state.levels[key] = int(body["available"])
+        return 200, {"inventory_level": {"inventory_item_id": key[0], "location_id": key[1],
+                                         "available": state.levels[key]}}, {}
+
+    return 404, {"errors": "Not Found"}, {}
+
+
+def make_handler(state: StandinState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+        def log_message(self, fmt: str, *args: Any) -> None:  # keep benchmark output clean
+            pass
+
+        def _body(self) -> bytes:
+            return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+        def _send(self, status: int, body: bytes, content_type: str = "application/json",
+                  headers: Optional[Dict[str, str]] = None) -> None:
+            if state.latency:
+                time.sleep(state.latency)
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _json(self, status: int, payload: Any, headers: Optional[Dict[str, str]] = None) -> None:
+            self._send(status, json.dumps(payload).encode(), headers=headers)
+
+        def _admin(self, method: str, body: bytes) -> bool:
+            url = urlsplit(self.path)
+            m = re.fullmatch(r"/admin/api/([^/]+)/(.+)", url.path)
+            if not m:
+                return False
+            version, route = m.groups()
+            if route == "graphql.json" and method == "POST":
+                req = json.loads(body or b"{}")
+                query = req.get("query", "")
+                requested = 10.0
+                ok, _ = state.graphql.take(requested)
+                if not ok:
+                    state.count("throttled")
+                    self._json(200, {"errors": [{"message": "Throttled", "extensions": {"code": "THROTTLED"}}],
+                                     "extensions": _cost(state, requested)})
+                    return True
+                state.count("POST graphql.json")
+                status, payload = graphql(state, query, req.get("variables") or {})
+                payload["extensions"] = _cost(state, requested)
+                self._json(status, payload)
+                return True
+
+            ok, level = state.rest.take(1)
+            limit_header = f"{int(round(level))}/{int(state.rest.capacity)}"
+            if not ok:
+                state.count("throttled")
+                self._json(429, {"errors": "Exceeded 2 calls per second for api client. Reduce request rates to resume uninterrupted service."},
+                           headers={"Retry-After": "1.0", "X-Shopify-Shop-Api-Call-Limit": limit_header})
+                return True
+            state.count(f"{method} {_ID_SEGMENT.sub('/{id}', route)}")
+            query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            query["_version"] = version
+            status, payload, headers = rest(state, method, route, query, json.loads(body) if body else None)
+            headers["X-Shopify-Shop-Api-Call-Limit"] = limit_header
+            self._json(status, payload, headers=headers)
+            return True
+
+        def do_POST(self) -> None:
+            body = self._body()
+            if self.path == "/_bench/reset":  # benchmark control: {"seed": n}
+                state.reset()
+                state.seed(int(json.loads(body or b"{}").get("seed") or 0))
+                return self._json(200, {"ok": True, "products": len(state.products)})
+            if self._admin("POST", body):
+                return
+            if self.path == "/staged-uploads":
+                msg = BytesParser(policy=HTTP).parsebytes(
+                    f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body
+                )
+                fields = {part.get_param("name", header="content-disposition"): part.get_payload(decode=True)
+                          for part in msg.iter_parts()}
+                state.uploads[fields["key"].decode()] = fields.get("file") or b""
+                return self._send(201, b"")
+            self._json(404, {"errors": "Not Found"})
+
+        def do_PUT(self) -> None:
+            if not self._admin("PUT", self._body()):
+                self._json(404, {"errors": "Not Found"})
+
+        def do_GET(self) -> None:
+            if self.path == "/_bench/calls":
+                return self._json(200, dict(state.calls))
+            if self._admin("GET", b""):
+                return
+            m = re.fullmatch(r"/bulk-results/(\d+)\.jsonl", self.path)
+            if m:
+                data = state.results.get(f"gid://shopify/BulkOperation/{m.group(1)}")
+                if data is not None:
+                    return self._send(200, data, content_type="application/jsonl")
+            self._json(404, {"errors": "Not Found"})
+
+    return Handler
+
+
+def serve(host: str = "127.0.0.1", port: int = 8787, bulk_delay: float = 0.0, **limits: Any) -> ThreadingHTTPServer:
+    """
+    Start the stand-in on a background thread; port=0 picks a free port.
+    `limits` go to StandinState: latency, rest_bucket, rest_rate, graphql_bucket, graphql_rate.
+    """
+    server = ThreadingHTTPServer((host, port), None)  # type: ignore[arg-type]
+    server.daemon_threads = True
+    server.state = StandinState(f"http://{host}:{server.server_address[1]}", bulk_delay=bulk_delay, **limits)  # type: ignore[attr-defined]
+    server.RequestHandlerClass = make_handler(server.state)  # type: ignore[attr-defined]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8787)
+    ap.add_argument("--bulk-delay", type=float, default=0.0, help="seconds each bulk operation stays RUNNING")
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="added to every response")
+    ap.add_argument("--seed", type=int, default=0, help="pre-create this many single-variant products")
+    ap.add_argument("--rest-bucket", type=float, default=40)
+    ap.add_argument("--rest-rate", type=float, default=2.0, help="REST calls/second drained from the bucket")
+    ap.add_argument("--graphql-bucket", type=float, default=1000)
+    ap.add_argument("--graphql-rate", type=float, default=50.0, help="GraphQL cost points/second restored")
+    args = ap.parse_args()
+    server = serve(args.host, args.port, args.bulk_delay, latency=args.latency_ms / 1000,
+                   rest_bucket=args.rest_bucket, rest_rate=args.rest_rate,
+                   graphql_bucket=args.graphql_bucket, graphql_rate=args.graphql_rate)
+    if args.seed:
+        server.state.seed(args.seed)  # type: ignore[attr-defined]
+    print(f"Shopify stand-in listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
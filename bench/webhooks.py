@@ -0,0 +1,350 @@
+# bench/webhooks.py
+"""
+Webhook load test: replay Shopify webhook deliveries, HMAC-signed like Shopify signs them,
+against POST /webhooks/shopify at stepped rates, and report for every stage the ack
+latency percentiles, error and timeout rates, and the queue depth left behind (Celery
+queues on the broker, plus the products / inventory_levels debounce buffer).
+
+    python -m bench.webhooks                                     # in-process app, synthetic mix
+    python -m bench.webhooks --rates 100,200,400,800 --duration 20 --concurrency 64
+    python -m bench.webhooks --capture deliveries.jsonl          # replay captured payloads
+    python -m bench.webhooks --url http://localhost:8000 --redis-url redis://localhost:6379/0
+
+By default the app is app.api.main:app served in-process through httpx's ASGITransport,
+with Redis (and the Celery broker) on the fakeredis stand-in and a throwaway SQLite
+database; no workers run, so enqueued tasks stay queued. The generator shares the
+process with the app, so in-process figures are a lower bound for one replica; pass
+--url to load a real replica (and --database-url to use Postgres in-process).
+
+A stage passes when it keeps up with its target rate (>= 95%), fails or times out less
+than 1% of deliveries, and answers 99% of them within --deadline (Shopify's delivery
+timeout is 5 s). The last passing stage is what one replica absorbs.
+
+--capture reads JSONL: {"topic": ..., "shop": ..., "payload": {...}} per line, or bare
+payloads delivered as --topic.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+from bench.run import _free_port, _spawn
+
+SHOP = "bench.myshopify.com"
+QUEUES = ("orders", "default", "bulk")
+
+Delivery = Tuple[str, str, Dict[str, Any]]   # (topic, shop, payload)
+
+
+@dataclass
+class Stage:
+    rate: float
+    sent: int
+    seconds: float
+    statuses: Dict[str, int]
+    latency_ms: Dict[str, float]
+    lag_ms_p99: float
+    queued: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def achieved(self) -> float:
+        return self.sent / self.seconds if self.seconds else 0.0
+
+    @property
+    def failed(self) -> int:
+        return sum(n for s, n in self.statuses.items() if not s.startswith("2"))
+
+    def passed(self, deadline: float) -> bool:
+        return (self.achieved >= 0.95 * self.rate
+                and self.failed < 0.01 * max(self.sent, 1)
+                and self.latency_ms["p99"] < deadline * 1000)
+
+
+# ---------- deliveries ----------
+
+def sign(secret: str, body: bytes) -> str:
+    """X-Shopify-Hmac-Sha256: base64 HMAC-SHA256 of the raw body."""
+    return base64.b64encode(hmac.new(secret.encode(), body, hashlib.sha256).digest()).decode()
+
+
+def synthetic(mix: Dict[str, float], shop: str, seed: int = 0) -> Iterator[Delivery]:
+    """Endless stream of plausible payloads for the topics the handler acts on."""
+    rng = random.Random(seed)
+    topics, weights = zip(*mix.items())
+    order_ids = itertools.count(6_000_000_000)
+    while True:
+        topic = rng.choices(topics, weights)[0]
+        item = rng.randrange(100_000)
+        if topic == "orders/create":
+            payload: Dict[str, Any] = {
+                "id": next(order_ids),
+                "name": f"#B{rng.randrange(10 ** 6)}",
+                "currency": "EUR",
+                "line_items": [
+                    {"id": rng.randrange(10 ** 12), "sku": f"BENCH-{rng.randrange(100_000):06d}",
+                     "variant_id": 40_000_000 + rng.randrange(100_000), "product_id": 8_000_000 + rng.randrange(100_000),
+                     "quantity": 1 + rng.randrange(3), "price": "9.99", "title": "Bench item"}
+                    for _ in range(1 + rng.randrange(4))
+                ],
+            }
+        elif topic == "products/update":
+            payload = {
+                "id": 8_000_000 + item,
+                "title": f"Bench item {item}",
+                "variants": [{"id": 40_000_000 + item, "sku": f"BENCH-{item:06d}",
+                              "inventory_item_id": 50_000_000 + item, "price": "9.99"}],
+            }
+        else:
+            payload = {"inventory_item_id": 50_000_000 + item, "location_id": 1,
+                       "available": rng.randrange(100), "updated_at": "2024-01-01T00:00:00Z"}
+        yield topic, shop, payload
+
+
+def captured(path: Path, default_topic: str, shop: str) -> Iterator[Delivery]:
+    """Cycle through a JSONL capture forever."""
+    rows: List[Delivery] = []
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            if isinstance(row, dict) and "payload" in row:
+                rows.append((row.get("topic") or default_topic, row.get("shop") or shop, row["payload"]))
+            else:
+                rows.append((default_topic, shop, row))
+    if not rows:
+        raise SystemExit(f"{path}: no deliveries")
+    return itertools.cycle(rows)
+
+
+# ---------- load ----------
+
+def _pct(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def _deliver(
+    client: httpx.AsyncClient,
+    delivery: Delivery,
+    webhook_id: str,
+    secret: str,
+    deadline: float,
+    out: List[Tuple[str, float]],
+) -> None:
+    topic, shop, payload = delivery
+    body = json.dumps(payload, separators=(",", ":")).encode()
+    headers = {
+        "Content-Type": "application/json",
+        "X-Shopify-Topic": topic,
+        "X-Shopify-Shop-Domain": shop,
+        "X-Shopify-Hmac-Sha256": sign(secret, body),
+        "X-Shopify-Webhook-Id": webhook_id,
+        "X-Shopify-API-Version": "2024-10",
+    }
+    started = time.perf_counter()
+    try:
+        resp = await asyncio.wait_for(client.post("/webhooks/shopify", content=body, headers=headers), deadline)
+        status = str(resp.status_code)
+    except asyncio.TimeoutError:
+        status = "timeout"
+    except httpx.HTTPError as e:
+        status = type(e).__name__
+    out.append((status, (time.perf_counter() - started) * 1000))
+
+
+async def run_stage(
+    client: httpx.AsyncClient,
+    deliveries: Iterator[Delivery],
+    rate: float,
+    duration: float,
+    concurrency: int,
+    deadline: float,
+    secret: str,
+    duplicate_ratio: float,
+) -> Stage:
+    """Open-loop arrivals at `rate`/s, at most `concurrency` in flight (the generator waits beyond that)."""
+    loop = asyncio.get_running_loop()
+    sem = asyncio.Semaphore(concurrency)
+    results: List[Tuple[str, float]] = []
+    lags: List[float] = []
+    recent: List[str] = []
+    rng = random.Random(int(rate))
+
+    async def one(delivery: Delivery, webhook_id: str) -> None:
+        try:
+            await _deliver(client, delivery, webhook_id, secret, deadline, results)
+        finally:
+            sem.release()
+
+    tasks = []
+    total = max(1, int(rate * duration))
+    start = loop.time()
+    for i in range(total):
+        due = start + i / rate
+        if due > loop.time():
+            await asyncio.sleep(due - loop.time())
+        await sem.acquire()
+        lags.append((loop.time() - due) * 1000)
+        # Shopify redelivers with the same id after a timeout; the handler must ack those as duplicates
+        if recent and rng.random() < duplicate_ratio:
+            webhook_id = rng.choice(recent)
+        else:
+            webhook_id = str(uuid.uuid4())
+            recent = (recent + [webhook_id])[-1000:]
+        tasks.append(asyncio.create_task(one(next(deliveries), webhook_id)))
+    await asyncio.gather(*tasks)
+    seconds = loop.time() - start
+
+    latencies = [ms for _, ms in results]
+    return Stage(
+        rate=rate,
+        sent=total,
+        seconds=round(seconds, 3),
+        statuses=dict(Counter(s for s, _ in results)),
+        latency_ms={q: round(_pct(latencies, v), 2) for q, v in
+                    (("p50", 0.50), ("p90", 0.90), ("p99", 0.99), ("max", 1.0))},
+        lag_ms_p99=round(_pct(lags, 0.99), 2),
+    )
+
+
+def queue_depth(broker, app_redis) -> Dict[str, int]:
+    """Messages waiting per Celery queue (all priority sub-queues) and debounce-buffer entries."""
+    out: Dict[str, int] = {}
+    if broker is not None:
+        pipe = broker.pipeline(transaction=False)
+        for q in QUEUES:
+            for name in [q] + [f"{q}:{p}" for p in range(1, 10)]:
+                pipe.llen(name)
+        lengths = pipe.execute()
+        for i, q in enumerate(QUEUES):
+            out[q] = sum(lengths[i * 10:(i + 1) * 10])
+    if app_redis is not None:
+        out["buffer"] = int(app_redis.zcard("whbuf:due"))
+    return out
+
+
+# ---------- main ----------
+
+def _print(stages: List[Stage], deadline: float) -> None:
+    header = (f"{'target/s':>9} {'sent':>7} {'got/s':>8} {'2xx':>7} {'fail':>6} {'p50 ms':>8} {'p90 ms':>8} "
+              f"{'p99 ms':>8} {'max ms':>8} {'lag p99':>8}  queued")
+    print(header)
+    print("-" * (len(header) + 20))
+    for s in stages:
+        ok = sum(n for k, n in s.statuses.items() if k.startswith("2"))
+        queued = " ".join(f"{k}={v}" for k, v in s.queued.items()) or "-"
+        print(f"{s.rate:>9.0f} {s.sent:>7} {s.achieved:>8.1f} {ok:>7} {s.failed:>6} {s.latency_ms['p50']:>8.1f} "
+              f"{s.latency_ms['p90']:>8.1f} {s.latency_ms['p99']:>8.1f} {s.latency_ms['max']:>8.1f} "
+              f"{s.lag_ms_p99:>8.1f}  {queued}{'' if s.passed(deadline) else '  FAIL'}")
+        other = {k: v for k, v in s.statuses.items() if not k.startswith("2")}
+        if other:
+            print(f"{'':>9} errors: {other}")
+    passing = [s for s in stages if s.passed(deadline)]
+    if passing:
+        print(f"\nSustained: {passing[-1].rate:.0f} webhooks/s "
+              f"(p99 {passing[-1].latency_ms['p99']:.0f} ms, deadline {deadline * 1000:.0f} ms)")
+    else:
+        print("\nNo stage passed; start lower (--rates).")
+
+
+async def _run(opts: argparse.Namespace, deliveries: Iterator[Delivery], broker, app_redis) -> List[Stage]:
+    if opts.url:
+        client = httpx.AsyncClient(base_url=opts.url, limits=httpx.Limits(max_connections=opts.concurrency))
+    else:
+        from app.api.main import app
+
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+    stages = []
+    async with client:
+        for rate in opts.rates:
+            stage = await run_stage(client, deliveries, rate, opts.duration, opts.concurrency,
+                                    opts.deadline, opts.secret, opts.duplicate_ratio)
+            stage.queued = queue_depth(broker, app_redis)
+            print(f"  {rate:.0f}/s: {stage.achieved:.1f}/s p99 {stage.latency_ms['p99']:.1f} ms "
+                  f"{stage.statuses}", file=sys.stderr)
+            stages.append(stage)
+            if opts.stop_on_fail and not stage.passed(opts.deadline):
+                break
+    return stages
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rates", default="50,100,200,400,800", help="stage target rates (webhooks/s), comma separated")
+    ap.add_argument("--duration", type=float, default=10.0, help="seconds per stage")
+    ap.add_argument("--concurrency", type=int, default=50, help="max deliveries in flight")
+    ap.add_argument("--deadline", type=float, default=5.0, help="seconds before a delivery counts as timed out")
+    ap.add_argument("--mix", default="orders/create=1,products/update=2,inventory_levels/update=7",
+                    help="synthetic topic weights")
+    ap.add_argument("--capture", type=Path, help="JSONL of captured deliveries to replay instead")
+    ap.add_argument("--topic", default="orders/create", help="topic for bare payloads in --capture")
+    ap.add_argument("--shop", default=SHOP)
+    ap.add_argument("--duplicate-ratio", type=float, default=0.0, help="share of deliveries re-using an earlier webhook id")
+    ap.add_argument("--secret", default=os.environ.get("SHOPIFY_WEBHOOK_SECRET") or "bench-webhook-secret")
+    ap.add_argument("--url", help="load a running API replica instead of the in-process app")
+    ap.add_argument("--redis-url", help="Redis (and broker) to use in-process, or to read queue depth with --url")
+    ap.add_argument("--database-url", help="database for the in-process app (default: temp SQLite)")
+    ap.add_argument("--stop-on-fail", action="store_true", help="stop after the first failing stage")
+    ap.add_argument("--json", type=Path, help="write the stage results here")
+    opts = ap.parse_args()
+    opts.rates = [float(r) for r in opts.rates.split(",") if r.strip()]
+    mix = {k.strip(): float(v) for k, v in (part.split("=") for part in opts.mix.split(",") if part.strip())}
+    deliveries = captured(opts.capture, opts.topic, opts.shop) if opts.capture else synthetic(mix, opts.shop)
+
+    import redis
+
+    procs = []
+    tmp = tempfile.TemporaryDirectory(prefix="bench-webhooks-")
+    try:
+        redis_url = opts.redis_url
+        if not opts.url:
+            if not redis_url:
+                port = _free_port()
+                procs.append(_spawn("bench.redis_standin", port))
+                redis_url = f"redis://127.0.0.1:{port}/0"
+            # Must happen before app/ is imported: settings are read once
+            os.environ.update({
+                "DATABASE_URL": opts.database_url or f"sqlite:///{tmp.name}/webhooks.db",
+                "REDIS_URL": redis_url,
+                "CELERY_BROKER_URL": redis_url,
+                "CELERY_RESULT_BACKEND": "",
+                "SHOPIFY_WEBHOOK_SECRET": opts.secret,
+                "SHOPIFY_SHOP": opts.shop,
+                "LOG_LEVEL": "WARNING",
+            })
+        client = redis.Redis.from_url(redis_url, decode_responses=True) if redis_url else None
+        stages = asyncio.run(_run(opts, deliveries, client, client))
+    finally:
+        for p in procs:
+            p.terminate()
+            p.wait(timeout=10)
+        tmp.cleanup()
+
+    _print(stages, opts.deadline)
+    if opts.json:
+        opts.json.write_text(json.dumps([{**asdict(s), "achieved": round(s.achieved, 2), "passed": s.passed(opts.deadline)}
+                                         for s in stages], indent=2))
+
+
+if __name__ == "__main__":
+    main()